@@ -0,0 +1,210 @@
+"""
+Album Art for ChakraBeats
+Extracts cover art, downscales it in worker processes and caches the thumbnails on disk and in memory
+"""
+
+import os
+import io
+import base64
+from collections import OrderedDict
+from PyQt6.QtCore import pyqtSignal
+from PyQt6.QtGui import QImage
+
+import config
+import audio_formats
+from scheduler import ScheduledWorker, PRIORITY_VISIBLE
+
+# APIC / METADATA_BLOCK_PICTURE picture type of the front cover
+FRONT_COVER = 3
+
+# Cost charged for a track known to have no art, so misses are bounded too
+MISSING_COST = 1024
+
+def pick_cover(pictures):
+    """Image bytes of the front cover among (type, data) pairs, else the first picture"""
+    for picture_type, data in pictures:
+        if picture_type == FRONT_COVER:
+            return data
+    return pictures[0][1] if pictures else None
+
+def extract_embedded_art(file_path):
+    """Raw bytes of a track's embedded cover art, or None"""
+    audio_format = audio_formats.detect(file_path)
+    if audio_format is None:
+        return None
+    audio = audio_format.tag_reader()(file_path)
+    tags = audio.tags
+    pictures = []
+    
+    if audio_format.tag_style in ("id3", "riff"):
+        if tags is not None:
+            pictures = [(frame.type, frame.data) for frame in tags.getall("APIC")]
+    elif audio_format.tag_style == "vorbis":
+        from mutagen.flac import Picture
+        pictures = [(picture.type, picture.data) for picture in getattr(audio, "pictures", [])]
+        for encoded in (tags.get("metadata_block_picture", []) if tags is not None else []):
+            try:
+                picture = Picture(base64.b64decode(encoded))
+            except Exception:
+                continue
+            pictures.append((picture.type, picture.data))
+    elif audio_format.tag_style == "mp4":
+        if tags is not None:
+            pictures = [(FRONT_COVER, bytes(cover)) for cover in tags.get("covr", [])]
+    return pick_cover(pictures)
+
+def find_folder_art(directory, listings=None):
+    """Path of a cover image next to the tracks (cover.jpg, folder.png, ...), or None"""
+    names = listings.get(directory) if listings is not None else None
+    if names is None:
+        try:
+            names = {name.lower(): name for name in os.listdir(directory)}
+        except OSError:
+            names = {}
+        if listings is not None:
+            listings[directory] = names
+    
+    for stem in config.ALBUM_ART_FILES:
+        for extension in (".jpg", ".jpeg", ".png"):
+            name = names.get(stem + extension)
+            if name is not None:
+                return os.path.join(directory, name)
+    return None
+
+def write_thumbnail(source, cache_path, size):
+    """Decode an image (path or file object), shrink it to fit size x size and save it as JPEG"""
+    from PIL import Image
+    
+    with Image.open(source) as image:
+        # JPEG decoders can scale by up to 1/8 while decoding, far cheaper than resizing afterwards
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        image.save(tmp_path, "JPEG", quality=88)
+    os.replace(tmp_path, cache_path)
+
+def make_track_thumbnail(file_path, size=config.ALBUM_ART_SIZE):
+    """Worker: thumbnail a track's embedded art; returns the thumbnail path, or "" without embedded art"""
+    cache_path = config.get_track_cache_path("art", file_path, ".jpg")
+    data = extract_embedded_art(file_path)
+    if data is None:
+        # An empty file records that the track has no art of its own
+        open(cache_path, "wb").close()
+        return ""
+    write_thumbnail(io.BytesIO(data), cache_path, size)
+    return cache_path
+
+def make_folder_thumbnail(image_path, size=config.ALBUM_ART_SIZE):
+    """Worker: thumbnail a folder image once for every track that shares it"""
+    cache_path = config.get_track_cache_path("art", image_path, ".jpg")
+    write_thumbnail(image_path, cache_path, size)
+    return cache_path
+
+class AlbumArtCache:
+    """In-memory LRU of thumbnail pixmaps, bounded by their size in bytes (GUI thread only)"""
+    
+    def __init__(self, budget=config.ALBUM_ART_MEMORY_BYTES):
+        self.budget = budget
+        self.used = 0
+        self.pixmaps = OrderedDict()  # Track path -> QPixmap (null when the track has no art)
+    
+    @staticmethod
+    def cost(pixmap):
+        if pixmap.isNull():
+            return MISSING_COST
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+    
+    def __contains__(self, file_path):
+        return file_path in self.pixmaps
+    
+    def get(self, file_path):
+        """Return the cached pixmap (null if the track has no art) or None if it is not loaded"""
+        pixmap = self.pixmaps.get(file_path)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(file_path)
+        return pixmap
+    
+    def put(self, file_path, pixmap):
+        """Cache a pixmap, evicting the least recently used ones over the budget"""
+        if file_path in self.pixmaps:
+            self.used -= self.cost(self.pixmaps.pop(file_path))
+        self.pixmaps[file_path] = pixmap
+        self.used += self.cost(pixmap)
+        while self.used > self.budget and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.used -= self.cost(evicted)
+    
+    def discard(self, file_path):
+        """Forget a track's pixmap, e.g. after its file changed"""
+        pixmap = self.pixmaps.pop(file_path, None)
+        if pixmap is not None:
+            self.used -= self.cost(pixmap)
+    
+    def clear(self):
+        self.pixmaps.clear()
+        self.used = 0
+
+class AlbumArtThread(ScheduledWorker):
+    """Loads thumbnails from disk, or has the scheduler's processes make them, newest requests first"""
+    
+    art_ready = pyqtSignal(str, QImage)  # Null image when the track has no art
+    newest_first = True
+    
+    def __init__(self, scheduler, parent=None):
+        super().__init__(scheduler, parent)
+        self.listings = {}  # Directory -> lowercased file names, for folder art
+        self.folder_jobs = set()  # Futures of folder image thumbnails
+    
+    def request(self, file_path, priority=PRIORITY_VISIBLE):
+        """Queue a track, or move it to the front if it is already queued"""
+        self.enqueue([file_path], priority)
+    
+    def cached_thumbnail(self, file_path):
+        """Thumbnail path from the disk cache, "" for no art, or None if a worker must make it"""
+        track_thumbnail = config.get_track_cache_path("art", file_path, ".jpg")
+        if not os.path.exists(track_thumbnail):
+            return None
+        if os.path.getsize(track_thumbnail):
+            return track_thumbnail
+        
+        image_path = find_folder_art(os.path.dirname(file_path), self.listings)
+        if image_path is None:
+            return ""
+        folder_thumbnail = config.get_track_cache_path("art", image_path, ".jpg")
+        return folder_thumbnail if os.path.exists(folder_thumbnail) else None
+    
+    def start_job(self, file_path, priority):
+        # Answer from the disk cache straight away
+        try:
+            thumbnail = self.cached_thumbnail(file_path)
+        except OSError:
+            thumbnail = ""  # The track is gone
+        if thumbnail is not None:
+            self.emit_thumbnail(file_path, thumbnail)
+            return None
+        return self.scheduler.submit(make_track_thumbnail, file_path, priority=priority)
+    
+    def job_done(self, file_path, future, priority):
+        folder_stage = future in self.folder_jobs
+        self.folder_jobs.discard(future)
+        try:
+            thumbnail = future.result()
+        except Exception as e:
+            print(f"Error loading album art for {file_path}: {e}")
+            thumbnail = ""
+        
+        # No embedded art: fall back to the folder image, thumbnailed once per folder
+        if not folder_stage and not thumbnail:
+            image_path = find_folder_art(os.path.dirname(file_path), self.listings)
+            if image_path is not None:
+                follow_up = self.scheduler.submit(make_folder_thumbnail, image_path, priority=priority)
+                self.folder_jobs.add(follow_up)
+                return follow_up
+        self.emit_thumbnail(file_path, thumbnail)
+        return None
+    
+    def emit_thumbnail(self, file_path, thumbnail):
+        """Decode a small thumbnail here, off the GUI thread, and hand it over"""
+        image = QImage(thumbnail) if thumbnail else QImage()
+        self.art_ready.emit(file_path, image)
\ No newline at end of file
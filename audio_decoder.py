@@ -0,0 +1,459 @@
+"""
+Audio Decoder for ChakraBeats
+Decodes audio files into NumPy PCM blocks for analysis jobs
+"""
+
+import os
+import io
+import mmap
+from collections import deque
+import numpy as np
+import pygame
+
+import audio_formats
+from mp3_index import Mp3Info, SeekIndexCache, scan_frames
+from resampler import Resampler
+
+# Frames handed out per block by PcmStream.blocks()
+DEFAULT_BLOCK_FRAMES = 65536
+
+# MP3 frames decoded per chunk, plus earlier frames decoded only to refill the bit reservoir
+MP3_CHUNK_FRAMES = 96
+MP3_PRIMING_FRAMES = 8
+
+# Mixer format used when ChakraBeats has to initialise pygame itself
+MIXER_FREQUENCY = 44100
+MIXER_CHANNELS = 2
+MIXER_BUFFER = 512
+
+# Set in processes whose mixer only decodes, so it can be re-opened at each file's own rate
+_private_mixer = False
+
+def ensure_mixer():
+    """Make sure pygame.mixer is initialised so it can decode files"""
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=MIXER_FREQUENCY, size=-16, channels=MIXER_CHANNELS, buffer=MIXER_BUFFER)
+
+def restart_mixer(frequency, buffer=MIXER_BUFFER):
+    """Re-open the mixer with another device format; every existing Sound becomes invalid"""
+    pygame.mixer.quit()
+    pygame.mixer.init(frequency=frequency, size=-16, channels=MIXER_CHANNELS, buffer=buffer)
+
+def init_worker_process():
+    """Initialise pygame for decoding inside a worker process (no audio output)"""
+    global _private_mixer
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    ensure_mixer()
+    _private_mixer = True
+
+def use_native_rate(sample_rate):
+    """Have SDL decode at a file's own rate, re-opening a decode-only mixer; False if the mixer is the output's"""
+    ensure_mixer()
+    if pygame.mixer.get_init()[0] != sample_rate:
+        if not _private_mixer:
+            return False
+        restart_mixer(sample_rate)
+    return True
+
+class PcmStream:
+    """Sequential reader returning float32 frames shaped (frames, channels)"""
+    
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.sample_rate = 0
+        self.channels = 0
+        self.frames = 0  # Total frame count
+        self.position = 0  # Next frame to be read
+        self.waiting = False  # The last read came back empty because audio was not ready yet, not at the end
+    
+    def read(self, frame_count):
+        """Read up to frame_count frames; an empty array means end of stream"""
+        raise NotImplementedError
+    
+    def seek(self, frame):
+        """Move the read position to the given frame"""
+        raise NotImplementedError
+    
+    def close(self):
+        """Release any resources held by the stream"""
+        pass
+    
+    def blocks(self, block_frames=DEFAULT_BLOCK_FRAMES):
+        """Iterate over the remaining audio in blocks of block_frames"""
+        while True:
+            block = self.read(block_frames)
+            if len(block) == 0:
+                return
+            yield block
+    
+    @property
+    def duration_ms(self):
+        """Stream duration in milliseconds"""
+        if self.sample_rate <= 0:
+            return 0
+        return int(self.frames * 1000 / self.sample_rate)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# WAVE format tags handled without SDL_mixer: integer PCM, IEEE float, and extensible wrapping either
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+class WavFile:
+    """RIFF/WAVE file whose data chunk is memory-mapped and viewed as a (frames, channels) array"""
+    
+    def __init__(self, file_path):
+        self.file = open(file_path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError("Empty WAV file")
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            # Playback and analysis both walk forward; let the kernel read ahead
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            self.parse()
+        except Exception:
+            self.close()
+            raise
+    
+    def parse(self):
+        data = self.map
+        if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+            raise ValueError("Not a RIFF/WAVE file")
+        
+        fmt = None
+        data_offset = data_size = None
+        position = 12
+        while position + 8 <= len(data) and data_offset is None:
+            chunk_id = data[position:position + 4]
+            size = int.from_bytes(data[position + 4:position + 8], "little")
+            body = position + 8
+            if chunk_id == b"fmt ":
+                fmt = data[body:body + size]
+            elif chunk_id == b"data":
+                # Writers that stream to disk may leave the size unset; the rest of the file is audio
+                data_offset = body
+                data_size = min(size, len(data) - body) if size not in (0, 0xFFFFFFFF) else len(data) - body
+            position = body + size + (size & 1)
+        
+        if fmt is None or len(fmt) < 16 or data_offset is None:
+            raise ValueError("WAV file without fmt or data chunk")
+        tag = int.from_bytes(fmt[0:2], "little")
+        self.channels = int.from_bytes(fmt[2:4], "little")
+        self.sample_rate = int.from_bytes(fmt[4:8], "little")
+        block_align = int.from_bytes(fmt[12:14], "little")
+        self.bits = int.from_bytes(fmt[14:16], "little")
+        if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            tag = int.from_bytes(fmt[24:26], "little")  # First two bytes of the sub-format GUID
+        
+        width = self.bits // 8
+        if self.channels <= 0 or block_align != width * self.channels:
+            raise ValueError(f"Unsupported WAV layout: {self.channels} channels, {self.bits} bits")
+        if tag == WAVE_FORMAT_PCM and width in (1, 2, 3, 4):
+            dtype = {1: np.uint8, 2: "<i2", 3: np.uint8, 4: "<i4"}[width]
+        elif tag == WAVE_FORMAT_IEEE_FLOAT and width in (4, 8):
+            dtype = "<f4" if width == 4 else "<f8"
+        else:
+            raise ValueError(f"Unsupported WAV encoding: format {tag}, {self.bits} bits")
+        
+        frames = data_size // block_align
+        shape = (frames, self.channels, 3) if width == 3 else (frames, self.channels)
+        self.float_format = tag == WAVE_FORMAT_IEEE_FLOAT
+        self.samples = np.ndarray(shape, dtype=dtype, buffer=self.map, offset=data_offset)
+    
+    def to_float(self, start, end):
+        """Frames start:end as float32 in [-1, 1]; 32-bit float files are returned as a view"""
+        raw = self.samples[start:end]
+        if self.float_format:
+            return raw if raw.dtype == np.float32 else raw.astype(np.float32)
+        if self.bits == 8:
+            # 8-bit WAV is unsigned
+            return (raw.astype(np.float32) - 128.0) / 128.0
+        if self.bits == 24:
+            # Widen 24-bit samples to 32-bit by placing them in the upper bytes
+            widened = np.zeros(raw.shape[:2] + (4,), dtype=np.uint8)
+            widened[..., 1:] = raw
+            return np.multiply(widened.view("<i4")[..., 0], 1.0 / 2147483648.0, dtype=np.float32)
+        return np.multiply(raw, 1.0 / (1 << (self.bits - 1)), dtype=np.float32)
+    
+    def close(self):
+        self.samples = None
+        try:
+            self.map.close()
+        except (AttributeError, BufferError):
+            # A block viewing the mapping is still alive; it is unmapped with it
+            pass
+        self.file.close()
+
+class WavPcmStream(PcmStream):
+    """WAV reader over a memory-mapped data chunk: opening is instant and only touched pages are read"""
+    
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.wav = WavFile(file_path)
+        self.sample_rate = self.wav.sample_rate
+        self.channels = self.wav.channels
+        self.frames = len(self.wav.samples)
+    
+    @property
+    def samples(self):
+        """The data chunk as stored, without conversion"""
+        return self.wav.samples
+    
+    def read(self, frame_count):
+        start = self.position
+        self.position = min(start + frame_count, self.frames)
+        return self.wav.to_float(start, self.position)
+    
+    def seek(self, frame):
+        self.position = max(0, min(frame, self.frames))
+    
+    def close(self):
+        self.wav.close()
+
+class MixerPcmStream(PcmStream):
+    """Reader for compressed formats decoded in full by pygame.mixer, at native_rate where the mixer allows"""
+    
+    def __init__(self, file_path, native_rate=None, samples=None):
+        super().__init__(file_path)
+        if samples is None:
+            if native_rate is None or not use_native_rate(native_rate):
+                ensure_mixer()
+            native_rate = pygame.mixer.get_init()[0]
+            samples = pygame.sndarray.array(pygame.mixer.Sound(file_path))
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+        
+        self.samples = samples
+        self.sample_rate = native_rate
+        self.channels = samples.shape[1]
+        self.frames = len(samples)
+        self.scale = 1.0 / float(np.iinfo(samples.dtype).max + 1)
+    
+    def read(self, frame_count):
+        start = self.position
+        end = min(start + frame_count, self.frames)
+        self.position = end
+        return self.samples[start:end].astype(np.float32) * self.scale
+    
+    def seek(self, frame):
+        self.position = max(0, min(frame, self.frames))
+    
+    def close(self):
+        self.samples = None
+
+class Mp3PcmStream(PcmStream):
+    """Chunked MP3 reader that seeks through a frame index instead of decoding everything"""
+    
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.file = open(file_path, "rb")
+        try:
+            self.info = Mp3Info.probe(self.file)
+            if not use_native_rate(self.info.header.sample_rate):
+                # SDL would resample every chunk on its own, clicking at the boundaries
+                raise ValueError("MP3 sample rate differs from the output mixer")
+        except ValueError:
+            self.file.close()
+            raise
+        self.index = SeekIndexCache.get(file_path)
+        self.sample_rate = self.info.header.sample_rate
+        self.channels = pygame.mixer.get_init()[2]
+        self.frame_samples = self.info.header.samples
+        
+        self.mp3_frames = self.index.frame_count if self.index else self.info.estimated_frames(os.path.getsize(file_path))
+        self.frames = self.mp3_frames * self.frame_samples
+        self.scale = 1.0 / 32768.0
+        self.restart(self.info.audio_start, 0)
+    
+    def restart(self, offset, skip):
+        """Continue decoding from the frame at offset, dropping skip output frames"""
+        self.frame_iter = scan_frames(self.file, offset, self.info.header)
+        self.priming = deque(maxlen=MP3_PRIMING_FRAMES)  # Offsets of recently passed frames
+        self.pending = np.zeros((0, self.channels), dtype=np.float32)
+        self.skip = skip
+        self.exhausted = False
+    
+    def decode_chunk(self):
+        """Decode the next chunk of frames into pending output"""
+        offsets = []
+        end = 0
+        for offset, header in self.frame_iter:
+            offsets.append(offset)
+            end = offset + header.length
+            if len(offsets) >= MP3_CHUNK_FRAMES:
+                break
+        if not offsets:
+            self.exhausted = True
+            return
+        
+        start = self.priming[0] if self.priming else offsets[0]
+        self.file.seek(start)
+        use_native_rate(self.sample_rate)  # Another stream in this process may have re-opened the mixer
+        sound = pygame.mixer.Sound(file=io.BytesIO(self.file.read(end - start)))
+        samples = pygame.sndarray.array(sound)
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+        
+        # The decoder emits every frame, so the wanted audio is the tail after the priming frames
+        wanted = len(offsets) * self.frame_samples
+        decoded = samples[-wanted:].astype(np.float32) * self.scale
+        if self.skip:
+            dropped = min(self.skip, len(decoded))
+            decoded = decoded[dropped:]
+            self.skip -= dropped
+        
+        self.priming.extend(offsets[-MP3_PRIMING_FRAMES:])
+        self.pending = np.concatenate((self.pending, decoded)) if len(self.pending) else decoded
+    
+    def read(self, frame_count):
+        while len(self.pending) < frame_count and not self.exhausted:
+            self.decode_chunk()
+        block = self.pending[:frame_count]
+        self.pending = self.pending[frame_count:]
+        self.position += len(block)
+        return block
+    
+    def seek(self, frame):
+        if self.index is None:
+            # Picks up a table built in the background since the stream was opened
+            self.index = SeekIndexCache.get(self.file_path)
+            if self.index is not None:
+                self.mp3_frames = self.index.frame_count
+                self.frames = self.mp3_frames * self.frame_samples
+        
+        frame = max(0, min(frame, self.frames))
+        target = frame // self.frame_samples
+        first = max(0, target - MP3_PRIMING_FRAMES)
+        
+        if self.index is not None:
+            # Exact: bisect the table, then walk the few headers up to the frame
+            entry_frame, offset = self.index.locate(first)
+            walked = entry_frame
+        else:
+            # Approximate: Xing TOC, or constant bitrate, then resync to a header
+            offset = None
+            if self.info.xing:
+                offset = self.info.xing.offset_for(first / max(1, self.mp3_frames))
+            if offset is None:
+                offset = self.info.audio_start + int(first * self.info.frame_size)
+            walked = first
+        
+        self.restart(offset, frame - target * self.frame_samples)
+        while walked < target:
+            next_offset, _ = next(self.frame_iter, (None, None))
+            if next_offset is None:
+                break
+            if walked >= first:
+                self.priming.append(next_offset)
+            walked += 1
+        self.position = frame
+    
+    def close(self):
+        self.file.close()
+
+class ResampledStream(PcmStream):
+    """Presents a natively decoded stream at another sample rate"""
+    
+    def __init__(self, source, sample_rate):
+        super().__init__(source.file_path)
+        self.source = source
+        self.sample_rate = sample_rate
+        self.channels = source.channels
+        self.resampler = Resampler(source.sample_rate, sample_rate, source.channels)
+        self.frames = source.frames * self.resampler.up // self.resampler.down
+        self.pending = np.zeros((0, self.channels), dtype=np.float32)
+        self.source_ended = False
+    
+    def read(self, frame_count):
+        while len(self.pending) < frame_count and not self.source_ended:
+            block = self.source.read(DEFAULT_BLOCK_FRAMES // 4)
+            self.source_ended = len(block) == 0
+            self.pending = np.concatenate((self.pending, self.resampler.process(block, final=self.source_ended)))
+        
+        count = min(frame_count, self.frames - self.position, len(self.pending))
+        block = self.pending[:max(count, 0)]
+        self.pending = self.pending[len(block):]
+        self.position += len(block)
+        return block
+    
+    def seek(self, frame):
+        frame = max(0, min(frame, self.frames))
+        # Exact in-phase restart: the source frame plus the fraction left over
+        source_time = frame * self.resampler.down
+        start = source_time // self.resampler.up
+        history = min(start, self.resampler.history_frames)
+        self.source.seek(start - history)
+        self.resampler.reset(source_time % self.resampler.up, self.source.read(history) if history else None)
+        self.pending = np.zeros((0, self.channels), dtype=np.float32)
+        self.source_ended = False
+        self.position = frame
+    
+    def close(self):
+        self.source.close()
+
+def native_sample_rate(file_path):
+    """Sample rate a file is stored at, read from its header (None if unknown)"""
+    audio_format = audio_formats.detect(file_path)
+    try:
+        if audio_format and audio_format.decoder == "wav":
+            wav = WavFile(file_path)
+            wav.close()
+            return wav.sample_rate
+        if audio_format and audio_format.decoder == "mp3":
+            with open(file_path, "rb") as file:
+                return Mp3Info.probe(file).header.sample_rate
+        if audio_format:
+            import mutagen
+            audio = mutagen.File(file_path)
+            return getattr(audio.info, "sample_rate", None) if audio is not None else None
+    except Exception:
+        pass
+    return None
+
+def decode_native(file_path):
+    """Worker: a whole file decoded by SDL_mixer at its own rate, as (samples, sample rate)"""
+    stream = MixerPcmStream(file_path, native_sample_rate(file_path))
+    return stream.samples, stream.sample_rate
+
+def open_pcm_stream(file_path, sample_rate=None, decode_elsewhere=None):
+    """Open a PCM stream for an audio file, optionally at a required sample rate"""
+    # Files are decoded at their own rate and resampled here rather than by SDL. Where this process's mixer is
+    # the output device, decode_elsewhere(file_path) -> (samples, rate) decodes them in a worker process instead
+    audio_format = audio_formats.detect(file_path)
+    if audio_format is not None and not audio_format.playable:
+        raise ValueError(f"No decoder for {audio_format.label} files")
+    decoder = audio_format.decoder if audio_format else "mixer"
+    
+    stream = None
+    if decoder == "mp3":
+        try:
+            stream = Mp3PcmStream(file_path)
+        except ValueError:
+            # Not recognisably MPEG audio, or at a rate the output mixer cannot decode at
+            pass
+    elif decoder == "wav":
+        try:
+            stream = WavPcmStream(file_path)
+        except ValueError:
+            # Compressed WAVs (ADPCM, u-law, ...) are left to SDL_mixer
+            pass
+    if stream is None:
+        native_rate = native_sample_rate(file_path)
+        if (decode_elsewhere is not None and not _private_mixer and native_rate and
+                native_rate != pygame.mixer.get_init()[0]):
+            samples, native_rate = decode_elsewhere(file_path)
+            stream = MixerPcmStream(file_path, native_rate, samples)
+        else:
+            stream = MixerPcmStream(file_path, native_rate)
+    
+    if sample_rate is not None and stream.sample_rate != sample_rate:
+        stream = ResampledStream(stream, sample_rate)
+    return stream
\ No newline at end of file
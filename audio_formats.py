@@ -0,0 +1,118 @@
+"""
+Audio Formats for ChakraBeats
+Format registry: header sniffing, decoder routing and tag readers imported on first use
+"""
+
+import os
+import importlib
+
+# Bytes inspected after any ID3v2 tag; enough for every signature below
+SNIFF_BYTES = 64
+
+class AudioFormat:
+    """One container/codec: how to recognise it, how to decode it and which mutagen class reads its tags"""
+    
+    def __init__(self, name, label, extensions, sniff, tag_module, tag_class, tag_style, decoder="mixer"):
+        self.name = name
+        self.label = label  # Shown in the file dialog
+        self.extensions = extensions
+        self.sniff = sniff  # Header bytes -> bool
+        self.tag_module = tag_module
+        self.tag_class = tag_class
+        self.tag_style = tag_style  # "id3", "riff", "vorbis" or "mp4"
+        self.decoder = decoder  # "mp3", "wav", "mixer" (whole-file SDL_mixer decode) or None
+        self._tag_reader = None
+    
+    @property
+    def playable(self):
+        return self.decoder is not None
+    
+    def tag_reader(self):
+        """The mutagen class for this format, imported the first time it is needed"""
+        if self._tag_reader is None:
+            self._tag_reader = getattr(importlib.import_module(self.tag_module), self.tag_class)
+        return self._tag_reader
+
+def is_mpeg_frame(head):
+    """Frame sync followed by a valid MPEG version and layer"""
+    return (len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0 and
+            (head[1] >> 3) & 3 != 1 and (head[1] >> 1) & 3 != 0)
+
+def is_ogg_codec(signature):
+    """Ogg page whose first packet starts with a codec signature"""
+    return lambda head: head[:4] == b"OggS" and head[28:28 + len(signature)] == signature
+
+# No other signature starts with 0xFF, so the order below is only the file dialog order
+FORMATS = [
+    AudioFormat("mp3", "MP3", [".mp3"], is_mpeg_frame,
+                "mutagen.mp3", "MP3", "id3", decoder="mp3"),
+    AudioFormat("wav", "WAV", [".wav", ".wave"], lambda head: head[:4] == b"RIFF" and head[8:12] == b"WAVE",
+                "mutagen.wave", "WAVE", "riff", decoder="wav"),
+    AudioFormat("ogg", "OGG", [".ogg", ".oga"], is_ogg_codec(b"\x01vorbis"),
+                "mutagen.oggvorbis", "OggVorbis", "vorbis"),
+    AudioFormat("flac", "FLAC", [".flac"], lambda head: head[:4] == b"fLaC",
+                "mutagen.flac", "FLAC", "vorbis"),
+    AudioFormat("opus", "Opus", [".opus"], is_ogg_codec(b"OpusHead"),
+                "mutagen.oggopus", "OggOpus", "vorbis"),
+    # SDL_mixer has no AAC decoder, so M4A files are recognised and tagged but not played
+    AudioFormat("m4a", "M4A", [".m4a"], lambda head: head[4:8] == b"ftyp",
+                "mutagen.mp4", "MP4", "mp4", decoder=None),
+]
+
+def register(audio_format):
+    """Add a format to the registry"""
+    FORMATS.append(audio_format)
+
+def by_name(name):
+    """The registered format with this name, or None"""
+    for audio_format in FORMATS:
+        if audio_format.name == name:
+            return audio_format
+    return None
+
+def by_extension(file_path):
+    """The format a file's extension claims, or None"""
+    extension = os.path.splitext(file_path)[1].lower()
+    for audio_format in FORMATS:
+        if extension in audio_format.extensions:
+            return audio_format
+    return None
+
+def read_head(file_path):
+    """Return (first bytes after any ID3v2 tag, whether there was one)"""
+    with open(file_path, "rb") as file:
+        head = file.read(SNIFF_BYTES)
+        if len(head) < 10 or head[:3] != b"ID3":
+            return head, False
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        file.seek(10 + size + (10 if head[5] & 0x10 else 0))
+        return file.read(SNIFF_BYTES), True
+
+def detect(file_path):
+    """Format of a file from its header bytes, falling back to the extension (None if unknown)"""
+    try:
+        head, tagged = read_head(file_path)
+    except OSError:
+        return by_extension(file_path)
+    
+    for audio_format in FORMATS:
+        if audio_format.sniff(head):
+            return audio_format
+    
+    # Junk before the first frame: an ID3v2 tag still says MP3 unless the name says otherwise
+    claimed = by_extension(file_path)
+    if tagged and claimed is None:
+        return by_name("mp3")
+    return claimed
+
+def supported_extensions():
+    """Extensions of every playable format"""
+    return [extension for audio_format in FORMATS if audio_format.playable for extension in audio_format.extensions]
+
+def file_filter():
+    """Qt file dialog filter: all playable formats first, then one entry per format"""
+    playable = [audio_format for audio_format in FORMATS if audio_format.playable]
+    patterns = lambda audio_format: " ".join(f"*{extension}" for extension in audio_format.extensions)
+    entries = [f"Audio Files ({' '.join(patterns(audio_format) for audio_format in playable)})"]
+    entries += [f"{audio_format.label} Files ({patterns(audio_format)})" for audio_format in playable]
+    return ";;".join(entries)
\ No newline at end of file
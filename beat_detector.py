@@ -0,0 +1,234 @@
+"""
+Beat Detector for ChakraBeats
+Onset detection and tempo estimation that drive the visualizer on the beat
+"""
+
+import os
+import numpy as np
+from PyQt6.QtCore import pyqtSignal
+
+import config
+from audio_decoder import open_pcm_stream
+from scheduler import ScheduledWorker, PRIORITY_LIBRARY
+
+# Onset analysis settings
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+MIN_BPM = 60
+MAX_BPM = 200
+PREFERRED_BPM = 120
+
+class BeatAnalysis:
+    """Tempo and beat positions for one track"""
+    
+    def __init__(self, bpm=0.0, beat_times=None, beat_strengths=None):
+        self.bpm = bpm
+        self.beat_times = beat_times if beat_times is not None else np.zeros(0, dtype=np.float32)
+        self.beat_strengths = beat_strengths if beat_strengths is not None else np.zeros(0, dtype=np.float32)
+    
+    def save(self, path):
+        """Write the analysis as a small .npz file"""
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, bpm=np.float32(self.bpm), beat_times=self.beat_times,
+                 beat_strengths=self.beat_strengths)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        """Load an analysis written by save()"""
+        with np.load(path) as data:
+            return cls(float(data["bpm"]), data["beat_times"], data["beat_strengths"])
+
+class BeatDetector:
+    """Spectral-flux onset detection with autocorrelation tempo estimation"""
+    
+    @staticmethod
+    def onset_envelope(file_path):
+        """Compute the spectral-flux onset envelope in one streaming pass"""
+        window = np.hanning(FRAME_SIZE).astype(np.float32)
+        envelope = []
+        
+        with open_pcm_stream(file_path) as stream:
+            sample_rate = stream.sample_rate
+            carry = np.zeros(FRAME_SIZE - HOP_SIZE, dtype=np.float32)
+            previous = None
+            
+            for block in stream.blocks():
+                mono = np.concatenate((carry, block.mean(axis=1)))
+                frame_count = (len(mono) - FRAME_SIZE) // HOP_SIZE + 1
+                if frame_count <= 0:
+                    carry = mono
+                    continue
+                
+                # All frames of the block are transformed at once
+                frames = np.lib.stride_tricks.sliding_window_view(mono, FRAME_SIZE)[::HOP_SIZE][:frame_count]
+                spectrum = np.log1p(100.0 * np.abs(np.fft.rfft(frames * window, axis=1)))
+                
+                if previous is None:
+                    previous = spectrum[:1]
+                flux = np.diff(np.vstack((previous, spectrum)), axis=0)
+                envelope.append(np.maximum(flux, 0.0).sum(axis=1))
+                
+                previous = spectrum[-1:]
+                carry = mono[frame_count * HOP_SIZE:]
+        
+        if not envelope:
+            return np.zeros(0, dtype=np.float32), sample_rate
+        
+        envelope = np.concatenate(envelope).astype(np.float32)
+        
+        # Remove the slowly varying loudness trend and keep only rises
+        trend_length = max(1, int(0.5 * sample_rate / HOP_SIZE))
+        trend = np.convolve(envelope, np.ones(trend_length) / trend_length, mode='same')
+        envelope = np.maximum(envelope - trend, 0.0)
+        peak = envelope.max()
+        if peak > 0:
+            envelope /= peak
+        return envelope, sample_rate
+    
+    @staticmethod
+    def estimate_period(envelope, frame_rate):
+        """Estimate the beat period in onset frames from the autocorrelation"""
+        size = 1 << int(np.ceil(np.log2(2 * len(envelope))))
+        spectrum = np.fft.rfft(envelope - envelope.mean(), size)
+        autocorr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(envelope)]
+        
+        min_lag = max(1, int(frame_rate * 60.0 / MAX_BPM))
+        max_lag = min(len(autocorr) - 2, int(frame_rate * 60.0 / MIN_BPM))
+        if max_lag <= min_lag:
+            return 0.0
+        
+        # Log-gaussian tempo prior to avoid locking onto half or double time
+        lags = np.arange(min_lag, max_lag + 1)
+        bpms = 60.0 * frame_rate / lags
+        prior = np.exp(-0.5 * (np.log2(bpms / PREFERRED_BPM) / 1.0) ** 2)
+        scores = autocorr[min_lag:max_lag + 1] * prior
+        best = int(np.argmax(scores))
+        lag = float(lags[best])
+        
+        # Parabolic interpolation for a sub-frame period
+        if 0 < best < len(scores) - 1:
+            left, centre, right = scores[best - 1:best + 2]
+            denominator = left - 2 * centre + right
+            if denominator != 0:
+                lag += 0.5 * (left - right) / denominator
+        return lag
+    
+    @staticmethod
+    def analyze(file_path):
+        """Detect tempo and beat positions for a track"""
+        envelope, sample_rate = BeatDetector.onset_envelope(file_path)
+        if len(envelope) < 4 or sample_rate <= 0:
+            return BeatAnalysis()
+        
+        frame_rate = sample_rate / HOP_SIZE
+        period = BeatDetector.estimate_period(envelope, frame_rate)
+        if period <= 0:
+            return BeatAnalysis()
+        
+        # Pick the comb phase that collects the most onset energy
+        step = int(round(period))
+        usable = len(envelope) // step * step
+        if usable == 0:
+            return BeatAnalysis()
+        phase = int(np.argmax(envelope[:usable].reshape(-1, step).sum(axis=0)))
+        
+        # Snap each comb position to the strongest onset nearby
+        grid = np.arange(phase, len(envelope), period)
+        radius = max(1, int(period * 0.1))
+        offsets = np.arange(-radius, radius + 1)
+        candidates = np.clip(np.round(grid).astype(np.int64)[:, None] + offsets, 0, len(envelope) - 1)
+        beats = candidates[np.arange(len(candidates)), np.argmax(envelope[candidates], axis=1)]
+        
+        strengths = envelope[beats]
+        if strengths.max() > 0:
+            strengths = strengths / strengths.max()
+        return BeatAnalysis(60.0 * frame_rate / period,
+                            (beats / frame_rate).astype(np.float32),
+                            strengths.astype(np.float32))
+
+class BeatCache:
+    """Per-file cache of beat analyses under the app data directory"""
+    
+    @staticmethod
+    def get(file_path):
+        """Return a cached analysis or None"""
+        try:
+            cache_path = config.get_track_cache_path("beats", file_path, ".npz")
+            if os.path.exists(cache_path):
+                return BeatAnalysis.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+    
+    @staticmethod
+    def store(file_path, analysis):
+        """Persist an analysis for a file"""
+        try:
+            analysis.save(config.get_track_cache_path("beats", file_path, ".npz"))
+        except OSError as e:
+            print(f"Error saving beat analysis for {file_path}: {e}")
+
+def analyze_and_cache(file_path):
+    """Worker entry point: analyse a track unless a cached result exists"""
+    analysis = BeatCache.get(file_path)
+    if analysis is None:
+        analysis = BeatDetector.analyze(file_path)
+        BeatCache.store(file_path, analysis)
+    return analysis
+
+class BeatAnalysisThread(ScheduledWorker):
+    """Fans library tracks out over the scheduler's processes"""
+    
+    analysis_ready = pyqtSignal(str)
+    
+    def analyze(self, file_paths, priority=PRIORITY_LIBRARY):
+        """Queue tracks for analysis in the background"""
+        self.enqueue(file_paths, priority)
+    
+    def start_job(self, file_path, priority):
+        if BeatCache.get(file_path) is not None:
+            self.analysis_ready.emit(file_path)
+            return None
+        return self.scheduler.submit(analyze_and_cache, file_path, priority=priority)
+    
+    def job_done(self, file_path, future, priority):
+        try:
+            future.result()
+            self.analysis_ready.emit(file_path)
+        except Exception as e:
+            print(f"Error analysing beats for {file_path}: {e}")
+
+class BeatTracker:
+    """Turns the playback position into beat events for the current track"""
+    
+    def __init__(self):
+        self.analysis = None
+        self.next_beat = 0
+        self.last_position = 0
+    
+    def set_analysis(self, analysis):
+        """Follow a new track's beats"""
+        self.analysis = analysis
+        self.next_beat = 0
+        self.last_position = 0
+    
+    def poll(self, position_ms):
+        """Return the strengths of the beats passed since the last poll"""
+        if self.analysis is None or len(self.analysis.beat_times) == 0:
+            return []
+        
+        seconds = position_ms / 1000.0
+        beat_times = self.analysis.beat_times
+        jumped = position_ms < self.last_position or position_ms - self.last_position > 1000
+        self.last_position = position_ms
+        
+        if jumped:
+            # A seek or restart: resynchronise without firing a burst of beats
+            self.next_beat = int(np.searchsorted(beat_times, seconds, side='right'))
+            return []
+        
+        end = int(np.searchsorted(beat_times, seconds, side='right'))
+        strengths = self.analysis.beat_strengths[self.next_beat:end]
+        self.next_beat = max(self.next_beat, end)
+        return list(strengths)
\ No newline at end of file
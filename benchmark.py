@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+ChakraBeats Benchmarks
+Measures the playback DSP stages against their real-time budget
+"""
+
+import os
+import sys
+import time
+
+# Single-core figures: keep BLAS from fanning out
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+import numpy as np
+
+import config
+from equalizer import Equalizer
+from resampler import Resampler
+
+BLOCK_SIZES = [256, 512, 1024, 2048]
+SAMPLE_RATES = [44100, 48000]
+REPEATS = 500
+
+# Share of real time a crossfade's blending may take before it shows in the output budget
+CROSSFADE_MAX_LOAD = 0.01
+
+def time_calls(function, repeats=REPEATS):
+    """Per-call times in seconds after a short warm-up"""
+    for _ in range(10):
+        function()
+    times = np.empty(repeats)
+    for i in range(repeats):
+        started = time.perf_counter()
+        function()
+        times[i] = time.perf_counter() - started
+    return times
+
+def report(label, times, budget):
+    """Print mean and 99th percentile cost against a block's duration"""
+    mean = times.mean()
+    worst = np.percentile(times, 99)
+    print(f"  {label}: mean {mean * 1e6:7.1f} us, p99 {worst * 1e6:7.1f} us, "
+          f"{mean / budget:6.2%} of the block")
+
+def benchmark_equalizer():
+    """Per-block cost of the 10-band EQ with every band active"""
+    print("Equalizer (10 bands, stereo float32 blocks)")
+    gains = config.EQ_PRESETS["Dragon God"]
+    for sample_rate in SAMPLE_RATES:
+        for block_frames in BLOCK_SIZES:
+            equalizer = Equalizer(sample_rate)
+            equalizer.set_gains(gains)
+            block = (np.random.randn(block_frames, 2) * 0.1).astype(np.float32)
+            report(f"{sample_rate} Hz, {block_frames:4d} frames",
+                   time_calls(lambda: equalizer.process(block)), block_frames / sample_rate)
+
+def count_underruns(block_frames, gains, seconds=3.0):
+    """Feed the real output through the EQ and count blocks that arrived too late"""
+    from playback_engine import PcmOutput
+    
+    output = PcmOutput(block_frames)
+    equalizer = Equalizer(output.sample_rate)
+    equalizer.set_gains(gains)
+    noise = (np.random.randn(block_frames, output.channels) * 0.05).astype(np.float32)
+    
+    underruns = 0
+    started = False
+    finish = time.monotonic() + seconds
+    while time.monotonic() < finish:
+        now = time.monotonic()
+        while output.pump(now):
+            if started and output.idle:
+                underruns += 1
+            output.submit(equalizer.process(noise), 0.0, now)
+            started = True
+        time.sleep(config.OUTPUT_POLL_MS / 1000.0)
+    output.flush()
+    return underruns
+
+def benchmark_underruns():
+    """Underruns at small output blocks with the EQ bypassed and fully active"""
+    print("Output underruns over 3 s (EQ off / EQ on)")
+    for block_frames in BLOCK_SIZES[:3]:
+        off = count_underruns(block_frames, None)
+        on = count_underruns(block_frames, config.EQ_PRESETS["Dragon God"])
+        print(f"  {block_frames:4d} frames: {off} / {on}")
+
+def benchmark_resampler(seconds=10):
+    """Single-core resampling throughput as a multiple of real time"""
+    print(f"Resampler (stereo, {seconds} s of noise in 4096-frame blocks)")
+    for in_rate, out_rate in ((48000, 44100), (96000, 44100), (88200, 44100), (44100, 48000), (44100, 96000)):
+        resampler = Resampler(in_rate, out_rate, 2)
+        audio = (np.random.randn(in_rate * seconds, 2) * 0.1).astype(np.float32)
+        started = time.perf_counter()
+        for start in range(0, len(audio), 4096):
+            resampler.process(audio[start:start + 4096])
+        elapsed = time.perf_counter() - started
+        print(f"  {in_rate} -> {out_rate} Hz ({resampler.taps} taps): {seconds / elapsed:6.1f}x real time")
+
+def benchmark_crossfade(seconds=8):
+    """CPU share of blending two streams through a whole crossfade, checked against CROSSFADE_MAX_LOAD"""
+    from audio_decoder import PcmStream
+    from playback_engine import CrossfadeMixer
+    
+    class NoiseStream(PcmStream):
+        def __init__(self, frames, channels):
+            super().__init__("noise")
+            self.samples = (np.random.randn(frames, channels) * 0.1).astype(np.float32)
+            self.frames = frames
+        
+        def read(self, frame_count):
+            start, self.position = self.position, min(self.position + frame_count, self.frames)
+            return self.samples[start:self.position]
+    
+    print(f"Crossfade ({seconds} s overlap, stereo and mono into stereo)")
+    for sample_rate in SAMPLE_RATES:
+        for block_frames in BLOCK_SIZES:
+            for channels in (2, 1):
+                frames = seconds * sample_rate
+                mixer = CrossfadeMixer(block_frames, 2, sample_rate)
+                mixer.set_length(frames)
+                mixer.start(NoiseStream(frames, 2), 1.0, NoiseStream(frames, channels), 0.8, frames)
+                while mixer.active:
+                    mixer.read(block_frames)
+                verdict = "ok" if mixer.load < CROSSFADE_MAX_LOAD else "OVER BUDGET"
+                print(f"  {sample_rate} Hz, {block_frames:4d} frames, {channels} ch in: "
+                      f"{mixer.load:6.3%} of real time ({verdict})")
+                assert mixer.load < CROSSFADE_MAX_LOAD, "crossfade blending is no longer negligible"
+
+def bytes_read():
+    """Bytes this process has read so far (Linux only, else 0)"""
+    try:
+        with open("/proc/self/io") as io:
+            for line in io:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def benchmark_tags(repeats=50):
+    """Playlist tag reads from an MP3 with a 3 MB cover: header-only reader against mutagen"""
+    import tempfile
+    from mutagen.id3 import ID3, TIT2, TPE1, TALB, APIC, COMM
+    from id3_reader import read_tags
+    
+    print("Tag reading (MP3 with a 3 MB embedded cover)")
+    with tempfile.TemporaryDirectory() as folder:
+        file_path = os.path.join(folder, "tagged.mp3")
+        with open(file_path, "wb") as file:
+            file.write(b"\xff\xfb\x90\x00" + bytes(413) * 100)
+        tags = ID3()
+        tags.add(TIT2(encoding=3, text="Unravel"))
+        tags.add(TPE1(encoding=3, text="TK from Ling tosite sigure"))
+        tags.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=os.urandom(3 * 1024 * 1024)))
+        tags.add(TALB(encoding=3, text="Fantastic Magic"))
+        tags.add(COMM(encoding=3, lang="eng", desc="", text="Tokyo Ghoul opening"))
+        tags.save(file_path)
+        
+        for label, function in (("id3_reader", lambda: read_tags(file_path)),
+                                ("mutagen ID3", lambda: ID3(file_path))):
+            before = bytes_read()
+            started = time.perf_counter()
+            for _ in range(repeats):
+                function()
+            elapsed = (time.perf_counter() - started) / repeats
+            per_file = (bytes_read() - before) / repeats
+            print(f"  {label}: {elapsed * 1e3:7.2f} ms, {per_file / 1024:8.1f} KiB read per file")
+
+def benchmark_search(tracks=100000):
+    """Query latency of the library search index on a synthetic library"""
+    import random
+    from search_index import SearchIndex
+    from metadata_handler import SongMetadata
+    
+    syllables = ["na", "ru", "to", "shi", "ka", "ge", "mi", "ra", "ki", "yo", "zu", "ha", "ta", "ma", "sa", "ko"]
+    name = lambda: "".join(random.choice(syllables) for _ in range(random.randint(1, 4))).capitalize()
+    random.seed(1)
+    index = SearchIndex()
+    started = time.perf_counter()
+    for i in range(tracks):
+        metadata = SongMetadata()
+        metadata.title = " ".join(name() for _ in range(random.randint(1, 4)))
+        metadata.artist = f"{name()} {name()}"
+        metadata.album = name()
+        index.add(f"/music/{metadata.artist}/{metadata.album}/{i:06d} {metadata.title}.mp3", metadata)
+    print(f"Search ({tracks} tracks, indexed in {time.perf_counter() - started:.1f} s)")
+    
+    for query in ("n", "na", "nar", "naruto", "ka ge", "shikamaru", "zzz"):
+        times = time_calls(lambda: index.search(query), repeats=50)
+        print(f"  {query!r:12}: {len(index.search(query)):6d} hits, mean {times.mean() * 1e3:5.2f} ms, "
+              f"max {times.max() * 1e3:5.2f} ms")
+
+def benchmark_playlist(tracks=100000):
+    """Playlist re-sorting: first sort of a column against switching back to a cached one"""
+    import random
+    from PyQt6.QtWidgets import QApplication
+    from playlist_model import PlaylistModel, SORT_COLUMNS
+    from metadata_handler import SongMetadata
+    
+    application = QApplication.instance() or QApplication(["benchmark"])
+    random.seed(1)
+    model = PlaylistModel()
+    paths = [f"/music/{i:06d}.mp3" for i in range(tracks)]
+    model.add_tracks(paths)
+    for file_path in paths:
+        metadata = SongMetadata()
+        metadata.title = f"Song {random.randint(0, 10 ** 6)}"
+        metadata.artist = f"Artist {random.randint(0, 5000)}"
+        metadata.album = f"Album {random.randint(0, 20000)}"
+        metadata.year = str(random.randint(1980, 2025))
+        metadata.track_number = f"{random.randint(1, 20)}/20"
+        metadata.duration = random.randint(60, 600)
+        metadata.bitrate = random.choice((128, 192, 256, 320))
+        model.update_metadata(file_path, metadata)
+    
+    print(f"Playlist sorting ({tracks} tracks)")
+    for column in SORT_COLUMNS:
+        started = time.perf_counter()
+        model.set_order(column)
+        first = time.perf_counter() - started
+        model.set_order("added")
+        cached = time_calls(lambda: model.set_order(column, descending=True), repeats=20)
+        print(f"  {column:9}: first sort {first * 1e3:6.1f} ms, cached {cached.mean() * 1e3:5.2f} ms")
+    model.set_grouped(True)
+    grouped = time_calls(lambda: model.set_order("artist"), repeats=20)
+    print(f"  artist, grouped: {grouped.mean() * 1e3:5.2f} ms")
+
+def benchmark_shuffle(tracks=100000):
+    """Shuffle picks, inserts and removals on a large playlist"""
+    import random
+    from shuffle import ShuffleEngine
+    
+    random.seed(1)
+    artists = [f"artist {random.randint(0, 5000)}" for _ in range(tracks)]
+    print(f"Shuffle ({tracks} tracks)")
+    for mode in ("random", "spread"):
+        engine = ShuffleEngine(artist_of=artists.__getitem__, rng=random.Random(1))
+        engine.reset(range(tracks))
+        engine.set_mode(mode)
+        picks = time_calls(engine.next, repeats=tracks)
+        print(f"  {mode:6}: {picks.mean() * 1e6:5.2f} us per pick, new cycle {picks.max() * 1e3:5.2f} ms")
+    
+    engine = ShuffleEngine(rng=random.Random(1))
+    engine.reset(range(tracks))
+    started = time.perf_counter()
+    for track in range(0, tracks, 2):
+        engine.remove(track)
+    for track in range(tracks, tracks + tracks // 2):
+        engine.add(track)
+    changes = time.perf_counter() - started
+    print(f"  {tracks} removals and inserts: {changes * 1e3:5.1f} ms")
+
+def benchmark_similarity(tracks=100000):
+    """Descriptor extraction for one track and nearest-neighbour queries over a large library"""
+    import tempfile
+    from similarity import SimilarityStore, SimilarityIndex, FEATURE_SIZE, describe
+    
+    rng = np.random.default_rng(1)
+    samples = rng.standard_normal(60 * 44100).astype(np.float32) * 0.1
+    extraction = time_calls(lambda: describe(samples, 44100, bpm=120.0), repeats=5)
+    print(f"Similarity (60 s described in {extraction.mean() * 1e3:5.1f} ms)")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        store = SimilarityStore(os.path.join(directory, "features.npy"), os.path.join(directory, "rows.json"))
+        store.paths = [f"/music/{i:06d}.mp3" for i in range(tracks)]
+        store.row_of = {file_path: row for row, file_path in enumerate(store.paths)}
+        store.matrix = rng.standard_normal((tracks, FEATURE_SIZE)).astype(np.float32)
+        store.version += 1
+        index = SimilarityIndex(store)
+        started = time.perf_counter()
+        index.rebuild()
+        print(f"  index of {tracks} tracks built in {(time.perf_counter() - started) * 1e3:5.1f} ms")
+        queries = iter(rng.integers(0, tracks, 1000))
+        times = time_calls(lambda: index.nearest(store.paths[next(queries)], 25), repeats=200)
+        print(f"  25 nearest: mean {times.mean() * 1e3:5.2f} ms, max {times.max() * 1e3:5.2f} ms")
+
+def benchmark_scheduler(library_jobs=64, seconds=0.2):
+    """Wait for a playing-track job while library jobs fill the CPU pool, against one shared FIFO pool"""
+    from concurrent.futures import ProcessPoolExecutor
+    from scheduler import JobScheduler, PRIORITY_PLAYING
+    
+    print(f"Scheduler ({library_jobs} library jobs of {seconds * 1e3:.0f} ms, {config.SCHEDULER_CPU_WORKERS} processes)")
+    scheduler = JobScheduler()
+    scheduler.submit(time.sleep, 0).result()  # Start the pool
+    library = [scheduler.submit(time.sleep, seconds) for _ in range(library_jobs)]
+    time.sleep(seconds / 2)
+    started = time.perf_counter()
+    scheduler.submit(time.sleep, 0, priority=PRIORITY_PLAYING).result()
+    print(f"  playing-track job with priorities: {(time.perf_counter() - started) * 1e3:7.1f} ms")
+    for future in library:
+        future.cancel()
+    scheduler.shutdown()
+    
+    with ProcessPoolExecutor(max_workers=config.SCHEDULER_CPU_WORKERS) as pool:
+        pool.submit(time.sleep, 0).result()
+        library = [pool.submit(time.sleep, seconds) for _ in range(library_jobs)]
+        time.sleep(seconds / 2)
+        started = time.perf_counter()
+        pool.submit(time.sleep, 0).result()
+        print(f"  same job behind a FIFO pool:       {(time.perf_counter() - started) * 1e3:7.1f} ms")
+        pool.shutdown(cancel_futures=True)
+
+BENCHMARKS = {
+    "crossfade": benchmark_crossfade,
+    "equalizer": benchmark_equalizer,
+    "playlist": benchmark_playlist,
+    "resampler": benchmark_resampler,
+    "scheduler": benchmark_scheduler,
+    "search": benchmark_search,
+    "shuffle": benchmark_shuffle,
+    "similarity": benchmark_similarity,
+    "tags": benchmark_tags,
+    "underruns": benchmark_underruns
+}
+
+def main():
+    """Run the named benchmarks, or all of them"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (choose from {', '.join(BENCHMARKS)})")
+            continue
+        BENCHMARKS[name]()
+        print()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -4,6 +4,7 @@ Contains default settings, constants, and configuration options
 """
 
 import os
+import hashlib
 from pathlib import Path
 
 # Application Information
@@ -15,22 +16,73 @@ APP_AUTHOR = "Anime Warriors"
 # File Paths
 SETTINGS_FILE = "chakrabeats_settings.json"
 FAVORITES_FILE = "chakrabeats_favorites.json"
+HISTORY_FILE = "chakrabeats_history.jsonl"
+DUPLICATES_FILE = "chakrabeats_duplicates.json"
 PLAYLISTS_FILE = "chakrabeats_playlists.json"
+LOUDNESS_FILE = "chakrabeats_loudness.json"
+RESUME_FILE = "chakrabeats_resume.json"
+SEARCH_INDEX_FILE = "chakrabeats_search.npz"
+SORT_KEYS_FILE = "chakrabeats_sort_keys.json"
+CACHE_DIR = "cache"
 
 # Audio Settings
-SUPPORTED_FORMATS = ['.mp3', '.wav', '.ogg']
 DEFAULT_VOLUME = 70
 MAX_VOLUME = 100
 
+# Playback Engine Settings
+OUTPUT_SAMPLE_RATE = 44100  # Device rate unless it follows the file
+OUTPUT_SAMPLE_RATES = [44100, 48000, 88200, 96000]  # Rates the device may switch to
+OUTPUT_BLOCK_FRAMES = 2048  # Frames per block handed to the mixer (starting point)
+OUTPUT_BLOCK_MIN_FRAMES = 512  # Bounds for the queue depth tuner (the device buffer stays fixed)
+OUTPUT_BLOCK_MAX_FRAMES = 8192
+OUTPUT_TUNE_WINDOW_SECONDS = 5  # Observation window of the tuner
+OUTPUT_SHRINK_WINDOWS = 3  # Clean windows in a row before the block shrinks
+OUTPUT_POLL_MS = 4  # How often the playback thread services the output
+POSITION_UPDATE_MS = 50  # Throttle for position_changed
+RESUME_CHECKPOINT_MS = 5000  # How often the resume position is recorded
+MP3_INDEX_INTERVAL_MS = 500  # Spacing of MP3 seek table entries
+DEFAULT_CROSSFADE_SECONDS = 0  # 0 = gapless, no overlap
+MAX_CROSSFADE_SECONDS = 12
+
+# Decoder Process Settings
+DECODER_RING_SECONDS = 4  # Decoded audio buffered ahead of the output per stream
+DECODER_HISTORY_FRAMES = 32768  # Already played audio kept readable for the visualizer
+DECODER_CHUNK_FRAMES = 4096  # Frames the decoder process writes per step
+DECODER_TIMEOUT_SECONDS = 10  # Longest wait for the decoder to open or catch up
+
+# Loudness Normalisation Settings
+REPLAY_GAIN_REFERENCE = -18.0  # LUFS
+REPLAY_GAIN_MODES = ["off", "track", "album"]
+DEFAULT_REPLAY_GAIN_MODE = "track"
+
+# Equalizer Settings
+EQ_BANDS = [31, 62, 125, 250, 500, 1000, 2000, 4000, 8000, 16000]  # Centre frequencies in Hz
+EQ_Q = 1.41  # Roughly one octave per peaking band
+EQ_MODES = ["Off", "Theme"]  # Besides the named presets; "Theme" follows the chakra theme
+DEFAULT_EQ_MODE = "Theme"
+EQ_PRESETS = {
+    "Flat": [0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    "Kaminari": [2, 1, 0, -1, 0, 1, 3, 4, 5, 4],     # Crackling highs
+    "Susanoo": [4, 3, 2, 1, 0, -1, -1, 0, 1, 1],     # Deep, calm low end
+    "Dragon God": [6, 5, 3, 0, -2, -1, 1, 3, 4, 3]   # Roaring V-shape
+}
+THEME_EQ_PRESETS = {
+    "Kaminari Mode": "Kaminari",
+    "Susanoo Mode": "Susanoo",
+    "Dragon God Mode": "Dragon God"
+}
+
 # Visualizer Settings
 VISUALIZER_FPS = 30
+VISUALIZER_FFT_FRAMES = 2048  # Window analysed for the live spectrum
 DEFAULT_VISUALIZER_MODE = "chakra_bars"
 VISUALIZER_MODES = [
     "chakra_bars",
     "sharingan_circle", 
     "chakra_waves",
     "dragon_flames",
-    "particle_system"
+    "particle_system",
+    "chakra_spectrogram"
 ]
 
 # Theme Settings
@@ -52,6 +104,52 @@ ANIMATION_SPEED = 0.05
 PARTICLE_COUNT = 20
 BAR_COUNT = 32
 
+# Waveform Overview Settings
+WAVEFORM_BINS = 2048
+
+# Album Art Settings
+ALBUM_ART_SIZE = 160  # Thumbnail edge in pixels, on disk and in the song info tab
+ALBUM_ART_ICON_SIZE = 32  # Playlist icons, scaled from the same thumbnails
+ALBUM_ART_MEMORY_BYTES = 16 * 1024 * 1024  # Pixmap budget of the in-memory cache
+ALBUM_ART_FILES = ["cover", "folder", "front", "album"]  # Folder images, as .jpg, .jpeg or .png
+
+# Background Jobs
+SCHEDULER_IO_WORKERS = 4  # Threads for file reads such as seek tables and opening the next track
+SCHEDULER_CPU_WORKERS = os.cpu_count() or 2  # Processes for decoding and analysis
+SCHEDULER_RESERVED_SLOTS = (0, 1, 2)  # Pool slots the playing-track, visible-row and library classes leave free
+SCHEDULER_BACKOFF_MS = 5000  # Library jobs wait this long after a playback underrun
+SCHEDULER_CPU_NICE = 5  # Analysis processes run at a lower OS priority than the player
+
+# Search Settings
+SEARCH_DELAY_MS = 60  # Pause in typing before the playlist is filtered
+
+# Library Watching
+WATCH_COALESCE_MS = 500  # Quiet time after the last folder event before a batch is scanned
+WATCH_FILE_LIMIT = 4096  # Tracks watched one by one for in-place retagging (inotify watches are limited)
+WATCH_ADD_NEW_FILES = True  # Add audio files that appear in the folders of playlist tracks
+
+# Duplicate Finder
+DUPLICATE_DURATION_TOLERANCE = 2.0  # Seconds two rips of one track may differ by
+DUPLICATE_FINGERPRINT_SECONDS = 30  # Audio fingerprinted per track, after leading silence
+DUPLICATE_MIN_SECONDS = 5  # Shorter fingerprints are not compared
+DUPLICATE_MAX_BIT_ERRORS = 0.2  # Fingerprint bit error rate up to which tracks count as one recording
+
+# Similar Tracks
+SIMILARITY_SECONDS = 60  # Audio described per track, from its middle
+SIMILAR_TRACKS = 25  # Tracks in the list Play Similar builds
+
+# Shuffle
+SHUFFLE_HISTORY = 500  # Played tracks previous can go back through
+SHUFFLE_SPREAD_WINDOW = 5  # Artist spread avoids the artists of this many recent tracks
+SHUFFLE_CANDIDATES = 8  # Pool tracks sampled per artist spread or weighted pick
+
+# Play Statistics
+STATS_FLUSH_MS = 5000  # Queued plays and favorites are written this often
+STATS_COMPACT_EVENTS = 2000  # History events logged before they are folded into the snapshot
+STATS_PLAY_SECONDS = 240  # A track counts as played after this long...
+STATS_PLAY_FRACTION = 0.5  # ...or this share of it, whichever comes first
+STATS_VIEW_TRACKS = 100  # Tracks shown by the recently and most played views
+
 # Metadata Settings
 METADATA_CACHE_SIZE = 1000
 METADATA_TIMEOUT = 300  # seconds
@@ -119,7 +217,12 @@ DEFAULT_SETTINGS = {
         "width": DEFAULT_WINDOW_WIDTH,
         "height": DEFAULT_WINDOW_HEIGHT
     },
-    "favorites": [],
+    "replay_gain": DEFAULT_REPLAY_GAIN_MODE,
+    "crossfade": DEFAULT_CROSSFADE_SECONDS,
+    "equalizer": DEFAULT_EQ_MODE,
+    "follow_file_rate": False,
+    "queue_block_frames": OUTPUT_BLOCK_FRAMES,
+    "decoder_process": False,
     "last_played": "",
     "last_position": 0
 }
@@ -165,7 +268,61 @@ def get_favorites_path():
     data_dir = ensure_app_data_dir()
     return os.path.join(data_dir, FAVORITES_FILE)
 
+def get_history_path():
+    """Get the full path to the listening history log"""
+    data_dir = ensure_app_data_dir()
+    return os.path.join(data_dir, HISTORY_FILE)
+
+def get_duplicates_path():
+    """Get the full path to the cached duplicate scan results"""
+    data_dir = ensure_app_data_dir()
+    return os.path.join(data_dir, DUPLICATES_FILE)
+
 def get_playlists_path():
     """Get the full path to the playlists file"""
     data_dir = ensure_app_data_dir()
-    return os.path.join(data_dir, PLAYLISTS_FILE) 
\ No newline at end of file
+    return os.path.join(data_dir, PLAYLISTS_FILE) 
+
+def get_loudness_path():
+    """Get the full path to the loudness analysis file"""
+    data_dir = ensure_app_data_dir()
+    return os.path.join(data_dir, LOUDNESS_FILE)
+
+def get_search_index_path():
+    """Get the full path to the saved search index"""
+    data_dir = ensure_app_data_dir()
+    return os.path.join(data_dir, SEARCH_INDEX_FILE)
+
+def get_sort_keys_path():
+    """Get the full path to the saved playlist sort keys"""
+    data_dir = ensure_app_data_dir()
+    return os.path.join(data_dir, SORT_KEYS_FILE)
+
+def get_smart_facts_path():
+    """Get the full path to the cached track facts smart playlists are evaluated on"""
+    return os.path.join(get_cache_dir("playlists"), "facts.json")
+
+def get_library_listing_path():
+    """Get the full path to the folder listings the library watcher diffs against"""
+    return os.path.join(get_cache_dir("library"), "listings.json")
+
+def get_feature_matrix_path():
+    """Get the full path to the matrix of track descriptors used to find similar tracks"""
+    return os.path.join(get_cache_dir("similarity"), "features.npy")
+
+def get_feature_rows_path():
+    """Get the full path to the track paths of the descriptor matrix rows"""
+    return os.path.join(get_cache_dir("similarity"), "rows.json")
+
+def get_cache_dir(category):
+    """Get (and create) the cache directory for a category of analysis data"""
+    cache_dir = os.path.join(ensure_app_data_dir(), CACHE_DIR, category)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def get_track_cache_path(category, file_path, extension):
+    """Get the cache file path for a track; the name changes when the file does"""
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_dir(category), digest + extension)
\ No newline at end of file
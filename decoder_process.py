@@ -0,0 +1,313 @@
+"""
+Decoder Process for ChakraBeats
+Decodes tracks in a separate process into shared-memory PCM rings read zero-copy by the player
+"""
+
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+import config
+from audio_decoder import PcmStream
+
+# Ring header slots; positions are frame counters that only ever grow
+WRITE = 0  # Frames written by the decoder
+READ = 1  # Frames released by the player
+EPOCH = 2  # Last seek the decoder has carried out
+EPOCH_START = 3  # Write counter where that seek's audio begins
+END = 4  # Write counter at end of stream, -1 while decoding
+STATE = 5  # OPENING, OPEN or FAILED
+FRAMES = 6  # Stream length as the decoder currently knows it
+HEADER_SLOTS = 8
+
+OPENING, OPEN, FAILED = 0, 1, -1
+
+# Rings always carry stereo; mono is spread by the decoder
+RING_CHANNELS = 2
+
+class PcmRing:
+    """Float32 ring in shared memory with one writer (decoder) and one reader (player)"""
+    
+    def __init__(self, memory, capacity, history, owner):
+        self.memory = memory
+        self.capacity = capacity
+        self.history = history  # Frames behind the read counter the writer must not overwrite
+        self.owner = owner
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=memory.buf)
+        self.data = np.ndarray((capacity, RING_CHANNELS), dtype=np.float32, buffer=memory.buf,
+                               offset=HEADER_SLOTS * 8)
+    
+    @classmethod
+    def create(cls, capacity, history):
+        """Allocate a new ring; its creator unlinks it on close"""
+        size = HEADER_SLOTS * 8 + capacity * RING_CHANNELS * 4
+        ring = cls(shared_memory.SharedMemory(create=True, size=size), capacity, history, owner=True)
+        ring.header[:] = 0
+        ring.header[END] = -1
+        return ring
+    
+    @classmethod
+    def attach(cls, name, capacity, history):
+        """Map a ring created by the other process"""
+        return cls(shared_memory.SharedMemory(name=name), capacity, history, owner=False)
+    
+    @property
+    def name(self):
+        return self.memory.name
+    
+    def free_frames(self):
+        """Room the writer may fill without touching unread audio or the kept history"""
+        return self.capacity - self.history - int(self.header[WRITE] - self.header[READ])
+    
+    def write(self, block):
+        """Append a (frames, channels) block; the caller checks free_frames() first"""
+        if block.shape[1] > RING_CHANNELS:
+            block = block[:, :RING_CHANNELS]
+        frames = len(block)
+        start = int(self.header[WRITE]) % self.capacity
+        first = min(frames, self.capacity - start)
+        self.data[start:start + first] = block[:first]
+        self.data[:frames - first] = block[first:]
+        self.header[WRITE] += frames  # Published only once the samples are in place
+    
+    def view(self, start, frames, scratch):
+        """Frames from a counter position: a view into the ring, or a copy in scratch if they wrap"""
+        index = start % self.capacity
+        if index + frames <= self.capacity:
+            return self.data[index:index + frames]
+        first = self.capacity - index
+        block = scratch[:frames]
+        block[:first] = self.data[index:]
+        block[first:] = self.data[:frames - first]
+        return block
+    
+    def close(self):
+        self.header = self.data = None
+        if self.owner:
+            self.memory.unlink()
+        try:
+            self.memory.close()
+        except BufferError:
+            # A view handed out is still alive; the mapping goes with it
+            pass
+
+def decoder_main(commands):
+    """Decoder process: serve open/seek/close commands and keep every ring topped up"""
+    # SDL would otherwise turn SIGTERM into a quit event and the process could not be terminated
+    os.environ["SDL_NO_SIGNAL_HANDLERS"] = "1"
+    from audio_decoder import init_worker_process, open_pcm_stream
+    
+    init_worker_process()
+    streams = {}  # Stream id -> (PcmStream, PcmRing)
+    
+    while True:
+        busy = False
+        for stream, ring in streams.values():
+            if ring.header[END] >= 0 or ring.free_frames() < config.DECODER_CHUNK_FRAMES:
+                continue
+            try:
+                block = stream.read(config.DECODER_CHUNK_FRAMES)
+            except Exception as e:
+                # End the stream here rather than take down every other one
+                print(f"Error decoding {stream.file_path}: {e}")
+                block = np.zeros((0, RING_CHANNELS), dtype=np.float32)
+            if len(block):
+                ring.write(block)
+                busy = True
+            else:
+                ring.header[END] = ring.header[WRITE]
+            ring.header[FRAMES] = stream.frames
+        
+        # Drain commands; sleep on the queue only when every ring is full
+        timeout = None if not streams else 0 if busy else config.OUTPUT_POLL_MS / 1000.0
+        while True:
+            try:
+                command = commands.get(timeout=timeout) if timeout != 0 else commands.get_nowait()
+            except queue.Empty:
+                break
+            timeout = 0
+            action = command[0]
+            
+            if action == "open":
+                _, stream_id, file_path, sample_rate, ring_name, capacity, history = command
+                try:
+                    ring = PcmRing.attach(ring_name, capacity, history)
+                except FileNotFoundError:
+                    continue  # The player gave up waiting and removed the ring
+                try:
+                    # Decoded at the file's own rate, then resampled to the output's
+                    stream = open_pcm_stream(file_path, sample_rate)
+                except Exception as e:
+                    print(f"Error decoding {file_path}: {e}")
+                    ring.header[STATE] = FAILED
+                    ring.close()
+                    continue
+                ring.header[FRAMES] = stream.frames
+                ring.header[STATE] = OPEN
+                streams[stream_id] = (stream, ring)
+            
+            elif action == "seek":
+                _, stream_id, frame, epoch = command
+                if stream_id in streams:
+                    stream, ring = streams[stream_id]
+                    stream.seek(frame)
+                    ring.header[END] = -1
+                    ring.header[EPOCH_START] = ring.header[WRITE]
+                    ring.header[EPOCH] = epoch  # Written last: the player trusts the others once it sees this
+            
+            elif action == "close":
+                if command[1] in streams:
+                    stream, ring = streams.pop(command[1])
+                    stream.close()
+                    ring.close()
+            
+            elif action == "stop":
+                for stream, ring in streams.values():
+                    stream.close()
+                    ring.close()
+                return
+
+class RingPcmStream(PcmStream):
+    """Player-side stream over audio decoded in the decoder process"""
+    
+    def __init__(self, decoder, stream_id, file_path, ring, sample_rate):
+        super().__init__(file_path)
+        self.decoder = decoder
+        self.stream_id = stream_id
+        self.ring = ring
+        self.sample_rate = sample_rate
+        self.channels = RING_CHANNELS
+        self.frames = int(ring.header[FRAMES])
+        self.epoch = 0
+        self.held = 0  # Frames handed out by the last read, released by the next one
+        self.waiting_since = None  # When reads started coming back empty before the end
+        self.scratch = None
+    
+    def read(self, frame_count):
+        """Return decoded audio as a view into the ring, valid until the next read or seek; never waits"""
+        header = self.ring.header
+        header[READ] += self.held
+        self.held = 0
+        self.frames = int(header[FRAMES])
+        
+        available = 0
+        ended = False
+        if header[EPOCH] == self.epoch:
+            # Skip whatever was decoded before the last seek
+            if header[READ] < header[EPOCH_START]:
+                header[READ] = header[EPOCH_START]
+            available = int(header[WRITE] - header[READ])
+            ended = header[END] >= 0
+        
+        # Short of a full block, hand out nothing and let the player come back; only the end may be short
+        self.waiting = available < frame_count and not ended
+        if self.waiting:
+            now = time.monotonic()
+            if self.waiting_since is None:
+                self.waiting_since = now
+            elif now - self.waiting_since > config.DECODER_TIMEOUT_SECONDS or not self.decoder.alive:
+                print(f"Error decoding {self.file_path}: the decoder process stopped responding")
+                self.waiting = False
+            return np.zeros((0, self.channels), dtype=np.float32)
+        self.waiting_since = None
+        
+        count = min(frame_count, available)
+        if count <= 0:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        if self.scratch is None or len(self.scratch) < count:
+            self.scratch = np.empty((count, self.channels), dtype=np.float32)
+        
+        block = self.ring.view(int(header[READ]), count, self.scratch)
+        self.held = count
+        self.position += count
+        return block
+    
+    def seek(self, frame):
+        frame = max(0, min(frame, self.frames))
+        self.held = 0
+        self.waiting_since = None
+        self.epoch += 1
+        self.decoder.send("seek", self.stream_id, frame, self.epoch)
+        self.position = frame
+    
+    def peek(self, frame, frame_count):
+        """View of the frame_count frames before a stream frame, or None if the ring no longer holds them"""
+        header = self.ring.header
+        if header[EPOCH] != self.epoch:
+            return None
+        
+        # The read counter plus what is held out corresponds to self.position
+        end = int(header[READ]) + self.held - (self.position - frame)
+        start = end - frame_count
+        if start < max(header[EPOCH_START], header[READ] - self.ring.history) or end > header[WRITE]:
+            return None
+        if start % self.ring.capacity + frame_count > self.ring.capacity:
+            return None  # Straddles the wrap; the next frame will not
+        return self.ring.view(start, frame_count, None)
+    
+    def close(self):
+        if self.ring is not None:
+            self.decoder.send("close", self.stream_id)
+            self.ring.close()
+            self.ring = None
+
+class DecoderProcess:
+    """Starts the decoder process on first use and opens ring-backed streams in it"""
+    
+    def __init__(self):
+        self.process = None
+        self.commands = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+    
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+    
+    def start(self):
+        # Spawned, not forked: a fork would inherit Qt and the open audio device
+        context = multiprocessing.get_context("spawn")
+        self.commands = context.Queue()
+        self.process = context.Process(target=decoder_main, args=(self.commands,), daemon=True)
+        self.process.start()
+    
+    def send(self, *command):
+        if self.commands is not None:
+            self.commands.put(command)
+    
+    def open(self, file_path, sample_rate):
+        """Open a track in the decoder process and wait until its ring is ready"""
+        with self.lock:
+            if not self.alive:
+                self.start()
+            self.next_id += 1
+            stream_id = self.next_id
+        
+        history = config.DECODER_HISTORY_FRAMES
+        capacity = config.DECODER_RING_SECONDS * sample_rate + history
+        ring = PcmRing.create(capacity, history)
+        self.send("open", stream_id, file_path, sample_rate, ring.name, capacity, history)
+        
+        deadline = time.monotonic() + config.DECODER_TIMEOUT_SECONDS
+        while ring.header[STATE] == OPENING and time.monotonic() < deadline and self.alive:
+            time.sleep(0.002)
+        if ring.header[STATE] != OPEN:
+            self.send("close", stream_id)
+            ring.close()
+            raise RuntimeError(f"the decoder process could not open {file_path}")
+        return RingPcmStream(self, stream_id, file_path, ring, sample_rate)
+    
+    def stop(self):
+        """Stop the decoder process, closing every stream it still has open"""
+        if self.process is None:
+            return
+        self.send("stop")
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.kill()
+        self.process = None
+        self.commands = None
\ No newline at end of file
@@ -0,0 +1,473 @@
+"""
+Duplicate Finder for ChakraBeats
+Finds the same track ripped several times: payload hashes for identical audio, spectral fingerprints for re-encodes
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+import numpy as np
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLabel, QTreeWidget, QTreeWidgetItem
+
+import config
+import audio_formats
+from audio_decoder import open_pcm_stream
+from scheduler import PRIORITY_LIBRARY, POLL_SECONDS
+
+# Fingerprint: 0.4 s frames every 0.1 s, 17 log-spaced bands from 300 Hz to 2 kHz, 16 bits per frame
+FRAME_SECONDS = 0.4
+HOP_SECONDS = 0.1
+BAND_EDGES = np.geomspace(300.0, 2000.0, 18)
+ONSET_SECONDS = 0.02  # Lead-in is skipped up to the first window this long...
+ONSET_LEVEL = 0.1  # ...whose RMS reaches this share of the loudest window of the opening block
+
+# Results are checkpointed to disk this often while scanning
+CHECKPOINT_SECONDS = 5.0
+
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+def payload_range(file_path, audio_format):
+    """Byte range (start, end) of a file's audio data, leaving out the tags its format can carry"""
+    size = os.path.getsize(file_path)
+    start, end = 0, size
+    with open(file_path, "rb") as f:
+        head = f.read(10)
+        if head[:3] == b"ID3" and len(head) == 10:
+            start = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]) + (10 if head[5] & 0x10 else 0)
+        
+        name = audio_format.name if audio_format else None
+        if name == "mp3":
+            # ID3v1 and then APEv2 sit at the end
+            if end - start >= 128:
+                f.seek(end - 128)
+                if f.read(3) == b"TAG":
+                    end -= 128
+            if end - start >= 32:
+                f.seek(end - 32)
+                footer = f.read(32)
+                if footer[:8] == b"APETAGEX":
+                    tag_size = int.from_bytes(footer[12:16], "little")
+                    has_header = int.from_bytes(footer[20:24], "little") & 0x80000000
+                    end -= tag_size + (32 if has_header else 0)
+        elif name == "flac":
+            # Skip the metadata blocks (Vorbis comments, pictures) after the marker
+            f.seek(start)
+            if f.read(4) == b"fLaC":
+                position = start + 4
+                while True:
+                    block = f.read(4)
+                    if len(block) < 4:
+                        break
+                    position += 4 + int.from_bytes(block[1:4], "big")
+                    f.seek(position)
+                    if block[0] & 0x80:
+                        break
+                start = position
+        elif name == "wav":
+            # Only the data chunk; LIST/id3 chunks hold the tags
+            f.seek(12)
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    break
+                chunk_size = int.from_bytes(chunk[4:8], "little")
+                if chunk[:4] == b"data":
+                    start = f.tell()
+                    end = min(size, start + chunk_size)
+                    break
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    return start, max(start, end)
+
+def payload_hash(file_path, audio_format):
+    """Hash of the audio data alone, so copies that differ only in tags hash the same"""
+    start, end = payload_range(file_path, audio_format)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def fingerprint(samples, sample_rate):
+    """Band energy difference bits per frame (Haitsma-Kalker style) as uint16, from mono samples"""
+    frame = int(FRAME_SECONDS * sample_rate)
+    hop = int(HOP_SECONDS * sample_rate)
+    if len(samples) < frame + hop:
+        return np.zeros(0, dtype=np.uint16)
+    
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame)[::hop]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame).astype(np.float32), axis=1)) ** 2
+    edges = np.searchsorted(np.fft.rfftfreq(frame, 1.0 / sample_rate), BAND_EDGES)
+    bands = np.add.reduceat(spectrum, edges, axis=1)[:, :len(BAND_EDGES) - 1]
+    
+    # Bit m of frame n: did the energy step between bands m and m+1 grow since frame n-1?
+    steps = bands[:, :-1] - bands[:, 1:]
+    bits = (steps[1:] - steps[:-1]) > 0
+    return (bits.astype(np.uint16) << np.arange(bits.shape[1], dtype=np.uint16)).sum(axis=1).astype(np.uint16)
+
+def read_opening(file_path, seconds):
+    """Mono float32 samples of a track's first seconds after any leading silence, and the sample rate"""
+    with open_pcm_stream(file_path) as stream:
+        sample_rate = stream.sample_rate
+        wanted = int(seconds * sample_rate)
+        blocks = []
+        collected = 0
+        for block in stream.blocks():
+            mono = block.mean(axis=1)
+            if not blocks:
+                # Skip the lead-in (silence or hiss) so rips with different lead-ins line up
+                window = max(1, int(ONSET_SECONDS * sample_rate))
+                count = len(mono) // window
+                if count == 0:
+                    continue
+                rms = np.sqrt(np.square(mono[:count * window]).reshape(count, window).mean(axis=1))
+                loud = np.flatnonzero(rms >= ONSET_LEVEL * rms.max())
+                if rms.max() < 1e-4 or len(loud) == 0:
+                    continue
+                mono = mono[loud[0] * window:]
+            blocks.append(mono)
+            collected += len(mono)
+            if collected >= wanted:
+                break
+    samples = np.concatenate(blocks)[:wanted] if blocks else np.zeros(0, dtype=np.float32)
+    return samples.astype(np.float32, copy=False), sample_rate
+
+def probe_duration(file_path):
+    """Worker: duration in seconds from the stream headers, for tracks whose metadata lacks it"""
+    audio_format = audio_formats.detect(file_path)
+    if audio_format is None:
+        return 0.0
+    return float(audio_format.tag_reader()(file_path).info.length)
+
+def analyze_track(file_path):
+    """Worker: payload hash and fingerprint of a track (an empty fingerprint if it cannot be decoded)"""
+    audio_format = audio_formats.detect(file_path)
+    content_hash = payload_hash(file_path, audio_format)
+    prints = np.zeros(0, dtype=np.uint16)
+    if audio_format is None or audio_format.playable:
+        try:
+            samples, sample_rate = read_opening(file_path, config.DUPLICATE_FINGERPRINT_SECONDS)
+            prints = fingerprint(samples, sample_rate)
+        except Exception as e:
+            print(f"Error fingerprinting {file_path}: {e}")
+    np.save(config.get_track_cache_path("fingerprints", file_path, ".npy"), prints)
+    return content_hash
+
+def bit_error_rates(prints, lengths, row, others):
+    """Share of differing fingerprint bits between one track and several others, over their common frames"""
+    common = np.minimum(lengths[others], lengths[row])
+    difference = prints[others] ^ prints[row]
+    difference[np.arange(prints.shape[1])[None, :] >= common[:, None]] = 0  # Zero padding past a track's end
+    errors = POPCOUNT[difference.view(np.uint8)].reshape(len(others), -1).sum(axis=1)
+    return errors / (common * 16)
+
+class DuplicateCluster:
+    """Tracks found to be copies of one recording"""
+    
+    def __init__(self, file_paths, identical):
+        self.file_paths = file_paths
+        self.identical = identical  # True when every copy has the same audio data
+
+class DuplicateStore:
+    """Per-track durations and payload hashes on disk; fingerprints are cached per track next to them"""
+    
+    def __init__(self, path=None):
+        self.path = path or config.get_duplicates_path()
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+        except Exception as e:
+            print(f"Error loading duplicate scan data: {e}")
+    
+    def save(self):
+        """Write entries atomically so an interrupted scan resumes where it stopped"""
+        with self.lock:
+            snapshot = dict(self.entries)
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving duplicate scan data: {e}")
+    
+    def current(self, file_path, stat):
+        """The entry for a file if it still matches the file on disk"""
+        entry = self.entries.get(file_path)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+            return None
+        return entry
+    
+    def put(self, file_path, stat, **fields):
+        with self.lock:
+            entry = self.entries.get(file_path)
+            if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+                entry = self.entries[file_path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+            entry.update(fields)
+    
+    def fingerprint(self, file_path):
+        try:
+            return np.load(config.get_track_cache_path("fingerprints", file_path, ".npy"))
+        except (OSError, ValueError):
+            return None
+
+class DuplicateFinder(QThread):
+    """Background dedupe job: duration and size candidates, then hashes and fingerprints on the scheduler"""
+    
+    progress = pyqtSignal(int, int)  # Tracks analysed, tracks to analyse
+    clusters_found = pyqtSignal(object)  # List of DuplicateCluster, largest first
+    
+    def __init__(self, store, scheduler, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.scheduler = scheduler
+        self.tracks = {}
+        self.lock = threading.Lock()
+        self.active = False
+        self.stopping = False
+    
+    def find(self, tracks):
+        """Look for duplicates among {file path: duration in seconds}; 0 means unknown"""
+        with self.lock:
+            if self.active:
+                return False
+            self.active = True
+            self.tracks = dict(tracks)
+        
+        self.wait()
+        self.start(QThread.Priority.LowPriority)
+        return True
+    
+    def stop(self):
+        """Stop scanning; finished results are kept"""
+        self.stopping = True
+        self.wait()
+    
+    def run(self):
+        try:
+            clusters = self.scan()
+            if clusters is not None:
+                self.clusters_found.emit(clusters)
+        except Exception as e:
+            print(f"Error finding duplicates: {e}")
+        finally:
+            self.store.save()
+            with self.lock:
+                self.active = False
+    
+    def run_jobs(self, function, file_paths, stats, field):
+        """Run a worker over tracks as library jobs, storing each result under field; False if stopped"""
+        # Only enough jobs to keep the pool busy are queued, so other library work is not stuck behind the scan
+        waiting = iter(file_paths)
+        running = {}  # Future -> track path
+        done = 0
+        last_save = time.monotonic()
+        while not self.stopping:
+            while len(running) < self.scheduler.sizes["cpu"]:
+                file_path = next(waiting, None)
+                if file_path is None:
+                    break
+                running[self.scheduler.submit(function, file_path, priority=PRIORITY_LIBRARY)] = file_path
+            if not running:
+                return True
+            
+            finished, _ = wait(running, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in finished:
+                file_path = running.pop(future)
+                done += 1
+                try:
+                    self.store.put(file_path, stats[file_path], **{field: future.result()})
+                except Exception as e:
+                    print(f"Error checking {file_path} for duplicates: {e}")
+                if field == "hash":
+                    self.progress.emit(done, len(file_paths))
+            if time.monotonic() - last_save > CHECKPOINT_SECONDS:
+                self.store.save()
+                last_save = time.monotonic()
+        
+        for future in running:
+            future.cancel()
+        return False
+    
+    def scan(self):
+        stats = {}
+        for file_path in self.tracks:
+            try:
+                stats[file_path] = os.stat(file_path)
+            except OSError:
+                continue
+        
+        # Durations: from metadata, the store, or a header read for the rest
+        durations = {}
+        unknown = []
+        for file_path, stat in stats.items():
+            entry = self.store.current(file_path, stat)
+            duration = self.tracks[file_path] or (entry or {}).get("duration")
+            if duration:
+                durations[file_path] = float(duration)
+            else:
+                unknown.append(file_path)
+        if not self.run_jobs(probe_duration, unknown, stats, "duration"):
+            return None
+        for file_path in unknown:
+            entry = self.store.current(file_path, stats[file_path])
+            if entry and entry.get("duration"):
+                durations[file_path] = entry["duration"]
+        
+        candidates = self.candidates(durations, stats)
+        
+        # Hashes and fingerprints only for candidates, and only once per file version
+        todo = [file_path for file_path in candidates
+                if "hash" not in (self.store.current(file_path, stats[file_path]) or {})]
+        if not self.run_jobs(analyze_track, todo, stats, "hash"):
+            return None
+        return self.cluster(candidates, durations, stats)
+    
+    def candidates(self, durations, stats):
+        """Tracks sharing their size, or their duration within the tolerance, with another track"""
+        paths = sorted(durations, key=durations.get)
+        values = np.array([durations[file_path] for file_path in paths])
+        close = np.diff(values) <= config.DUPLICATE_DURATION_TOLERANCE
+        chosen = np.zeros(len(paths), dtype=bool)
+        chosen[:-1] |= close
+        chosen[1:] |= close
+        candidates = {file_path for file_path, keep in zip(paths, chosen) if keep}
+        
+        by_size = {}
+        for file_path, stat in stats.items():
+            by_size.setdefault(stat.st_size, []).append(file_path)
+        for same_size in by_size.values():
+            if len(same_size) > 1:
+                candidates.update(same_size)
+        return sorted(candidates, key=lambda file_path: durations.get(file_path, 0.0))
+    
+    def cluster(self, candidates, durations, stats):
+        """Union candidates with equal payload hashes or close fingerprints into clusters"""
+        parent = list(range(len(candidates)))
+        
+        def root(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+        
+        hashes = []
+        first_with_hash = {}
+        for node, file_path in enumerate(candidates):
+            content_hash = (self.store.current(file_path, stats[file_path]) or {}).get("hash")
+            hashes.append(content_hash)
+            if content_hash is None:
+                continue
+            if content_hash in first_with_hash:
+                parent[root(node)] = root(first_with_hash[content_hash])
+            else:
+                first_with_hash[content_hash] = node
+        
+        # Fingerprints padded to one width so a track is compared with its whole duration window at once
+        frames = int(config.DUPLICATE_FINGERPRINT_SECONDS / HOP_SECONDS)
+        prints = np.zeros((len(candidates), frames), dtype=np.uint16)
+        lengths = np.zeros(len(candidates), dtype=np.int64)
+        for node, file_path in enumerate(candidates):
+            track_prints = self.store.fingerprint(file_path)
+            if track_prints is not None and len(track_prints):
+                lengths[node] = min(len(track_prints), frames)
+                prints[node, :lengths[node]] = track_prints[:frames]
+        
+        values = np.array([durations.get(file_path, 0.0) for file_path in candidates])
+        window_ends = np.searchsorted(values, values + config.DUPLICATE_DURATION_TOLERANCE, side="right")
+        minimum = int(config.DUPLICATE_MIN_SECONDS / HOP_SECONDS)
+        for node in range(len(candidates)):
+            if lengths[node] < minimum:
+                continue
+            others = np.arange(node + 1, window_ends[node])
+            others = others[lengths[others] >= minimum]
+            if len(others) == 0:
+                continue
+            rates = bit_error_rates(prints, lengths, node, others)
+            for other in others[rates <= config.DUPLICATE_MAX_BIT_ERRORS]:
+                parent[root(int(other))] = root(node)
+        
+        groups = {}
+        for node in range(len(candidates)):
+            groups.setdefault(root(node), []).append(node)
+        clusters = [DuplicateCluster([candidates[node] for node in nodes],
+                                     len({hashes[node] for node in nodes}) == 1 and hashes[nodes[0]] is not None)
+                    for nodes in groups.values() if len(nodes) > 1]
+        clusters.sort(key=lambda cluster: len(cluster.file_paths), reverse=True)
+        return clusters
+
+class DuplicatesWidget(QWidget):
+    """Tab listing duplicate clusters; double-clicking a copy plays it"""
+    
+    find_requested = pyqtSignal()
+    track_activated = pyqtSignal(str)  # File path
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.init_ui()
+    
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+        
+        title = QLabel("🧬 Duplicate Tracks")
+        title.setStyleSheet("font-weight: bold; font-size: 14px; color: #FFD700;")
+        layout.addWidget(title)
+        
+        self.find_button = QPushButton("🔍 Find Duplicates")
+        self.find_button.clicked.connect(self.find_requested.emit)
+        layout.addWidget(self.find_button)
+        
+        self.status_label = QLabel("Scan the playlist for tracks ripped more than once")
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+        
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.itemDoubleClicked.connect(self.on_item_double_clicked)
+        layout.addWidget(self.tree)
+    
+    def set_scanning(self, scanning):
+        self.find_button.setEnabled(not scanning)
+        if scanning:
+            self.status_label.setText("Checking the playlist for duplicates...")
+    
+    def set_progress(self, done, total):
+        self.status_label.setText(f"Checking candidates: {done}/{total}")
+    
+    def show_clusters(self, clusters):
+        """List clusters, one expandable entry per recording"""
+        self.set_scanning(False)
+        self.tree.clear()
+        for cluster in clusters:
+            kind = "Identical audio" if cluster.identical else "Same recording"
+            parent = QTreeWidgetItem([f"{kind} ×{len(cluster.file_paths)}: {os.path.basename(cluster.file_paths[0])}"])
+            for file_path in cluster.file_paths:
+                child = QTreeWidgetItem([file_path])
+                child.setData(0, Qt.ItemDataRole.UserRole, file_path)
+                child.setToolTip(0, file_path)
+                parent.addChild(child)
+            self.tree.addTopLevelItem(parent)
+            parent.setExpanded(True)
+        copies = sum(len(cluster.file_paths) - 1 for cluster in clusters)
+        self.status_label.setText(f"Found {len(clusters)} duplicated tracks ({copies} extra copies)"
+                                  if clusters else "No duplicates found")
+    
+    def on_item_double_clicked(self, item, column):
+        file_path = item.data(0, Qt.ItemDataRole.UserRole)
+        if file_path:
+            self.track_activated.emit(file_path)
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+Equalizer for ChakraBeats
+Parametric multi-band EQ as cascaded biquads applied to whole PCM blocks
+"""
+
+import numpy as np
+from scipy.signal import sosfilt
+
+import config
+
+def peaking(frequency, gain_db, q, sample_rate):
+    """RBJ peaking EQ biquad as one SOS row"""
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * frequency / sample_rate
+    alpha = np.sin(w0) / (2 * q)
+    cos_w0 = np.cos(w0)
+    a0 = 1 + alpha / a
+    return [(1 + alpha * a) / a0, -2 * cos_w0 / a0, (1 - alpha * a) / a0,
+            1.0, -2 * cos_w0 / a0, (1 - alpha / a) / a0]
+
+def shelf(frequency, gain_db, sample_rate, high):
+    """RBJ low or high shelf biquad (slope 1) as one SOS row"""
+    a = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * frequency / sample_rate
+    alpha = np.sin(w0) / np.sqrt(2)
+    cos_w0 = np.cos(w0) if not high else -np.cos(w0)
+    root = 2 * np.sqrt(a) * alpha
+    
+    # The high shelf is the low shelf with cos(w0) and b1/a1 mirrored
+    b0 = a * ((a + 1) - (a - 1) * cos_w0 + root)
+    b1 = 2 * a * ((a - 1) - (a + 1) * cos_w0)
+    b2 = a * ((a + 1) - (a - 1) * cos_w0 - root)
+    a0 = (a + 1) + (a - 1) * cos_w0 + root
+    a1 = -2 * ((a - 1) + (a + 1) * cos_w0)
+    a2 = (a + 1) + (a - 1) * cos_w0 - root
+    if high:
+        b1, a1 = -b1, -a1
+    return [b0 / a0, b1 / a0, b2 / a0, 1.0, a1 / a0, a2 / a0]
+
+def design(gains, sample_rate, frequencies=config.EQ_BANDS, q=config.EQ_Q):
+    """SOS cascade for per-band gains: low shelf, peaking bands, high shelf"""
+    sections = []
+    for index, (frequency, gain_db) in enumerate(zip(frequencies, gains)):
+        if gain_db == 0 or frequency >= sample_rate / 2:
+            continue
+        if index == 0:
+            sections.append(shelf(frequency, gain_db, sample_rate, high=False))
+        elif index == len(frequencies) - 1:
+            sections.append(shelf(frequency, gain_db, sample_rate, high=True))
+        else:
+            sections.append(peaking(frequency, gain_db, q, sample_rate))
+    return np.array(sections, dtype=np.float64).reshape(-1, 6)
+
+class Equalizer:
+    """Block EQ whose filter state carries across blocks, seeks excepted"""
+    
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.sos = np.zeros((0, 6))
+        self.preamp = 1.0
+        self.state = None
+    
+    def set_gains(self, gains):
+        """Set per-band gains in dB (None or all zeros bypasses the EQ)"""
+        gains = list(gains or [])
+        sos = design(gains, self.sample_rate)
+        if len(sos) != len(self.sos):
+            self.state = None
+        self.sos = sos
+        
+        # Headroom for the largest boost so a loud master does not clip
+        self.preamp = 10 ** (-max([0] + gains) / 20)
+    
+    @property
+    def active(self):
+        return len(self.sos) > 0
+    
+    def reset(self):
+        """Forget filter history (after a seek or track change)"""
+        self.state = None
+    
+    def process(self, block):
+        """Filter a (frames, channels) block, continuing from the previous one"""
+        if not self.active or len(block) == 0:
+            return block
+        if self.state is None or self.state.shape[2] != block.shape[1]:
+            self.state = np.zeros((len(self.sos), 2, block.shape[1]))
+        
+        filtered, self.state = sosfilt(self.sos, block, axis=0, zi=self.state)
+        filtered *= self.preamp
+        return filtered
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+ID3 Reader for ChakraBeats
+Header-only ID3v2/ID3v1 text reader that seeks past artwork and other binary frames
+"""
+
+# Bytes fetched per read; text frames usually sit together near the tag start
+READ_CHUNK = 4096
+
+# Frame IDs of the fields the playlist shows, for ID3v2.3/2.4 and the three-letter v2.2 IDs
+TEXT_FRAMES = {
+    "TIT2": "title", "TT2": "title",
+    "TPE1": "artist", "TP1": "artist",
+    "TALB": "album", "TAL": "album",
+    "TDRC": "year", "TYER": "year", "TYE": "year",
+    "TCON": "genre", "TCO": "genre",
+    "TRCK": "track_number", "TRK": "track_number",
+}
+COMMENT_FRAMES = {"COMM", "COM"}
+
+ENCODINGS = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}
+
+class ChunkReader:
+    """Reads byte ranges of a file through one small buffer, never past a limit"""
+    
+    def __init__(self, file, limit):
+        self.file = file
+        self.limit = limit
+        self.start = 0
+        self.data = b""
+    
+    def get(self, offset, length):
+        """Bytes offset:offset + length, fetching a fresh chunk only if they are not buffered"""
+        if offset < self.start or offset + length > self.start + len(self.data):
+            self.file.seek(offset)
+            self.data = self.file.read(max(0, min(max(length, READ_CHUNK), self.limit - offset)))
+            self.start = offset
+        return self.data[offset - self.start:offset - self.start + length]
+
+def syncsafe(data):
+    """Decode a 28-bit syncsafe integer"""
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def decode_text(data):
+    """Decode an ID3 text payload (encoding byte first); multiple values are joined with '/'"""
+    if not data:
+        return ""
+    encoding = ENCODINGS.get(data[0], "latin-1")
+    text = data[1:].decode(encoding, errors="replace")
+    # In ID3v2.4 every UTF-16 value carries its own byte order mark
+    return "/".join(value.lstrip("\ufeff") for value in text.split("\x00") if value.lstrip("\ufeff"))
+
+def decode_comment(data):
+    """Decode a COMM payload: encoding, language, description, text"""
+    if len(data) < 4:
+        return ""
+    encoding = ENCODINGS.get(data[0], "latin-1")
+    separator = b"\x00\x00" if data[0] in (1, 2) else b"\x00"
+    body = data[4:]
+    # The terminator of a UTF-16 description is aligned to the character size
+    end = body.find(separator)
+    while separator == b"\x00\x00" and end >= 0 and end % 2:
+        end = body.find(separator, end + 1)
+    text = body[end + len(separator):] if end >= 0 else body
+    return text.decode(encoding, errors="replace").strip("\x00")
+
+def read_id3v2(file):
+    """Text fields from a leading ID3v2 tag, {} without one, or None if only a full parser can read it"""
+    file.seek(0)
+    header = file.read(10)
+    if len(header) < 10 or header[:3] != b"ID3" or header[3] not in (2, 3, 4):
+        return {}
+    version, flags = header[3], header[5]
+    if flags & 0x80 and version < 4:
+        return None  # Whole-tag unsynchronisation
+    
+    end = 10 + syncsafe(header[6:10])
+    reader = ChunkReader(file, end)
+    position = 10
+    if flags & 0x40 and version >= 3:
+        # Skip the extended header (its size includes itself in v2.4 but not in v2.3)
+        size_bytes = reader.get(position, 4)
+        position += syncsafe(size_bytes) if version == 4 else 4 + int.from_bytes(size_bytes, "big")
+    
+    id_length, header_length = (3, 6) if version == 2 else (4, 10)
+    fields = {}
+    while position + header_length <= end:
+        frame_header = reader.get(position, header_length)
+        frame_id = frame_header[:id_length]
+        if not frame_id.strip(b"\x00") or not frame_id.isalnum():
+            break  # Padding
+        if version == 2:
+            size = int.from_bytes(frame_header[3:6], "big")
+        elif version == 4:
+            size = syncsafe(frame_header[4:8])
+        else:
+            size = int.from_bytes(frame_header[4:8], "big")
+        
+        frame_id = frame_id.decode("latin-1")
+        body = position + header_length
+        position = body + size  # Everything else, APIC included, is skipped unread
+        if frame_id not in TEXT_FRAMES and frame_id not in COMMENT_FRAMES:
+            continue
+        if version >= 3 and frame_header[9] & (0x4F if version == 4 else 0xE0):
+            continue  # Compressed, encrypted or unsynchronised frame
+        
+        data = reader.get(body, size)
+        if frame_id in COMMENT_FRAMES:
+            fields.setdefault("quote", decode_comment(data))
+        else:
+            fields.setdefault(TEXT_FRAMES[frame_id], decode_text(data))
+    return fields
+
+def read_id3v1(file):
+    """Text fields from a trailing 128-byte ID3v1 tag, or {}"""
+    try:
+        file.seek(-128, 2)
+    except OSError:
+        return {}
+    tag = file.read(128)
+    if tag[:3] != b"TAG":
+        return {}
+    text = lambda start, length: tag[start:start + length].split(b"\x00")[0].decode("latin-1").strip()
+    fields = {"title": text(3, 30), "artist": text(33, 30), "album": text(63, 30), "year": text(93, 4)}
+    if tag[125] == 0 and tag[126]:
+        fields["track_number"] = str(tag[126])  # ID3v1.1
+    return {name: value for name, value in fields.items() if value}
+
+def read_tags(file_path):
+    """Display fields of an MP3 (title, artist, ...), or None if the tag needs the full parser"""
+    with open(file_path, "rb", buffering=0) as file:
+        fields = read_id3v2(file)
+        if fields is None:
+            return None
+        if not fields:
+            fields = read_id3v1(file)
+        return fields
\ No newline at end of file
@@ -56,7 +56,7 @@ if errorlevel 1 (
     echo pip install mutagen==1.47.0
     echo pip install Pillow==10.1.0
     echo pip install numpy==1.24.3
-    echo pip install matplotlib==3.7.2
+    echo pip install scipy==1.10.1
     echo.
     pause
     exit /b 1
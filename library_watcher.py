@@ -0,0 +1,214 @@
+"""
+Library Watcher for ChakraBeats
+Watches the folders of playlist tracks and reports added, removed, renamed and retagged files in batches
+"""
+
+import os
+import json
+import threading
+from PyQt6.QtCore import QThread, QTimer, QFileSystemWatcher, pyqtSignal
+
+import config
+import audio_formats
+
+class LibraryChanges:
+    """One coalesced batch of changes on disk"""
+    
+    def __init__(self):
+        self.added = []  # New audio files in watched folders, or playlist tracks that came back
+        self.removed = []  # Files that are gone
+        self.changed = []  # Files whose size or modification time changed, e.g. retagged
+        self.renamed = []  # (old path, new path) pairs
+    
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed or self.renamed)
+
+def list_directory(directory, extensions):
+    """Audio files of a folder as {name: [size, mtime_ns]}, or None if it cannot be read"""
+    listing = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        listing[entry.name] = [stat.st_size, stat.st_mtime_ns]
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    return listing
+
+class LibraryWatcher(QThread):
+    """Folder watcher whose events are coalesced and diffed against the last listing in a worker thread"""
+    
+    changes_ready = pyqtSignal(object)  # LibraryChanges
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher()
+        self.watcher.directoryChanged.connect(self.mark_dirty)
+        self.watcher.fileChanged.connect(lambda file_path: self.mark_dirty(os.path.dirname(file_path)))
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+        
+        self.extensions = set(audio_formats.supported_extensions())
+        self.lock = threading.Lock()
+        self.tracked = {}  # Directory -> names of playlist tracks in it
+        self.listings = {}  # Directory -> listing at its last scan
+        self.baseline = {}  # Directory -> listing saved by the last session, diffed by its first scan
+        self.dirty = set()  # Directories changed since the last batch
+        self.pending = set()  # Directories waiting for the worker
+        self.active = False
+        self.stopping = False
+    
+    def track(self, file_paths):
+        """Watch the folders (and, within limits, the files) of playlist tracks, scanning new folders"""
+        new_directories = set()
+        with self.lock:
+            for file_path in file_paths:
+                directory, name = os.path.split(file_path)
+                names = self.tracked.get(directory)
+                if names is None:
+                    names = self.tracked[directory] = set()
+                    new_directories.add(directory)
+                names.add(name)
+        
+        if new_directories:
+            self.watcher.addPaths(sorted(new_directories))
+        # Folder events miss tags rewritten in place, so watch files too while inotify watches last
+        room = config.WATCH_FILE_LIMIT - len(self.watcher.files())
+        if room > 0:
+            self.watcher.addPaths(list(file_paths)[:room])
+        for directory in new_directories:
+            self.mark_dirty(directory)
+    
+    def clear(self):
+        """Stop watching everything"""
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        if self.watcher.files():
+            self.watcher.removePaths(self.watcher.files())
+        self.timer.stop()
+        self.dirty.clear()
+        with self.lock:
+            self.tracked.clear()
+            self.listings.clear()
+            self.baseline.clear()
+            self.pending.clear()
+    
+    def mark_dirty(self, directory):
+        """Note a changed folder; a burst of events becomes one batch"""
+        self.dirty.add(directory)
+        self.timer.start(config.WATCH_COALESCE_MS)
+    
+    def flush(self):
+        """Hand the changed folders to the worker"""
+        with self.lock:
+            self.pending |= self.dirty
+            self.dirty.clear()
+            if self.active or not self.pending:
+                return
+            self.active = True
+        
+        self.wait()
+        self.start(QThread.Priority.LowPriority)
+    
+    def stop(self):
+        """Stop scanning; folders not scanned yet are scanned next session"""
+        self.stopping = True
+        self.timer.stop()
+        self.wait()
+    
+    def save(self, path):
+        """Write the folder listings so the next session can tell what changed while it was closed"""
+        with self.lock:
+            listings = dict(self.baseline)
+            listings.update(self.listings)
+            listings = {directory: listing for directory, listing in listings.items() if directory in self.tracked}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(listings, f)
+        os.replace(tmp_path, path)
+    
+    def load(self, path):
+        """Read the listings saved by the last session"""
+        with open(path, "r") as f:
+            self.baseline = json.load(f)
+    
+    def run(self):
+        while not self.stopping:
+            with self.lock:
+                batch, self.pending = self.pending, set()
+                if not batch:
+                    self.active = False
+                    return
+            
+            changes = LibraryChanges()
+            gone = {}  # (size, mtime_ns) -> removed path, to recognise renames
+            for directory in sorted(batch):
+                self.scan_directory(directory, changes, gone)
+            
+            # A file that vanished and one that appeared with the same size and time were renamed
+            added = []
+            for file_path, stat in changes.added:
+                old_path = gone.pop(stat, None) if stat is not None else None
+                if old_path is not None:
+                    changes.renamed.append((old_path, file_path))
+                    changes.removed.remove(old_path)
+                    self.retrack(old_path, file_path)
+                else:
+                    added.append(file_path)
+            changes.added = added
+            
+            if changes:
+                self.changes_ready.emit(changes)
+        
+        with self.lock:
+            self.active = False
+    
+    def scan_directory(self, directory, changes, gone):
+        """Diff a folder against its previous listing, or check its tracks exist on a first scan"""
+        listing = list_directory(directory, self.extensions)
+        with self.lock:
+            previous = self.listings.get(directory)
+            first_scan = previous is None
+            if first_scan:
+                previous = self.baseline.pop(directory, None)
+            tracked = set(self.tracked.get(directory, ()))
+            if listing is not None:
+                self.listings[directory] = listing
+            else:
+                self.listings.pop(directory, None)
+        listing = listing or {}
+        
+        if previous is None:
+            # Nothing to compare with: only report tracks that are missing
+            changes.removed.extend(os.path.join(directory, name) for name in sorted(tracked - listing.keys()))
+            return
+        if first_scan:
+            # Tracks already missing when the listing was saved are still missing
+            changes.removed.extend(os.path.join(directory, name)
+                                   for name in sorted(tracked - listing.keys() - previous.keys()))
+        
+        for name, stat in listing.items():
+            file_path = os.path.join(directory, name)
+            old_stat = previous.get(name)
+            if old_stat is None:
+                changes.added.append((file_path, tuple(stat)))
+            elif old_stat != stat:
+                changes.changed.append(file_path)
+        for name in previous.keys() - listing.keys():
+            file_path = os.path.join(directory, name)
+            changes.removed.append(file_path)
+            gone[tuple(previous[name])] = file_path
+    
+    def retrack(self, old_path, new_path):
+        with self.lock:
+            directory, name = os.path.split(old_path)
+            self.tracked.get(directory, set()).discard(name)
+            directory, name = os.path.split(new_path)
+            self.tracked.setdefault(directory, set()).add(name)
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""
+Loudness Analysis for ChakraBeats
+EBU R128 / ITU-R BS.1770 loudness scanning with cached ReplayGain-style gains
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from scipy.signal import sosfilt
+from PyQt6.QtCore import pyqtSignal
+
+import config
+from audio_decoder import open_pcm_stream
+from scheduler import ScheduledWorker, PRIORITY_LIBRARY
+
+# BS.1770 gating
+BLOCK_SECONDS = 0.4
+STEP_SECONDS = 0.1
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Block loudness histogram used to combine tracks into album loudness
+HISTOGRAM_FLOOR = ABSOLUTE_GATE
+HISTOGRAM_STEP = 0.1
+HISTOGRAM_BINS = 800
+
+# Results are checkpointed to disk this often while scanning
+CHECKPOINT_TRACKS = 10
+CHECKPOINT_SECONDS = 5.0
+
+def k_weighting(sample_rate):
+    """BS.1770 K-weighting (head shelf + RLB high-pass) as SOS for any rate"""
+    # Bilinear designs matching the 48 kHz coefficients published in BS.1770
+    k = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    
+    k = np.tan(np.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, high_pass])
+
+def power_to_lufs(power):
+    """Convert mean-square block power to LUFS"""
+    return -0.691 + 10 * np.log10(np.maximum(power, 1e-12))
+
+def lufs_to_power(loudness):
+    """Convert LUFS back to mean-square block power"""
+    return 10 ** ((np.asarray(loudness) + 0.691) / 10)
+
+def gated_loudness(block_power):
+    """Integrated loudness of a set of 400 ms block powers"""
+    block_power = block_power[power_to_lufs(block_power) > ABSOLUTE_GATE]
+    if len(block_power) == 0:
+        return ABSOLUTE_GATE
+    threshold = power_to_lufs(block_power.mean()) + RELATIVE_GATE
+    block_power = block_power[power_to_lufs(block_power) > threshold]
+    return float(power_to_lufs(block_power.mean()))
+
+def histogram_loudness(histogram):
+    """Integrated loudness from a block loudness histogram"""
+    centres = HISTOGRAM_FLOOR + (np.arange(HISTOGRAM_BINS) + 0.5) * HISTOGRAM_STEP
+    power = lufs_to_power(centres)
+    total = histogram.sum()
+    if total == 0:
+        return ABSOLUTE_GATE
+    
+    threshold = power_to_lufs((histogram * power).sum() / total) + RELATIVE_GATE
+    gated = np.where(centres > threshold, histogram, 0)
+    if gated.sum() == 0:
+        return ABSOLUTE_GATE
+    return float(power_to_lufs((gated * power).sum() / gated.sum()))
+
+def gain_for(loudness, peak):
+    """Gain in dB that brings loudness to the reference without clipping"""
+    gain = config.REPLAY_GAIN_REFERENCE - loudness
+    if peak > 0:
+        gain = min(gain, -20 * np.log10(peak))
+    return float(gain)
+
+class LoudnessResult:
+    """Integrated loudness, sample peak and block histogram of one track"""
+    
+    def __init__(self, loudness, peak, histogram):
+        self.loudness = loudness
+        self.peak = peak
+        self.histogram = histogram
+
+def measure_track(file_path):
+    """Measure a track with K-weighted 100 ms sub-blocks in one streaming pass"""
+    with open_pcm_stream(file_path) as stream:
+        sample_rate = stream.sample_rate
+        step = max(1, int(round(STEP_SECONDS * sample_rate)))
+        sos = k_weighting(sample_rate)
+        state = np.zeros((sos.shape[0], 2, stream.channels))
+        carry = np.zeros((0, stream.channels))
+        sub_blocks = []
+        peak = 0.0
+        
+        for block in stream.blocks():
+            peak = max(peak, float(np.abs(block).max()))
+            filtered, state = sosfilt(sos, block, axis=0, zi=state)
+            
+            # Mean square of every complete 100 ms step, carried across blocks
+            squares = np.concatenate((carry, np.square(filtered)))
+            complete = len(squares) // step * step
+            sub_blocks.append(squares[:complete].reshape(-1, step, stream.channels).mean(axis=1))
+            carry = squares[complete:]
+    
+    steps_per_block = int(round(BLOCK_SECONDS / STEP_SECONDS))
+    sub_blocks = np.concatenate(sub_blocks) if sub_blocks else np.zeros((0, 1))
+    if len(sub_blocks) < steps_per_block:
+        return LoudnessResult(ABSOLUTE_GATE, peak, np.zeros(HISTOGRAM_BINS, dtype=np.int32))
+    
+    # Overlapping 400 ms blocks are means of 4 consecutive steps (channel weights 1.0)
+    channel_power = sub_blocks.sum(axis=1)
+    cumulative = np.concatenate(([0.0], np.cumsum(channel_power)))
+    block_power = (cumulative[steps_per_block:] - cumulative[:-steps_per_block]) / steps_per_block
+    
+    bins = np.floor((power_to_lufs(block_power) - HISTOGRAM_FLOOR) / HISTOGRAM_STEP).astype(np.int64)
+    bins = bins[(bins >= 0) & (bins < HISTOGRAM_BINS)]
+    histogram = np.bincount(bins, minlength=HISTOGRAM_BINS).astype(np.int32)
+    return LoudnessResult(gated_loudness(block_power), peak, histogram)
+
+class LoudnessStore:
+    """Persistent loudness results, kept next to the other ChakraBeats data files"""
+    
+    def __init__(self, path=None):
+        self.path = path or config.get_loudness_path()
+        self.entries = {}
+        self.album_gains = {}
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """Load stored results"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+        except Exception as e:
+            print(f"Error loading loudness data: {e}")
+    
+    def save(self):
+        """Write results atomically so an interrupted scan can resume"""
+        with self.lock:
+            snapshot = dict(self.entries)
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving loudness data: {e}")
+    
+    def is_current(self, file_path):
+        """True if the stored result still matches the file on disk"""
+        entry = self.entries.get(file_path)
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        return entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns
+    
+    def put(self, file_path, result):
+        """Record a measured track"""
+        stat = os.stat(file_path)
+        try:
+            np.save(config.get_track_cache_path("loudness", file_path, ".npy"), result.histogram)
+        except OSError as e:
+            print(f"Error saving loudness histogram for {file_path}: {e}")
+        
+        with self.lock:
+            self.entries[file_path] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime_ns,
+                "loudness": round(result.loudness, 2),
+                "peak": round(result.peak, 5)
+            }
+            self.album_gains.clear()
+    
+    def track_gain(self, file_path):
+        """Track gain in dB, or None if the track has not been scanned since it last changed"""
+        if not self.is_current(file_path):
+            return None
+        entry = self.entries[file_path]
+        return gain_for(entry["loudness"], entry["peak"])
+    
+    def album_gain(self, file_paths):
+        """Album gain in dB from the merged block histograms of its tracks (stale results are left out)"""
+        key = tuple(sorted(file_path for file_path in file_paths if self.is_current(file_path)))
+        if key in self.album_gains:
+            return self.album_gains[key]
+        
+        histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+        peak = 0.0
+        for file_path in key:
+            entry = self.entries[file_path]
+            try:
+                histogram += np.load(config.get_track_cache_path("loudness", file_path, ".npy"))
+            except (OSError, ValueError):
+                continue
+            peak = max(peak, entry["peak"])
+        
+        gain = gain_for(histogram_loudness(histogram), peak) if histogram.any() else None
+        self.album_gains[key] = gain
+        return gain
+
+class LoudnessScanner(ScheduledWorker):
+    """Resumable, incremental batch scanner running on the scheduler's processes"""
+    
+    track_scanned = pyqtSignal(str)
+    
+    def __init__(self, store, scheduler, parent=None):
+        super().__init__(scheduler, parent)
+        self.store = store
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+    
+    def scan(self, file_paths, priority=PRIORITY_LIBRARY):
+        """Queue tracks whose stored loudness is missing or stale"""
+        self.enqueue(file_paths, priority)
+    
+    def start_job(self, file_path, priority):
+        if self.store.is_current(file_path):
+            return None
+        return self.scheduler.submit(measure_track, file_path, priority=priority)
+    
+    def job_done(self, file_path, future, priority):
+        try:
+            self.store.put(file_path, future.result())
+            self.unsaved += 1
+            self.track_scanned.emit(file_path)
+        except Exception as e:
+            print(f"Error scanning loudness of {file_path}: {e}")
+        
+        if self.unsaved >= CHECKPOINT_TRACKS or time.monotonic() - self.last_save > CHECKPOINT_SECONDS:
+            self.idle()
+    
+    def idle(self):
+        if self.unsaved:
+            self.store.save()
+        self.unsaved = 0
+        self.last_save = time.monotonic()
\ No newline at end of file
@@ -7,27 +7,44 @@ A spiritual audio experience for otakus, creators, and warriors of rhythm.
 import sys
 import os
 import json
+import time
 import random
+import threading
 from pathlib import Path
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QPushButton, QSlider, 
-                             QFileDialog, QListWidget, QListWidgetItem,
+                             QFileDialog, QListView,
                              QFrame, QProgressBar, QComboBox, QCheckBox,
-                             QTextEdit, QSplitter, QScrollArea, QTabWidget)
-from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal, QPropertyAnimation, QEasingCurve
-from PyQt6.QtGui import QFont, QPalette, QColor, QPixmap, QPainter, QBrush, QLinearGradient
+                             QTextEdit, QSplitter, QScrollArea, QTabWidget, QSpinBox, QLineEdit,
+                             QInputDialog, QMessageBox)
+from PyQt6.QtCore import Qt, QTimer, QThread, QSize, pyqtSignal, QPropertyAnimation, QEasingCurve
+from PyQt6.QtGui import QFont, QPalette, QColor, QPixmap, QIcon, QPainter, QBrush, QLinearGradient
 import pygame
-from mutagen.mp3 import MP3
-from mutagen.wave import WAVE
-from mutagen.oggvorbis import OggVorbis
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
 
 # Import our custom modules
 from visualizer import ChakraVisualizer, VisualizerModeSelector
 from metadata_handler import MetadataHandler, MetadataDisplayWidget, PlaylistMetadataManager
+from waveform_overview import WaveformCache, WaveformAnalysisThread, WaveformSeekBar
+from album_art import AlbumArtCache, AlbumArtThread
+from search_index import SearchIndex
+from playlist_model import PlaylistModel, SORT_COLUMNS
+from smart_playlists import SmartPlaylists, FIELDS, parse_rules, describe_rules
+from shuffle import ShuffleEngine, SHUFFLE_MODES
+from play_stats import PlayStats, StatsWriter, STATS_VIEWS
+from library_watcher import LibraryWatcher
+from duplicates import DuplicateStore, DuplicateFinder, DuplicatesWidget
+from similarity import SimilarityStore, SimilarityIndex, SimilarityScanner
+from scheduler import JobScheduler, PRIORITY_PLAYING
+from beat_detector import BeatCache, BeatAnalysisThread, BeatTracker
+from loudness import LoudnessStore, LoudnessScanner
+from mp3_index import SeekIndexThread
+from audio_decoder import open_pcm_stream, native_sample_rate, decode_native, MIXER_BUFFER
+from playback_engine import PcmOutput, CrossfadeMixer, QueueDepthTuner, PcmHistory
+from decoder_process import DecoderProcess, RingPcmStream
+from equalizer import Equalizer
+import audio_formats
+import config
 
 class ChakraTheme:
     """Chakra-themed color schemes and styling"""
@@ -68,79 +85,398 @@ class ChakraTheme:
     ]
 
 class AudioPlayer(QThread):
-    """Audio playback thread with pygame"""
+    """Audio playback thread feeding decoded PCM blocks to pygame"""
     
     track_changed = pyqtSignal(str)
     position_changed = pyqtSignal(int)
     playback_finished = pyqtSignal()
     
-    def __init__(self):
+    def __init__(self, scheduler):
         super().__init__()
-        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+        self.scheduler = scheduler
+        pygame.mixer.init(frequency=config.OUTPUT_SAMPLE_RATE, size=-16, channels=2, buffer=MIXER_BUFFER)
+        self.output = PcmOutput()
+        self.stream = None
+        self.lock = threading.Lock()
+        self.device_lock = threading.Lock()  # Held while SDL decodes or the device is re-opened
+        self.follow_file_rate = False
+        self.decoder = DecoderProcess()  # Started only once the option is turned on
+        self.use_decoder_process = False
+        self.running = True
         self.current_file = None
         self.is_playing = False
         self.is_paused = False
         self.position = 0
         self.duration = 0
-        
-    def load_file(self, file_path):
-        """Load and prepare audio file"""
+        self.volume = config.DEFAULT_VOLUME
+        self.gain = 1.0  # Linear ReplayGain factor for the current track
+        self.stream_ended = False
+        self.pending_open = None  # (file path, position, load generation)
+        self.load_generation = 0
+        
+        # Track transitions: the pre-opened next track and the crossfade stage
+        self.mixer = CrossfadeMixer(self.output.block_frames, self.output.channels, self.output.sample_rate)
+        self.next_stream = None
+        self.next_file = None
+        self.next_gain = 1.0
+        self.crossfade_seconds = config.DEFAULT_CROSSFADE_SECONDS
+        self.set_crossfade(self.crossfade_seconds)
+        
+        # DSP between decode and output
+        self.equalizer = Equalizer(self.output.sample_rate)
+        self.eq_gains = None
+        
+        # What was last sent to the output, so the visualizer sees the audio actually playing
+        self.history = PcmHistory(config.VISUALIZER_FFT_FRAMES + 3 * config.OUTPUT_BLOCK_MAX_FRAMES,
+                                  self.output.channels)
+        
+        # Block size of the queue ahead of the device buffer follows the load the machine is under
+        self.tuner = QueueDepthTuner(self.output.block_frames, self.output.sample_rate)
+        
+    def load_file(self, file_path, play=False):
+        """Open a track in the background and make it current, starting it if asked"""
+        with self.lock:
+            self.load_generation += 1
+            generation = self.load_generation
+        # Opening may decode a whole file, so keep it off the GUI and playback threads
+        self.scheduler.submit(self.open_stream, file_path, 0, generation, play,
+                              priority=PRIORITY_PLAYING, kind="io")
+    
+    def prepare(self, file_path, position=0):
+        """Open a track in the playback thread and park it at a position, ready to play"""
+        with self.lock:
+            self.load_generation += 1
+            self.pending_open = (file_path, position, self.load_generation)
+    
+    def open_stream(self, file_path, position, generation, play=False):
+        """Decode a track and make it current unless a newer load superseded it"""
         try:
-            pygame.mixer.music.load(file_path)
+            with self.device_lock:
+                if self.follow_file_rate:
+                    self.match_output_rate(file_path)
+                stream = self.open_pcm(file_path)
+        except Exception as e:
+            print(f"Error loading file: {e}")
+            return
+        
+        with self.lock:
+            if generation != self.load_generation:
+                stream.close()
+                return
+            
+            if self.stream:
+                self.stream.close()
+            self.mixer.cancel()
+            self.drop_next()
+            self.stream = stream
+            self.is_playing = play
+            self.is_paused = False
             self.current_file = file_path
-            self.track_changed.emit(file_path)
+            self.duration = stream.duration_ms
             
-            # Get duration
-            if file_path.lower().endswith('.mp3'):
-                audio = MP3(file_path)
-            elif file_path.lower().endswith('.wav'):
-                audio = WAVE(file_path)
-            elif file_path.lower().endswith('.ogg'):
-                audio = OggVorbis(file_path)
-            else:
-                self.duration = 0
+            # Resume goes through the same path as a user seek
+            position = max(0, min(position, self.duration))
+            self.seek_frame(int(position * self.output.sample_rate / 1000))
+            self.position = position
+        
+        self.track_changed.emit(file_path)
+        self.position_changed.emit(position)
+    
+    def open_pcm(self, file_path):
+        """Open a track at the output rate, in the decoder process if that is enabled"""
+        if self.use_decoder_process:
+            return self.decoder.open(file_path, self.output.sample_rate)
+        # SDL here decodes at the device rate, so files at another rate are decoded natively in a worker
+        return open_pcm_stream(file_path, self.output.sample_rate, self.decode_elsewhere)
+    
+    def decode_elsewhere(self, file_path):
+        """Decode a whole file at its own rate in the CPU pool (called on an I/O thread)"""
+        return self.scheduler.submit(decode_native, file_path, priority=PRIORITY_PLAYING).result()
+    
+    def set_next(self, file_path, gain_db=None):
+        """Pre-open the track that follows, for a gapless or crossfaded transition"""
+        with self.lock:
+            generation = self.load_generation
+        
+        def open_next():
+            try:
+                with self.device_lock:
+                    stream = self.open_pcm(file_path)
+            except Exception as e:
+                print(f"Error preparing next track: {e}")
                 return
-                
-            self.duration = int(audio.info.length * 1000)  # Convert to milliseconds
-        except Exception as e:
-            print(f"Error loading file: {e}")
+            with self.lock:
+                if generation != self.load_generation:
+                    # The current track changed meanwhile; the new one queues its own follower
+                    stream.close()
+                    return
+                self.drop_next()
+                self.next_stream = stream
+                self.next_file = file_path
+                self.next_gain = 10 ** (gain_db / 20.0) if gain_db is not None else 1.0
+        
+        # Opening may decode a whole file, so keep it off the playback thread
+        self.scheduler.submit(open_next, priority=PRIORITY_PLAYING, kind="io")
+    
+    def drop_next(self):
+        """Forget the pre-opened next track (caller holds the lock)"""
+        if self.next_stream:
+            self.next_stream.close()
+        self.next_stream = None
+        self.next_file = None
+    
+    def set_crossfade(self, seconds):
+        """Set the crossfade length; 0 gives gapless transitions"""
+        with self.lock:
+            self.crossfade_seconds = seconds
+            self.crossfade_frames = int(seconds * self.output.sample_rate)
+            if not self.mixer.active:
+                self.mixer.set_length(self.crossfade_frames)
+    
+    def set_equalizer(self, gains):
+        """Set the per-band EQ gains in dB (None bypasses the EQ)"""
+        with self.lock:
+            self.eq_gains = gains
+            self.equalizer.set_gains(gains)
+    
+    def set_block_frames(self, block_frames):
+        """Start from a known-good output block size (e.g. the last tuned one)"""
+        block_frames = max(config.OUTPUT_BLOCK_MIN_FRAMES, min(block_frames, config.OUTPUT_BLOCK_MAX_FRAMES))
+        with self.lock:
+            self.resize_output(block_frames)
+            self.tuner.block_frames = block_frames
+    
+    def resize_output(self, block_frames):
+        """Switch the output and crossfade buffers to a new block size (caller holds the lock)"""
+        self.output.allocate(block_frames)
+        self.mixer.allocate(block_frames)
+    
+    def output_stats(self):
+        """Underrun count, latency and queue depth tuning state of the output"""
+        return {
+            "underruns": self.output.underruns,
+            "latency_ms": self.output.latency_ms,
+            "block_frames": self.output.block_frames,
+            "jitter_ms": self.tuner.jitter * 1000
+        }
+    
+    def set_decoder_process(self, enabled):
+        """Decode tracks opened from now on in a separate process, away from the GUI's GIL"""
+        self.use_decoder_process = enabled
+    
+    def recent_pcm(self, frame_count):
+        """The frame_count frames just heard (None when not available)"""
+        with self.lock:
+            if not self.is_playing or not self.stream:
+                return None
+            if isinstance(self.stream, RingPcmStream) and not self.mixer.active:
+                # Straight from the decoder ring, without a copy
+                samples = self.stream.peek(self.output.clock.position_frames(), frame_count)
+                if samples is not None:
+                    return samples
+            queued = int(self.output.queued_seconds() * self.output.sample_rate)
+            return self.history.read(self.history.written - queued, frame_count)
+    
+    def set_follow_file_rate(self, enabled):
+        """Let the device rate follow each manually loaded track's native rate"""
+        self.follow_file_rate = enabled
+    
+    def match_output_rate(self, file_path):
+        """Re-open the device at the file's rate when supported (caller holds device_lock)"""
+        rate = native_sample_rate(file_path)
+        if rate not in config.OUTPUT_SAMPLE_RATES or rate == self.output.sample_rate:
+            return
+        
+        with self.lock:
+            # Everything decoded or sized for the old rate goes
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            self.mixer.cancel()
+            self.drop_next()
+            self.is_playing = False
+            self.output.reopen(rate)
+            
+            self.equalizer = Equalizer(rate)
+            self.equalizer.set_gains(self.eq_gains)
+            self.mixer = CrossfadeMixer(self.output.block_frames, self.output.channels, rate)
+            self.crossfade_frames = int(self.crossfade_seconds * rate)
+            self.mixer.set_length(self.crossfade_frames)
+            self.tuner.sample_rate = rate
+    
+    def advance(self, fade):
+        """Make the pre-opened next track current, fading from the old one if asked (caller holds the lock)"""
+        outgoing, outgoing_gain = self.stream, self.gain
+        remaining = max(0, outgoing.frames - outgoing.position)
+        
+        self.output.clock.shift(-outgoing.position)
+        self.stream, self.gain = self.next_stream, self.next_gain
+        self.current_file = self.next_file
+        self.duration = self.stream.duration_ms
+        self.stream_ended = False
+        self.next_stream = None
+        self.next_file = None
+        self.load_generation += 1
+        
+        if fade and self.crossfade_frames > 0 and remaining > 0:
+            self.mixer.set_length(self.crossfade_frames)
+            self.mixer.start(outgoing, outgoing_gain, self.stream, self.gain, remaining)
+        else:
+            outgoing.close()
+        return self.current_file
     
     def play(self):
         """Start playback"""
         if self.current_file:
-            pygame.mixer.music.play()
-            self.is_playing = True
-            self.is_paused = False
+            with self.lock:
+                if self.stream_ended:
+                    self.seek_frame(0)
+                self.is_playing = True
+                self.is_paused = False
     
     def pause(self):
         """Pause playback"""
         if self.is_playing:
-            pygame.mixer.music.pause()
-            self.is_paused = True
+            with self.lock:
+                self.output.pause()
+                self.is_paused = True
     
     def unpause(self):
         """Resume playback"""
         if self.is_paused:
-            pygame.mixer.music.unpause()
-            self.is_paused = False
+            with self.lock:
+                self.output.resume()
+                self.is_paused = False
     
     def stop(self):
         """Stop playback"""
-        pygame.mixer.music.stop()
-        self.is_playing = False
-        self.is_paused = False
-        self.position = 0
+        with self.lock:
+            self.is_playing = False
+            self.is_paused = False
+            if self.stream:
+                self.seek_frame(0)
+            self.position = 0
+        self.position_changed.emit(0)
     
     def set_volume(self, volume):
-        """Set volume (0.0 to 1.0)"""
-        pygame.mixer.music.set_volume(volume / 100.0)
+        """Set volume (0 to 100)"""
+        self.volume = volume
+    
+    def set_gain(self, gain_db):
+        """Set the per-track normalisation gain in dB (None disables it)"""
+        self.gain = 10 ** (gain_db / 20.0) if gain_db is not None else 1.0
     
     def seek(self, position):
         """Seek to position (in milliseconds)"""
         if self.current_file and self.duration > 0:
-            # Note: pygame doesn't support seeking, so we restart from position
-            # This is a limitation, but works for basic functionality
-            pass
+            position = max(0, min(position, self.duration))
+            with self.lock:
+                self.seek_frame(int(position * self.output.sample_rate / 1000))
+                self.position = position
+            self.position_changed.emit(position)
+    
+    def seek_frame(self, frame):
+        """Restart output from a stream frame (caller holds the lock)"""
+        self.output.flush()
+        self.history.clear()
+        self.mixer.cancel()
+        self.equalizer.reset()
+        self.stream.seek(frame)
+        self.stream_ended = False
+        self.output.clock.reset(frame)
+    
+    def submit(self, block, gain, now):
+        """Equalise a block, keep it for the visualizer and queue it on the output (caller holds the lock)"""
+        block = self.equalizer.process(block)
+        self.history.write(block)
+        self.output.submit(block, gain, now)
+    
+    def get_position(self):
+        """Interpolated playback position in milliseconds"""
+        return self.output.clock.position_ms()
+    
+    def shutdown(self):
+        """Stop the playback thread"""
+        self.running = False
+        self.wait()
+        self.output.flush()
+        with self.lock:
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+            self.mixer.cancel()
+            self.drop_next()
+        self.decoder.stop()
+    
+    def run(self):
+        """Keep the output fed and publish the position at a throttled rate"""
+        last_emit = 0.0
+        while self.running:
+            with self.lock:
+                pending, self.pending_open = self.pending_open, None
+            if pending:
+                self.open_stream(*pending)
+            
+            finished = False
+            changed = None
+            with self.lock:
+                if self.is_playing and not self.is_paused and self.stream:
+                    now = time.monotonic()
+                    while self.output.pump(now) and not self.stream_ended:
+                        if not self.output.idle:
+                            self.tuner.observe_slack(self.output.queued_seconds(now))
+                        if (self.next_stream and not self.mixer.active and
+                                self.stream.frames - self.stream.position <= self.crossfade_frames):
+                            changed = self.advance(fade=True)
+                        
+                        if self.mixer.active:
+                            block = self.mixer.read(self.output.block_frames)
+                            if len(block):
+                                self.submit(block, self.volume / 100.0, now)
+                                continue
+                            if self.mixer.active:
+                                break  # The incoming track is not decoded yet
+                        
+                        block = self.stream.read(self.output.block_frames)
+                        if len(block) == 0:
+                            if self.stream.waiting:
+                                # The decoder process is behind: try again next poll, not holding the lock
+                                break
+                            if self.next_stream:
+                                # Gapless: carry straight on with the next track
+                                changed = self.advance(fade=False)
+                                continue
+                            self.stream_ended = True
+                            break
+                        self.submit(block, self.volume / 100.0 * self.gain, now)
+                    
+                    if self.stream_ended and self.output.idle:
+                        self.is_playing = False
+                        finished = True
+                    
+                    block_frames = self.tuner.update(self.output.underruns, now)
+                    if block_frames:
+                        self.resize_output(block_frames)
+                    
+                    if now - last_emit >= config.POSITION_UPDATE_MS / 1000.0:
+                        last_emit = now
+                        position = self.output.clock.position_ms(now)
+                        if position != self.position:
+                            self.position = position
+                            self.position_changed.emit(position)
+            
+            if changed:
+                self.track_changed.emit(changed)
+            if finished:
+                self.position = self.duration
+                self.position_changed.emit(self.duration)
+                self.playback_finished.emit()
+            
+            poll = config.OUTPUT_POLL_MS / 1000.0
+            slept = time.monotonic()
+            time.sleep(poll)
+            if self.is_playing and not self.is_paused:
+                self.tuner.observe_wakeup(time.monotonic() - slept - poll)
 
 # Note: VisualizerWidget is now replaced by ChakraVisualizer from visualizer.py
 
@@ -149,29 +485,130 @@ class ChakraBeatsPlayer(QMainWindow):
     
     def __init__(self):
         super().__init__()
-        self.audio_player = AudioPlayer()
+        # Background work shares one set of pools, the playing track's jobs first
+        self.scheduler = JobScheduler()
+        self.last_underruns = 0
+        self.audio_player = AudioPlayer(self.scheduler)
         self.current_theme = "Kaminari Mode"
-        self.favorites = []
         self.playlist = []
         self.current_index = 0
         self.shuffle_mode = False
         self.repeat_mode = False
+        self.replay_gain_mode = config.DEFAULT_REPLAY_GAIN_MODE
+        self.last_played = ""
+        self.last_position = 0
+        self.last_checkpoint = None
+        self.crossfade_seconds = config.DEFAULT_CROSSFADE_SECONDS
+        self.eq_mode = config.DEFAULT_EQ_MODE
+        self.follow_file_rate = False
+        self.decoder_process = False
+        self.upcoming_index = None  # Playlist index pre-opened as the next track
+        self.shuffle = ShuffleEngine(artist_of=lambda track: self.playlist_model.keys["artist"][track],
+                                     weight_of=self.shuffle_weight)
+        self.counted_play = False  # The current track's play has been recorded
         
         # Initialize metadata manager
         self.metadata_manager = PlaylistMetadataManager()
         
+        # Waveform overviews for the seek bar, computed in the background
+        self.waveform_cache = WaveformCache()
+        self.waveform_thread = WaveformAnalysisThread(self.waveform_cache, self.scheduler)
+        self.waveform_thread.overview_ready.connect(self.on_waveform_ready)
+        
+        # Cover art thumbnails, made off the GUI thread and held within a memory budget
+        self.art_cache = AlbumArtCache()
+        self.art_thread = AlbumArtThread(self.scheduler)
+        self.art_thread.art_ready.connect(self.on_art_ready)
+        
+        # Playlist rows: sorted, grouped and filtered views over self.playlist
+        self.playlist_model = PlaylistModel()
+        self.playlist_model.decoration = self.playlist_art
+        self.metadata_manager.listeners.append(self.playlist_model.update_metadata)
+        
+        # Library search, fed by the metadata manager and kept on disk between sessions
+        self.search_index = self.load_search_index()
+        self.metadata_manager.listeners.append(self.search_index.add)
+        self.search_timer = QTimer()
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.apply_search)
+        
+        # Smart playlists, re-checked one track at a time as its facts change
+        self.smart_playlists = SmartPlaylists()
+        self.load_smart_playlists()
+        self.metadata_manager.listeners.append(self.update_smart_playlists)
+        self.scope_timer = QTimer()
+        self.scope_timer.setSingleShot(True)
+        self.scope_timer.timeout.connect(self.apply_scope)
+        
+        # Favorites and listening history, written in batches off the GUI thread
+        self.play_stats = PlayStats()
+        self.stats_writer = StatsWriter(self.play_stats)
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.stats_writer.flush)
+        self.stats_timer.start(config.STATS_FLUSH_MS)
+        
+        # Changes on disk, noticed by folder watches instead of existence sweeps
+        self.library_watcher = LibraryWatcher()
+        self.library_watcher.changes_ready.connect(self.on_library_changed)
+        try:
+            if os.path.exists(config.get_library_listing_path()):
+                self.library_watcher.load(config.get_library_listing_path())
+        except Exception as e:
+            print(f"Error loading library listings: {e}")
+        
+        # Duplicate rips, found on demand from durations, payload hashes and fingerprints
+        self.duplicate_store = DuplicateStore()
+        self.duplicate_finder = DuplicateFinder(self.duplicate_store, self.scheduler)
+        
+        # MP3 seek tables, built while the Xing TOC covers seeking
+        self.seek_index_thread = SeekIndexThread(self.scheduler)
+        
+        # Beat analysis for the library and beat events for the visualizer
+        self.beat_tracker = BeatTracker()
+        self.beat_thread = BeatAnalysisThread(self.scheduler)
+        self.beat_thread.analysis_ready.connect(self.on_beats_ready)
+        
+        # Loudness scanning for automatic track/album gain
+        self.loudness_store = LoudnessStore()
+        self.loudness_scanner = LoudnessScanner(self.loudness_store, self.scheduler)
+        self.loudness_scanner.track_scanned.connect(self.on_loudness_scanned)
+        
+        # Audio descriptors for Play Similar
+        self.similarity_store = SimilarityStore()
+        self.similarity_index = SimilarityIndex(self.similarity_store)
+        self.similarity_scanner = SimilarityScanner(self.similarity_store, self.scheduler)
+        self.similar_tracks = []  # The current track and those that sound most like it
+        
         self.init_ui()
         self.load_settings()
         self.apply_theme()
+        self.apply_equalizer()
         
         # Connect audio player signals
         self.audio_player.track_changed.connect(self.on_track_changed)
         self.audio_player.playback_finished.connect(self.on_playback_finished)
+        self.audio_player.position_changed.connect(self.update_seek_bar)
+        self.audio_player.start(QThread.Priority.TimeCriticalPriority)
         
-        # Update timer for seek bar
-        self.update_timer = QTimer()
-        self.update_timer.timeout.connect(self.update_seek_bar)
-        self.update_timer.start(100)
+        # Output health: underruns, latency and the tuned block size
+        self.output_status_timer = QTimer()
+        self.output_status_timer.timeout.connect(self.update_output_status)
+        self.output_status_timer.start(1000)
+        
+        # Periodic resume checkpoint (tiny file, not a full settings rewrite)
+        self.checkpoint_timer = QTimer()
+        self.checkpoint_timer.timeout.connect(self.checkpoint_position)
+        self.checkpoint_timer.start(config.RESUME_CHECKPOINT_MS)
+        
+        # Beat timer runs at the visualizer frame rate
+        self.beat_timer = QTimer()
+        self.beat_timer.timeout.connect(self.update_beats)
+        self.beat_timer.timeout.connect(self.update_live_spectrum)
+        self.beat_timer.start(30)
+        
+        self.beat_thread.analyze(self.playlist)
+        self.loudness_scanner.scan(self.playlist)
+        self.similarity_scanner.scan(self.playlist)
         
     def init_ui(self):
         """Initialize the user interface"""
@@ -230,15 +667,71 @@ class ChakraBeatsPlayer(QMainWindow):
         self.shuffle_check.toggled.connect(self.toggle_shuffle)
         playlist_controls.addWidget(self.shuffle_check)
         
+        self.shuffle_style_combo = QComboBox()
+        for mode, label in SHUFFLE_MODES.items():
+            self.shuffle_style_combo.addItem(label, mode)
+        self.shuffle_style_combo.setToolTip("How shuffle picks the next track")
+        self.shuffle_style_combo.currentIndexChanged.connect(self.change_shuffle_style)
+        playlist_controls.addWidget(self.shuffle_style_combo)
+        
         self.repeat_check = QCheckBox("🔁 Repeat")
         self.repeat_check.toggled.connect(self.toggle_repeat)
         playlist_controls.addWidget(self.repeat_check)
         
         playlist_layout.addLayout(playlist_controls)
         
+        # Smart playlists
+        smart_controls = QHBoxLayout()
+        self.smart_combo = QComboBox()
+        self.smart_combo.currentIndexChanged.connect(self.apply_scope)
+        smart_controls.addWidget(self.smart_combo, 1)
+        
+        new_smart_button = QPushButton("✨ New Smart Playlist")
+        new_smart_button.clicked.connect(self.new_smart_playlist)
+        smart_controls.addWidget(new_smart_button)
+        
+        delete_smart_button = QPushButton("🗑️")
+        delete_smart_button.setToolTip("Delete the selected smart playlist")
+        delete_smart_button.clicked.connect(self.delete_smart_playlist)
+        smart_controls.addWidget(delete_smart_button)
+        playlist_layout.addLayout(smart_controls)
+        self.refresh_smart_combo()
+        
+        # Search
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("🔍 Search title, artist, album or file name")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(lambda: self.search_timer.start(config.SEARCH_DELAY_MS))
+        playlist_layout.addWidget(self.search_box)
+        
+        # Sorting and grouping
+        view_controls = QHBoxLayout()
+        view_controls.addWidget(QLabel("Sort by:"))
+        self.sort_combo = QComboBox()
+        for column, (label, _) in SORT_COLUMNS.items():
+            self.sort_combo.addItem(label, column)
+        self.sort_combo.currentIndexChanged.connect(self.change_playlist_view)
+        view_controls.addWidget(self.sort_combo)
+        
+        self.descending_check = QCheckBox("⬇️ Descending")
+        self.descending_check.toggled.connect(self.change_playlist_view)
+        view_controls.addWidget(self.descending_check)
+        
+        self.group_check = QCheckBox("📂 Group")
+        self.group_check.setToolTip("Group rows by artist, album or year when sorted by one of them")
+        self.group_check.toggled.connect(self.change_playlist_view)
+        view_controls.addWidget(self.group_check)
+        playlist_layout.addLayout(view_controls)
+        
         # Playlist
-        self.playlist_widget = QListWidget()
-        self.playlist_widget.itemDoubleClicked.connect(self.play_selected)
+        self.playlist_widget = QListView()
+        self.playlist_widget.setModel(self.playlist_model)
+        self.playlist_widget.setUniformItemSizes(True)
+        self.playlist_widget.doubleClicked.connect(self.play_selected)
+        self.playlist_widget.setIconSize(QSize(config.ALBUM_ART_ICON_SIZE, config.ALBUM_ART_ICON_SIZE))
+        art_placeholder = QPixmap(config.ALBUM_ART_ICON_SIZE, config.ALBUM_ART_ICON_SIZE)
+        art_placeholder.fill(Qt.GlobalColor.transparent)
+        self.art_placeholder = QIcon(art_placeholder)
         playlist_layout.addWidget(self.playlist_widget)
         
         splitter.addWidget(playlist_widget)
@@ -254,7 +747,7 @@ class ChakraBeatsPlayer(QMainWindow):
         controls_layout.addWidget(self.now_playing_label)
         
         # Seek bar
-        self.seek_bar = QSlider(Qt.Orientation.Horizontal)
+        self.seek_bar = WaveformSeekBar()
         self.seek_bar.sliderMoved.connect(self.seek_to_position)
         controls_layout.addWidget(self.seek_bar)
         
@@ -289,6 +782,16 @@ class ChakraBeatsPlayer(QMainWindow):
         self.next_button.clicked.connect(self.next_track)
         main_controls.addWidget(self.next_button)
         
+        self.favorite_button = QPushButton("🤍")
+        self.favorite_button.setToolTip("Favorite the current track")
+        self.favorite_button.clicked.connect(self.toggle_favorite)
+        main_controls.addWidget(self.favorite_button)
+        
+        self.similar_button = QPushButton("🧭")
+        self.similar_button.setToolTip("Play tracks that sound like the current one")
+        self.similar_button.clicked.connect(self.play_similar)
+        main_controls.addWidget(self.similar_button)
+        
         controls_layout.addLayout(main_controls)
         
         # Volume control
@@ -299,6 +802,40 @@ class ChakraBeatsPlayer(QMainWindow):
         self.volume_slider.setValue(70)
         self.volume_slider.valueChanged.connect(self.change_volume)
         volume_layout.addWidget(self.volume_slider)
+        
+        # Loudness normalisation mode
+        self.replay_gain_combo = QComboBox()
+        self.replay_gain_combo.addItems([mode.capitalize() for mode in config.REPLAY_GAIN_MODES])
+        self.replay_gain_combo.setCurrentText(config.DEFAULT_REPLAY_GAIN_MODE.capitalize())
+        self.replay_gain_combo.currentTextChanged.connect(self.change_replay_gain_mode)
+        volume_layout.addWidget(QLabel("Gain:"))
+        volume_layout.addWidget(self.replay_gain_combo)
+        
+        # Crossfade between tracks (0 = gapless)
+        self.crossfade_spin = QSpinBox()
+        self.crossfade_spin.setRange(0, config.MAX_CROSSFADE_SECONDS)
+        self.crossfade_spin.setSuffix(" s")
+        self.crossfade_spin.valueChanged.connect(self.change_crossfade)
+        volume_layout.addWidget(QLabel("Fade:"))
+        volume_layout.addWidget(self.crossfade_spin)
+        
+        # Equalizer preset (Theme follows the chakra theme)
+        self.eq_combo = QComboBox()
+        self.eq_combo.addItems(config.EQ_MODES + list(config.EQ_PRESETS))
+        self.eq_combo.setCurrentText(config.DEFAULT_EQ_MODE)
+        self.eq_combo.currentTextChanged.connect(self.change_eq_mode)
+        volume_layout.addWidget(QLabel("EQ:"))
+        volume_layout.addWidget(self.eq_combo)
+        
+        # Device sample rate follows the file instead of resampling it
+        self.follow_rate_check = QCheckBox("Match file rate")
+        self.follow_rate_check.toggled.connect(self.toggle_follow_file_rate)
+        volume_layout.addWidget(self.follow_rate_check)
+        
+        # Decoding away from the GUI process keeps playback fed when the GUI is busy
+        self.decoder_process_check = QCheckBox("Decoder process")
+        self.decoder_process_check.toggled.connect(self.toggle_decoder_process)
+        volume_layout.addWidget(self.decoder_process_check)
         controls_layout.addLayout(volume_layout)
         
         # Anime quote display
@@ -319,6 +856,15 @@ class ChakraBeatsPlayer(QMainWindow):
         self.visualizer_selector.set_visualizer(self.visualizer)
         tab_widget.addTab(self.visualizer_selector, "🔮 Visualizer")
         
+        # Duplicates tab
+        self.duplicates_widget = DuplicatesWidget()
+        self.duplicates_widget.find_requested.connect(self.find_duplicates)
+        self.duplicates_widget.track_activated.connect(self.play_file)
+        self.duplicate_finder.progress.connect(self.duplicates_widget.set_progress)
+        self.duplicate_finder.clusters_found.connect(self.duplicates_widget.show_clusters)
+        self.duplicate_finder.finished.connect(lambda: self.duplicates_widget.set_scanning(False))
+        tab_widget.addTab(self.duplicates_widget, "🧬 Duplicates")
+        
         # Add tabs to controls
         controls_layout.addWidget(tab_widget)
         
@@ -377,14 +923,14 @@ class ChakraBeatsPlayer(QMainWindow):
             border-radius: 9px;
         }}
         
-        QListWidget {{
+        QListView {{
             background-color: {theme['secondary']};
             border: 2px solid {theme['accent']};
             border-radius: 5px;
             color: {theme['text']};
         }}
         
-        QListWidget::item:selected {{
+        QListView::item:selected {{
             background-color: {theme['primary']};
             color: {theme['secondary']};
         }}
@@ -419,11 +965,13 @@ class ChakraBeatsPlayer(QMainWindow):
         """
         
         self.setStyleSheet(style)
+        self.seek_bar.set_colors(theme['primary'], theme['accent'])
         
     def change_theme(self, theme_name):
         """Change the current theme"""
         self.current_theme = theme_name
         self.apply_theme()
+        self.apply_equalizer()
         self.save_settings()
         
     def add_songs(self):
@@ -432,56 +980,194 @@ class ChakraBeatsPlayer(QMainWindow):
             self,
             "Select Audio Files",
             "",
-            "Audio Files (*.mp3 *.wav *.ogg);;MP3 Files (*.mp3);;WAV Files (*.wav);;OGG Files (*.ogg)"
+            audio_formats.file_filter()
         )
         
-        for file_path in files:
-            if file_path not in self.playlist:
-                self.playlist.append(file_path)
-                
-                # Get metadata for better display
-                metadata = self.metadata_manager.get_metadata(file_path)
-                if metadata.title and metadata.artist:
-                    display_text = f"🎵 {metadata.title} - {metadata.artist}"
-                else:
-                    display_text = f"🎵 {os.path.basename(file_path)}"
-                
-                item = QListWidgetItem(display_text)
-                item.setData(Qt.ItemDataRole.UserRole, file_path)
-                self.playlist_widget.addItem(item)
+        self.add_files(files)
         
+    def add_files(self, files):
+        """Append files that are not in the playlist yet"""
+        known = set(self.playlist)
+        added = [file_path for file_path in dict.fromkeys(files) if file_path not in known]
+        if not added:
+            return
+        self.playlist.extend(added)
+        self.playlist_model.add_tracks(added)
+        for file_path in added:
+            self.smart_playlists.update(file_path, **self.stats_facts(file_path))
+        for track in range(len(self.playlist) - len(added), len(self.playlist)):
+            self.shuffle.add(track)
+        
+        # Get metadata for better display; the model and search index pick it up
+        for file_path in added:
+            self.metadata_manager.get_display_metadata(file_path)
+        
+        self.library_watcher.track(added)
+        self.beat_thread.analyze(added)
+        self.loudness_scanner.scan(added)
+        self.similarity_scanner.scan(added)
+        self.apply_search()
+        self.apply_scope()
         self.save_settings()
         
+    def on_library_changed(self, changes):
+        """Bring the playlist and its indexes up to date with a batch of changes on disk"""
+        index_of = self.playlist_model.index_of
+        
+        for old_path, new_path in changes.renamed:
+            track = index_of.get(old_path)
+            if track is None:
+                changes.added.append(new_path)
+                continue
+            if new_path in index_of:
+                # Moved over a listed file: its row takes the new content and the old row goes
+                self.play_stats.rename(old_path, new_path)
+                if self.last_played == old_path:
+                    self.last_played = new_path
+                changes.removed.append(old_path)
+                changes.changed.append(new_path)
+                continue
+            self.playlist[track] = new_path
+            self.playlist_model.rename_track(old_path, new_path)
+            self.search_index.remove(old_path)
+            self.smart_playlists.rename_track(old_path, new_path)
+            self.play_stats.rename(old_path, new_path)
+            self.similarity_store.rename(old_path, new_path)
+            self.metadata_manager.remove_from_cache(old_path)
+            self.art_cache.discard(old_path)
+            if self.last_played == old_path:
+                self.last_played = new_path
+            self.metadata_manager.get_display_metadata(new_path)
+        
+        removed = [file_path for file_path in changes.removed if file_path in index_of]
+        self.playlist_model.set_present(removed, False)
+        for file_path in removed:
+            self.shuffle.remove(index_of[file_path])
+            self.search_index.remove(file_path)
+            self.smart_playlists.remove_track(file_path)
+            self.metadata_manager.remove_from_cache(file_path)
+            self.art_cache.discard(file_path)
+        
+        # Retagged files are read again; the model, search index and smart playlists follow
+        changed = [file_path for file_path in changes.changed if file_path in index_of]
+        for file_path in changed:
+            self.metadata_manager.remove_from_cache(file_path)
+            self.art_cache.discard(file_path)
+            self.metadata_manager.get_display_metadata(file_path)
+        self.similarity_scanner.scan(changed)
+        
+        returned = [file_path for file_path in changes.added if file_path in index_of]
+        self.playlist_model.set_present(returned, True)
+        for file_path in returned:
+            self.shuffle.add(index_of[file_path])
+            self.smart_playlists.update(file_path, **self.stats_facts(file_path))
+            self.metadata_manager.get_display_metadata(file_path)
+        if config.WATCH_ADD_NEW_FILES:
+            self.add_files([file_path for file_path in changes.added if file_path not in index_of])
+        
+        if changes.renamed:
+            self.library_watcher.track([new_path for _, new_path in changes.renamed])
+        self.apply_search()
+        self.apply_scope()
+        
     def clear_playlist(self):
         """Clear the playlist"""
         self.playlist.clear()
-        self.playlist_widget.clear()
+        self.playlist_model.clear()
+        self.metadata_manager.clear_cache()
+        self.search_index.clear()
+        self.search_box.clear()
+        self.smart_playlists.clear_tracks()
+        self.similar_tracks = []
+        self.refresh_smart_combo()
+        self.shuffle.clear()
+        self.library_watcher.clear()
+        self.apply_scope()
         self.audio_player.stop()
         self.now_playing_label.setText("No track selected")
         self.save_settings()
         
-    def play_selected(self, item):
+    def play_selected(self, index):
         """Play the selected track"""
-        file_path = item.data(Qt.ItemDataRole.UserRole)
-        self.current_index = self.playlist.index(file_path)
+        track = self.playlist_model.track_at(index.row())
+        if track is None:
+            return  # A group header
+        self.current_index = track
+        self.shuffle.play(track)
+        self.load_and_play(self.playlist[track])
+        
+    def play_file(self, file_path):
+        """Play a playlist track given by its path"""
+        track = self.playlist_model.index_of.get(file_path)
+        if track is None:
+            return
+        self.current_index = track
+        self.shuffle.play(track)
         self.load_and_play(file_path)
         
+    def play_similar(self):
+        """Show the tracks that sound most like the current one and play the closest"""
+        file_path = self.audio_player.current_file
+        if not file_path:
+            return
+        present = {path for track, path in enumerate(self.playlist) if self.playlist_model.present[track]}
+        similar = self.similarity_index.nearest(file_path, config.SIMILAR_TRACKS, present)
+        if not similar:
+            self.statusBar().showMessage("🧭 This track has not been analysed yet", 3000)
+            return
+        self.similar_tracks = [file_path] + similar
+        self.refresh_smart_combo("similar")
+        self.apply_scope()
+        self.play_file(similar[0])
+        
+    def find_duplicates(self):
+        """Look for duplicate rips among the playlist tracks in the background"""
+        tracks = {}
+        for track, file_path in enumerate(self.playlist):
+            if not self.playlist_model.present[track]:
+                continue
+            metadata = self.metadata_manager.metadata_cache.get(file_path)
+            tracks[file_path] = metadata.duration if metadata else 0
+        if self.duplicate_finder.find(tracks):
+            self.duplicates_widget.set_scanning(True)
+        
     def load_and_play(self, file_path):
         """Load and play a track"""
-        self.audio_player.load_file(file_path)
-        self.audio_player.play()
+        self.audio_player.load_file(file_path, play=True)
         self.play_button.setText("⏸️")
         
+    def show_track(self, file_path):
+        """Update the display, gain and analysis followers for a loaded track"""
+        self.apply_replay_gain(file_path)
+        
+        # A track resumed past the point where it counts was counted in the last session
+        self.counted_play = self.audio_player.position >= self.play_threshold(self.audio_player.duration)
+        self.show_favorite(file_path)
+        
         # Update display
         filename = os.path.basename(file_path)
         self.now_playing_label.setText(f"🎵 Now Playing: {filename}")
         
         # Update seek bar
         self.seek_bar.setRange(0, self.audio_player.duration)
+        overview = self.waveform_cache.get(file_path)
+        self.seek_bar.set_overview(overview)
+        if overview is None:
+            self.waveform_thread.request(file_path)
+        self.seek_index_thread.request(file_path)
+        
+        # Follow the track's beats once they are analysed; the playing track's analyses go first
+        self.beat_tracker.set_analysis(BeatCache.get(file_path))
+        self.beat_thread.analyze([file_path], PRIORITY_PLAYING)
+        self.loudness_scanner.scan([file_path], PRIORITY_PLAYING)
         
         # Update metadata display
         metadata = self.metadata_manager.get_metadata(file_path)
         self.metadata_widget.update_metadata(metadata)
+        art = self.art_cache.get(file_path)
+        self.metadata_widget.set_art(art)
+        if art is None:
+            self.art_thread.request(file_path, PRIORITY_PLAYING)
         
     def toggle_play(self):
         """Toggle play/pause"""
@@ -497,7 +1183,12 @@ class ChakraBeatsPlayer(QMainWindow):
                 self.play_button.setText("▶️")
         else:
             if self.current_index < len(self.playlist):
-                self.load_and_play(self.playlist[self.current_index])
+                if self.audio_player.current_file == self.playlist[self.current_index]:
+                    # Already opened (e.g. resumed session): start without reloading
+                    self.audio_player.play()
+                    self.play_button.setText("⏸️")
+                else:
+                    self.load_and_play(self.playlist[self.current_index])
             else:
                 self.current_index = 0
                 if self.playlist:
@@ -516,12 +1207,15 @@ class ChakraBeatsPlayer(QMainWindow):
             return
             
         if self.shuffle_mode:
-            self.current_index = random.randint(0, len(self.playlist) - 1)
+            track = self.shuffle.next()
+            if track is None:
+                return
+            self.current_index = track
         else:
-            self.current_index = (self.current_index + 1) % len(self.playlist)
+            self.current_index = self.playlist_model.step(self.current_index, 1)
             
         self.load_and_play(self.playlist[self.current_index])
-        self.playlist_widget.setCurrentRow(self.current_index)
+        self.select_track(self.current_index)
         
     def previous_track(self):
         """Play previous track"""
@@ -529,30 +1223,142 @@ class ChakraBeatsPlayer(QMainWindow):
             return
             
         if self.shuffle_mode:
-            self.current_index = random.randint(0, len(self.playlist) - 1)
+            # Back through what shuffle played; at the start of the history, replay the current track
+            track = self.shuffle.previous()
+            if track is not None:
+                self.current_index = track
         else:
-            self.current_index = (self.current_index - 1) % len(self.playlist)
+            self.current_index = self.playlist_model.step(self.current_index, -1)
             
         self.load_and_play(self.playlist[self.current_index])
-        self.playlist_widget.setCurrentRow(self.current_index)
+        self.select_track(self.current_index)
         
     def change_volume(self, value):
         """Change volume"""
         self.audio_player.set_volume(value)
         
+    def change_replay_gain_mode(self, mode_name):
+        """Switch between no, track and album normalisation"""
+        self.replay_gain_mode = mode_name.lower()
+        if self.audio_player.current_file:
+            self.apply_replay_gain(self.audio_player.current_file)
+        self.save_settings()
+        
+    def change_crossfade(self, seconds):
+        """Set the crossfade length between tracks"""
+        self.crossfade_seconds = seconds
+        self.audio_player.set_crossfade(seconds)
+        self.save_settings()
+        
+    def toggle_follow_file_rate(self, enabled):
+        """Switch the output device to each track's own sample rate"""
+        self.follow_file_rate = enabled
+        self.audio_player.set_follow_file_rate(enabled)
+        self.save_settings()
+        
+    def toggle_decoder_process(self, enabled):
+        """Decode upcoming tracks in a separate process"""
+        self.decoder_process = enabled
+        self.audio_player.set_decoder_process(enabled)
+        self.save_settings()
+        
+    def change_eq_mode(self, mode):
+        """Pick an equalizer preset, theme-linked EQ or no EQ"""
+        self.eq_mode = mode
+        self.apply_equalizer()
+        self.save_settings()
+        
+    def apply_equalizer(self):
+        """Send the gains of the selected preset to the playback engine"""
+        if self.eq_mode == "Off":
+            self.audio_player.set_equalizer(None)
+            return
+        preset = self.eq_mode
+        if preset == "Theme":
+            preset = config.THEME_EQ_PRESETS.get(self.current_theme, "Flat")
+        self.audio_player.set_equalizer(config.EQ_PRESETS.get(preset))
+        
+    def queue_upcoming(self):
+        """Pre-open the track that will follow the current one"""
+        if not self.playlist or self.current_index >= len(self.playlist):
+            self.upcoming_index = None
+            return
+        
+        if self.repeat_mode:
+            self.upcoming_index = self.current_index
+        elif self.shuffle_mode:
+            self.upcoming_index = self.shuffle.peek()
+            if self.upcoming_index is None:
+                return
+        else:
+            self.upcoming_index = self.playlist_model.step(self.current_index, 1)
+        
+        file_path = self.playlist[self.upcoming_index]
+        self.audio_player.set_next(file_path, self.replay_gain_for(file_path))
+        self.loudness_scanner.scan([file_path], PRIORITY_PLAYING)
+        self.beat_thread.analyze([file_path], PRIORITY_PLAYING)
+        
+    def apply_replay_gain(self, file_path):
+        """Apply the cached track or album gain for a track"""
+        self.audio_player.set_gain(self.replay_gain_for(file_path))
+        
+    def replay_gain_for(self, file_path):
+        """Track or album gain in dB for the current mode, or None"""
+        gain_db = None
+        if self.replay_gain_mode == "album":
+            album = self.metadata_manager.get_metadata(file_path).album
+            if album:
+                gain_db = self.loudness_store.album_gain(self.metadata_manager.tracks_on_album(album))
+        if gain_db is None and self.replay_gain_mode != "off":
+            gain_db = self.loudness_store.track_gain(file_path)
+        return gain_db
+        
     def seek_to_position(self, position):
         """Seek to position in track"""
         self.audio_player.seek(position)
         
-    def update_seek_bar(self):
-        """Update seek bar position"""
+    def update_seek_bar(self, position):
+        """Update seek bar position from the playback clock"""
+        if not self.seek_bar.isSliderDown():
+            self.seek_bar.setValue(position)
+        self.current_time_label.setText(self.format_time(position))
+        
+        # Count a play once enough of the track has been heard
+        if not self.counted_play and self.audio_player.duration > 0 and self.audio_player.current_file:
+            if position >= self.play_threshold(self.audio_player.duration):
+                self.counted_play = True
+                self.play_stats.record_play(self.audio_player.current_file)
+                self.update_stats_facts(self.audio_player.current_file)
+                
+    def play_threshold(self, duration):
+        """Position in ms after which a track counts as played"""
+        return min(config.STATS_PLAY_SECONDS * 1000, duration * config.STATS_PLAY_FRACTION)
+        
+    def update_beats(self):
+        """Fire beat events on the visualizer as playback passes them"""
         if self.audio_player.is_playing and not self.audio_player.is_paused:
-            # Get current position from pygame (approximate)
-            current_pos = pygame.mixer.music.get_pos()
-            if current_pos >= 0:
-                self.seek_bar.setValue(current_pos)
-                self.current_time_label.setText(self.format_time(current_pos))
+            for strength in self.beat_tracker.poll(self.audio_player.get_position()):
+                self.visualizer.on_beat(strength)
+                
+    def update_live_spectrum(self):
+        """Feed the visualizer the spectrum of what is playing"""
+        samples = self.audio_player.recent_pcm(config.VISUALIZER_FFT_FRAMES)
+        if samples is not None:
+            self.visualizer.update_spectrum(samples)
+        elif not self.audio_player.is_playing:
+            self.visualizer.clear_spectrum()
                 
+    def update_output_status(self):
+        """Report underruns and current output latency in the status bar"""
+        stats = self.audio_player.output_stats()
+        if stats['underruns'] > self.last_underruns:
+            # Playback is struggling: give it room by holding library jobs back
+            self.scheduler.back_off()
+        self.last_underruns = stats['underruns']
+        self.statusBar().showMessage(
+            f"🎚️ Queue: {stats['block_frames']}-frame blocks · latency {stats['latency_ms']:.0f} ms · "
+            f"jitter {stats['jitter_ms']:.1f} ms · underruns {stats['underruns']}")
+        
     def format_time(self, milliseconds):
         """Format time in MM:SS"""
         seconds = milliseconds // 1000
@@ -563,17 +1369,221 @@ class ChakraBeatsPlayer(QMainWindow):
     def toggle_shuffle(self, enabled):
         """Toggle shuffle mode"""
         self.shuffle_mode = enabled
+        if enabled and self.current_index < len(self.playlist):
+            self.shuffle.play(self.current_index)
+        self.queue_upcoming()
+        self.save_settings()
+        
+    def change_shuffle_style(self, *args):
+        """Switch between plain random and artist spread shuffle"""
+        self.shuffle.set_mode(self.shuffle_style_combo.currentData())
         self.save_settings()
         
     def toggle_repeat(self, enabled):
         """Toggle repeat mode"""
         self.repeat_mode = enabled
+        self.queue_upcoming()
         self.save_settings()
         
     def on_track_changed(self, file_path):
         """Handle track change"""
-        pass
+        if (self.upcoming_index is not None and self.upcoming_index < len(self.playlist) and
+                self.playlist[self.upcoming_index] == file_path):
+            # The player moved on by itself (gapless or crossfade)
+            self.current_index = self.upcoming_index
+            if self.shuffle_mode and not self.repeat_mode and self.shuffle.current != self.upcoming_index:
+                self.shuffle.next()
+            self.select_track(self.current_index)
+        self.show_track(file_path)
+        self.queue_upcoming()
+        
+    def select_track(self, track):
+        """Highlight a playlist track in the view, if it is shown"""
+        row = self.playlist_model.row_of(track)
+        if row >= 0:
+            self.playlist_widget.setCurrentIndex(self.playlist_model.index(row))
+        
+    def change_playlist_view(self, *args):
+        """Apply the sort column, direction and grouping chosen above the playlist"""
+        self.playlist_model.grouped = self.group_check.isChecked()
+        self.playlist_model.set_order(self.sort_combo.currentData(), self.descending_check.isChecked())
+        self.select_track(self.current_index)
+        
+    def playlist_art(self, file_path):
+        """Icon for a playlist row; asks for the art when it is not loaded (called only for rows on screen)"""
+        art = self.art_cache.get(file_path)
+        if art is None:
+            self.art_thread.request(file_path)
+        return QIcon(art) if art is not None and not art.isNull() else self.art_placeholder
+        
+    def load_search_index(self):
+        """Load the saved search index, or start an empty one"""
+        try:
+            if os.path.exists(config.get_search_index_path()):
+                return SearchIndex.load(config.get_search_index_path())
+        except Exception as e:
+            print(f"Error loading search index: {e}")
+        return SearchIndex()
         
+    def save_library_indexes(self):
+        """Save the search index, sort keys and smart playlist facts so the next start does not rebuild them"""
+        try:
+            self.search_index.save(config.get_search_index_path())
+            self.playlist_model.save_keys(config.get_sort_keys_path())
+            self.smart_playlists.save_facts(config.get_smart_facts_path())
+            self.library_watcher.save(config.get_library_listing_path())
+        except Exception as e:
+            print(f"Error saving library indexes: {e}")
+        
+    def load_smart_playlists(self):
+        """Load the smart playlist rules (the defaults on first start)"""
+        try:
+            self.smart_playlists.load_definitions(config.get_playlists_path())
+        except Exception as e:
+            print(f"Error loading smart playlists: {e}")
+        
+    def save_smart_playlists(self):
+        """Save the smart playlist rules"""
+        try:
+            self.smart_playlists.save_definitions(config.get_playlists_path())
+        except Exception as e:
+            print(f"Error saving smart playlists: {e}")
+        
+    def refresh_smart_combo(self, selected=None):
+        """List the smart playlists, keeping or changing the selection"""
+        if selected is None:
+            selected = self.smart_combo.currentData()
+        self.smart_combo.blockSignals(True)
+        self.smart_combo.clear()
+        self.smart_combo.addItem("📚 All Tracks", None)
+        for key, label in STATS_VIEWS.items():
+            self.smart_combo.addItem(label, key)
+        if self.similar_tracks:
+            self.smart_combo.addItem(f"🧭 Like {os.path.basename(self.similar_tracks[0])}", "similar")
+        for playlist in self.smart_playlists.playlists.values():
+            self.smart_combo.addItem(playlist.name, playlist.name)
+            self.smart_combo.setItemData(self.smart_combo.count() - 1, describe_rules(playlist.rules, playlist.match),
+                                         Qt.ItemDataRole.ToolTipRole)
+        self.smart_combo.setCurrentIndex(max(self.smart_combo.findData(selected), 0))
+        self.smart_combo.blockSignals(False)
+        
+    def update_smart_playlists(self, file_path, metadata):
+        """Re-check a track against the smart playlists when its metadata arrives"""
+        moved = self.smart_playlists.update_metadata(file_path, metadata)
+        if self.smart_combo.currentData() in moved:
+            self.scope_timer.start(config.SEARCH_DELAY_MS)
+        
+    def stats_facts(self, file_path):
+        """Smart playlist facts taken from the play statistics"""
+        return {"plays": self.play_stats.play_count(file_path), "favorite": self.play_stats.is_favorite(file_path)}
+        
+    def update_stats_facts(self, file_path):
+        """Re-check a track against the smart playlists and stats views after a play or favorite"""
+        moved = self.smart_playlists.update(file_path, **self.stats_facts(file_path))
+        name = self.smart_combo.currentData()
+        if name in moved or name in STATS_VIEWS:
+            self.scope_timer.start(config.SEARCH_DELAY_MS)
+        
+    def toggle_favorite(self):
+        """Favorite or unfavorite the current track"""
+        file_path = self.audio_player.current_file
+        if not file_path and self.current_index < len(self.playlist):
+            file_path = self.playlist[self.current_index]
+        if not file_path:
+            return
+        favorite = not self.play_stats.is_favorite(file_path)
+        self.play_stats.set_favorite(file_path, favorite)
+        self.update_stats_facts(file_path)
+        self.show_favorite(file_path)
+        message = config.SUCCESS_MESSAGES["favorite_added" if favorite else "favorite_removed"]
+        self.statusBar().showMessage(message.format(os.path.basename(file_path)), 3000)
+        
+    def show_favorite(self, file_path):
+        """Show whether a track is a favorite on the favorite button"""
+        self.favorite_button.setText("❤️" if self.play_stats.is_favorite(file_path) else "🤍")
+        
+    def shuffle_weight(self, track):
+        """Weighted shuffle: favorites always, other tracks more often the more they were played"""
+        file_path = self.playlist[track]
+        if self.play_stats.is_favorite(file_path):
+            return 1.0
+        plays = self.play_stats.play_count(file_path)
+        return 0.25 + 0.5 * plays / (plays + 5)
+        
+    def apply_scope(self, *args):
+        """Show the selected smart playlist, or every track"""
+        name = self.smart_combo.currentData()
+        if name in STATS_VIEWS:
+            self.playlist_model.set_scope(self.play_stats.view(name, config.STATS_VIEW_TRACKS))
+        elif name == "similar":
+            self.playlist_model.set_scope(self.similar_tracks)
+        else:
+            self.playlist_model.set_scope(self.smart_playlists.members(name) if name else None)
+        self.select_track(self.current_index)
+        
+    def new_smart_playlist(self):
+        """Ask for a name and rules and add a smart playlist"""
+        name, ok = QInputDialog.getText(self, "New Smart Playlist", "Name:")
+        name = name.strip()
+        if not ok or not name:
+            return
+        text, ok = QInputDialog.getText(
+            self, "New Smart Playlist",
+            "Rules, joined by 'and' or 'or', e.g.\n"
+            "genre contains anime and year in 2000..2009 and duration < 4:00\n\n"
+            f"Fields: {', '.join(FIELDS)}")
+        if not ok or not text.strip():
+            return
+        try:
+            match, rules = parse_rules(text)
+        except ValueError as e:
+            QMessageBox.warning(self, "New Smart Playlist", str(e))
+            return
+        
+        self.smart_playlists.define(name, rules, match)
+        self.save_smart_playlists()
+        self.refresh_smart_combo(name)
+        self.apply_scope()
+        
+    def delete_smart_playlist(self):
+        """Delete the selected smart playlist"""
+        name = self.smart_combo.currentData()
+        if not name or name in STATS_VIEWS or name == "similar":
+            return
+        self.smart_playlists.delete(name)
+        self.save_smart_playlists()
+        self.refresh_smart_combo()
+        self.apply_scope()
+        
+    def apply_search(self):
+        """Show only the playlist rows whose track matches the search box"""
+        self.playlist_model.set_matches(self.search_index.search(self.search_box.text()))
+        self.select_track(self.current_index)
+        
+    def on_art_ready(self, file_path, image):
+        """Cache a loaded thumbnail and show it wherever the track is on screen"""
+        art = QPixmap.fromImage(image) if not image.isNull() else QPixmap()
+        self.art_cache.put(file_path, art)
+        if not art.isNull():
+            self.playlist_model.track_changed(file_path)
+        if file_path == self.audio_player.current_file:
+            self.metadata_widget.set_art(art)
+        
+    def on_waveform_ready(self, file_path):
+        """Show a freshly computed waveform if it belongs to the current track"""
+        if file_path == self.audio_player.current_file:
+            self.seek_bar.set_overview(self.waveform_cache.get(file_path))
+            
+    def on_beats_ready(self, file_path):
+        """Start following beats once the current track has been analysed"""
+        if file_path == self.audio_player.current_file and self.beat_tracker.analysis is None:
+            self.beat_tracker.set_analysis(BeatCache.get(file_path))
+            
+    def on_loudness_scanned(self, file_path):
+        """Apply normalisation as soon as the playing track has been measured"""
+        if file_path == self.audio_player.current_file:
+            self.apply_replay_gain(file_path)
+            
     def on_playback_finished(self):
         """Handle playback finished"""
         if self.repeat_mode:
@@ -590,26 +1600,129 @@ class ChakraBeatsPlayer(QMainWindow):
             if os.path.exists("chakrabeats_settings.json"):
                 with open("chakrabeats_settings.json", "r") as f:
                     settings = json.load(f)
+                self.import_legacy_favorites(settings)
                     
                 self.current_theme = settings.get("theme", "Kaminari Mode")
                 self.playlist = settings.get("playlist", [])
                 self.shuffle_mode = settings.get("shuffle", False)
                 self.repeat_mode = settings.get("repeat", False)
+                self.replay_gain_mode = settings.get("replay_gain", config.DEFAULT_REPLAY_GAIN_MODE)
+                self.crossfade_seconds = settings.get("crossfade", config.DEFAULT_CROSSFADE_SECONDS)
+                self.eq_mode = settings.get("equalizer", config.DEFAULT_EQ_MODE)
+                if self.eq_mode not in config.EQ_MODES and self.eq_mode not in config.EQ_PRESETS:
+                    self.eq_mode = config.DEFAULT_EQ_MODE
+                self.follow_file_rate = settings.get("follow_file_rate", False)
+                self.decoder_process = settings.get("decoder_process", False)
+                # Settings from before the rename keep their tuned size
+                block_frames = settings.get("queue_block_frames",
+                                            settings.get("output_block_frames", config.OUTPUT_BLOCK_FRAMES))
+                self.last_played = settings.get("last_played", "")
+                self.last_position = settings.get("last_position", 0)
+                volume = settings.get("volume", config.DEFAULT_VOLUME)
+                visualization_mode = settings.get("visualization_mode", config.DEFAULT_VISUALIZER_MODE)
+                geometry = settings.get("window_geometry", config.DEFAULT_SETTINGS["window_geometry"])
                 
                 # Update UI
                 self.theme_combo.setCurrentText(self.current_theme)
                 self.shuffle_check.setChecked(self.shuffle_mode)
+                shuffle_style = settings.get("shuffle_style", "random")
+                self.shuffle_style_combo.setCurrentIndex(max(self.shuffle_style_combo.findData(shuffle_style), 0))
                 self.repeat_check.setChecked(self.repeat_mode)
+                self.replay_gain_combo.setCurrentText(self.replay_gain_mode.capitalize())
+                self.crossfade_spin.setValue(self.crossfade_seconds)
+                self.eq_combo.setCurrentText(self.eq_mode)
+                self.follow_rate_check.setChecked(self.follow_file_rate)
+                self.audio_player.set_follow_file_rate(self.follow_file_rate)
+                self.decoder_process_check.setChecked(self.decoder_process)
+                self.audio_player.set_decoder_process(self.decoder_process)
+                self.audio_player.set_block_frames(block_frames)
+                self.audio_player.set_crossfade(self.crossfade_seconds)
+                self.volume_slider.setValue(volume)
+                if visualization_mode in config.VISUALIZER_MODES:
+                    self.visualizer.set_visualization_mode(visualization_mode)
+                self.setGeometry(geometry["x"], geometry["y"], geometry["width"], geometry["height"])
+                
+                # Load playlist; the library watcher hides files that went missing
+                self.playlist_model.add_tracks(self.playlist)
+                self.shuffle.reset(range(len(self.playlist)))
+                self.library_watcher.track(self.playlist)
+                if os.path.exists(config.get_sort_keys_path()):
+                    self.playlist_model.load_keys(config.get_sort_keys_path())
+                sort_column = settings.get("playlist_sort", "added")
+                self.sort_combo.setCurrentIndex(max(self.sort_combo.findData(sort_column), 0))
+                self.descending_check.setChecked(settings.get("playlist_descending", False))
+                self.group_check.setChecked(settings.get("playlist_grouped", False))
                 
-                # Load playlist
+                # Smart playlists evaluate once over the saved facts, then track by track
+                if os.path.exists(config.get_smart_facts_path()):
+                    self.smart_playlists.load_facts(config.get_smart_facts_path(), self.playlist)
                 for file_path in self.playlist:
-                    if os.path.exists(file_path):
-                        filename = os.path.basename(file_path)
-                        item = QListWidgetItem(f"🎵 {filename}")
-                        item.setData(Qt.ItemDataRole.UserRole, file_path)
-                        self.playlist_widget.addItem(item)
+                    if file_path not in self.smart_playlists.facts:
+                        self.smart_playlists.update(file_path)
+                for file_path in self.play_stats.tracks() & set(self.playlist):
+                    self.smart_playlists.update(file_path, **self.stats_facts(file_path))
+                self.refresh_smart_combo(settings.get("smart_playlist"))
+                self.apply_scope()
+                
+                # Tracks the saved index lacks are searchable by file name until their tags are read
+                self.search_index.retain(self.playlist)
+                for file_path in self.playlist:
+                    if file_path not in self.search_index:
+                        self.search_index.add(file_path)
         except Exception as e:
             print(f"Error loading settings: {e}")
+        
+        self.resume_session()
+            
+    def import_legacy_favorites(self, settings):
+        """Move a favorites list from an older settings file into the play statistics, once"""
+        favorites = settings.pop("favorites", None)
+        if favorites is None:
+            return
+        for file_path in favorites:
+            self.play_stats.set_favorite(file_path, True)
+        # The favorites are on disk before the settings file stops listing them
+        self.play_stats.write_pending()
+        with open("chakrabeats_settings.json", "w") as f:
+            json.dump(settings, f, indent=2)
+            
+    def resume_session(self):
+        """Pre-open the last played track at its last position"""
+        try:
+            # The checkpoint file is newer than the settings whenever it exists
+            if os.path.exists(config.RESUME_FILE):
+                with open(config.RESUME_FILE, "r") as f:
+                    checkpoint = json.load(f)
+                self.last_played = checkpoint.get("last_played", self.last_played)
+                self.last_position = checkpoint.get("last_position", self.last_position)
+        except Exception as e:
+            print(f"Error loading resume checkpoint: {e}")
+        
+        if self.last_played in self.playlist and os.path.exists(self.last_played):
+            self.current_index = self.playlist.index(self.last_played)
+            self.shuffle.play(self.current_index)
+            self.select_track(self.current_index)
+            self.audio_player.prepare(self.last_played, self.last_position)
+            
+    def checkpoint_position(self):
+        """Cheaply record the playback position without rewriting all settings"""
+        if not self.audio_player.current_file:
+            return
+        checkpoint = {
+            "last_played": self.audio_player.current_file,
+            "last_position": self.audio_player.position
+        }
+        if checkpoint == self.last_checkpoint:
+            return
+        
+        try:
+            tmp_path = config.RESUME_FILE + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(checkpoint, f)
+            os.replace(tmp_path, config.RESUME_FILE)
+            self.last_checkpoint = checkpoint
+        except Exception as e:
+            print(f"Error saving resume checkpoint: {e}")
             
     def save_settings(self):
         """Save application settings"""
@@ -617,8 +1730,29 @@ class ChakraBeatsPlayer(QMainWindow):
             settings = {
                 "theme": self.current_theme,
                 "playlist": self.playlist,
+                "playlist_sort": self.sort_combo.currentData(),
+                "playlist_descending": self.descending_check.isChecked(),
+                "playlist_grouped": self.group_check.isChecked(),
+                "smart_playlist": self.smart_combo.currentData(),
                 "shuffle": self.shuffle_mode,
-                "repeat": self.repeat_mode
+                "shuffle_style": self.shuffle_style_combo.currentData(),
+                "repeat": self.repeat_mode,
+                "replay_gain": self.replay_gain_mode,
+                "crossfade": self.crossfade_seconds,
+                "equalizer": self.eq_mode,
+                "follow_file_rate": self.follow_file_rate,
+                "decoder_process": self.decoder_process,
+                "queue_block_frames": self.audio_player.output.block_frames,
+                "volume": self.volume_slider.value(),
+                "visualization_mode": self.visualizer.mode,
+                "window_geometry": {
+                    "x": self.geometry().x(),
+                    "y": self.geometry().y(),
+                    "width": self.geometry().width(),
+                    "height": self.geometry().height()
+                },
+                "last_played": self.audio_player.current_file or self.last_played,
+                "last_position": self.audio_player.position if self.audio_player.current_file else self.last_position
             }
             
             with open("chakrabeats_settings.json", "w") as f:
@@ -629,7 +1763,21 @@ class ChakraBeatsPlayer(QMainWindow):
     def closeEvent(self, event):
         """Handle application close"""
         self.save_settings()
+        self.checkpoint_position()
         self.audio_player.stop()
+        self.audio_player.shutdown()
+        self.library_watcher.stop()
+        self.duplicate_finder.stop()
+        self.save_library_indexes()
+        self.stats_timer.stop()
+        self.stats_writer.stop()
+        self.waveform_thread.stop()
+        self.art_thread.stop()
+        self.seek_index_thread.stop()
+        self.beat_thread.stop()
+        self.loudness_scanner.stop()
+        self.similarity_scanner.stop()
+        self.scheduler.shutdown()
         event.accept()
 
 def main():
@@ -4,14 +4,14 @@ Extracts and displays song information from audio files
 """
 
 import os
-from mutagen.mp3 import MP3
-from mutagen.wave import WAVE
-from mutagen.oggvorbis import OggVorbis
-from mutagen.id3 import ID3
-from mutagen.easyid3 import EasyID3
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTextEdit
 from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QFont
+from PyQt6.QtGui import QFont, QPixmap
+
+import config
+import audio_formats
+from id3_reader import read_tags
+from mp3_index import Mp3Info
 
 class SongMetadata:
     """Container for song metadata"""
@@ -30,6 +30,7 @@ class SongMetadata:
         self.file_path = ""
         self.file_size = 0
         self.quote = ""  # Custom quote field
+        self.tags_only = False  # Read without mutagen: tag text and a duration estimated from frame headers
         
     def __str__(self):
         return f"{self.title} - {self.artist} ({self.album})"
@@ -47,13 +48,17 @@ class MetadataHandler:
             # Get basic file info
             metadata.file_size = os.path.getsize(file_path)
             
-            # Extract format-specific metadata
-            if file_path.lower().endswith('.mp3'):
-                metadata = MetadataHandler._extract_mp3_metadata(file_path, metadata)
-            elif file_path.lower().endswith('.wav'):
-                metadata = MetadataHandler._extract_wav_metadata(file_path, metadata)
-            elif file_path.lower().endswith('.ogg'):
-                metadata = MetadataHandler._extract_ogg_metadata(file_path, metadata)
+            # Extract format-specific metadata; the format comes from the file header, not its name
+            audio_format = audio_formats.detect(file_path)
+            tag_style = audio_format.tag_style if audio_format else None
+            if tag_style == "id3":
+                metadata = MetadataHandler._extract_mp3_metadata(file_path, metadata, audio_format.tag_reader())
+            elif tag_style == "riff":
+                metadata = MetadataHandler._extract_wav_metadata(file_path, metadata, audio_format.tag_reader())
+            elif tag_style == "vorbis":
+                metadata = MetadataHandler._extract_vorbis_metadata(file_path, metadata, audio_format.tag_reader())
+            elif tag_style == "mp4":
+                metadata = MetadataHandler._extract_mp4_metadata(file_path, metadata, audio_format.tag_reader())
             else:
                 # Fallback for unsupported formats
                 metadata.title = os.path.basename(file_path)
@@ -68,11 +73,47 @@ class MetadataHandler:
         return metadata
     
     @staticmethod
-    def _extract_mp3_metadata(file_path, metadata):
+    def extract_display_metadata(file_path):
+        """Tag text and stream info for the playlist, read from the tag and the first frame headers"""
+        audio_format = audio_formats.detect(file_path)
+        if audio_format is None or audio_format.tag_style != "id3":
+            return MetadataHandler.extract_metadata(file_path)
+        
+        try:
+            fields = read_tags(file_path)
+            file_size = os.path.getsize(file_path)
+        except (OSError, ValueError) as e:
+            print(f"Error reading tags from {file_path}: {e}")
+            fields, file_size = {}, 0
+        if fields is None:
+            # Unsynchronised tag: only mutagen can untangle it
+            return MetadataHandler.extract_metadata(file_path)
+        
+        metadata = SongMetadata()
+        metadata.file_path = file_path
+        metadata.tags_only = True
+        metadata.file_size = file_size
+        for name, value in fields.items():
+            setattr(metadata, name, value)
+        
+        # Duration and bitrate from the Xing frame count or the average frame size, for sorting and rules
+        try:
+            with open(file_path, "rb") as file:
+                info = Mp3Info.probe(file)
+            seconds, metadata.bitrate = info.stream_info(file_size)
+            metadata.duration = int(seconds)
+            metadata.sample_rate = info.header.sample_rate
+        except (OSError, ValueError) as e:
+            print(f"Error reading stream info from {file_path}: {e}")
+        return metadata
+    
+    @staticmethod
+    def _extract_mp3_metadata(file_path, metadata, reader):
         """Extract metadata from MP3 file"""
+        from mutagen.id3 import ID3
         try:
             # Get audio info
-            audio = MP3(file_path)
+            audio = reader(file_path)
             metadata.duration = int(audio.info.length)
             metadata.bitrate = audio.info.bitrate
             metadata.sample_rate = audio.info.sample_rate
@@ -100,6 +141,7 @@ class MetadataHandler:
             except Exception:
                 # Try EasyID3 as fallback
                 try:
+                    from mutagen.easyid3 import EasyID3
                     audio = EasyID3(file_path)
                     if audio:
                         if 'title' in audio:
@@ -123,10 +165,10 @@ class MetadataHandler:
         return metadata
     
     @staticmethod
-    def _extract_wav_metadata(file_path, metadata):
+    def _extract_wav_metadata(file_path, metadata, reader):
         """Extract metadata from WAV file"""
         try:
-            audio = WAVE(file_path)
+            audio = reader(file_path)
             metadata.duration = int(audio.info.length)
             metadata.sample_rate = audio.info.sample_rate
             metadata.channels = audio.info.channels
@@ -143,13 +185,14 @@ class MetadataHandler:
         return metadata
     
     @staticmethod
-    def _extract_ogg_metadata(file_path, metadata):
-        """Extract metadata from OGG file"""
+    def _extract_vorbis_metadata(file_path, metadata, reader):
+        """Extract metadata from a Vorbis-comment file (OGG, FLAC, Opus)"""
         try:
-            audio = OggVorbis(file_path)
+            audio = reader(file_path)
             metadata.duration = int(audio.info.length)
-            metadata.bitrate = audio.info.bitrate
-            metadata.sample_rate = audio.info.sample_rate
+            metadata.bitrate = getattr(audio.info, "bitrate", 0)
+            metadata.sample_rate = getattr(audio.info, "sample_rate", 48000)  # Opus always decodes at 48 kHz
+            metadata.channels = audio.info.channels
             
             # Extract Vorbis comments
             if audio.tags:
@@ -170,7 +213,40 @@ class MetadataHandler:
                     metadata.quote = tags['comment'][0]
                     
         except Exception as e:
-            print(f"Error processing OGG file {file_path}: {e}")
+            print(f"Error processing Vorbis comments in {file_path}: {e}")
+            
+        return metadata
+    
+    @staticmethod
+    def _extract_mp4_metadata(file_path, metadata, reader):
+        """Extract metadata from M4A file"""
+        try:
+            audio = reader(file_path)
+            metadata.duration = int(audio.info.length)
+            metadata.bitrate = audio.info.bitrate
+            metadata.sample_rate = audio.info.sample_rate
+            metadata.channels = audio.info.channels
+            
+            # iTunes-style atoms
+            if audio.tags:
+                tags = audio.tags
+                if '\xa9nam' in tags:
+                    metadata.title = tags['\xa9nam'][0]
+                if '\xa9ART' in tags:
+                    metadata.artist = tags['\xa9ART'][0]
+                if '\xa9alb' in tags:
+                    metadata.album = tags['\xa9alb'][0]
+                if '\xa9day' in tags:
+                    metadata.year = tags['\xa9day'][0]
+                if '\xa9gen' in tags:
+                    metadata.genre = tags['\xa9gen'][0]
+                if 'trkn' in tags:
+                    metadata.track_number = str(tags['trkn'][0][0])
+                if '\xa9cmt' in tags:
+                    metadata.quote = tags['\xa9cmt'][0]
+                    
+        except Exception as e:
+            print(f"Error processing M4A file {file_path}: {e}")
             
         return metadata
     
@@ -214,6 +290,13 @@ class MetadataDisplayWidget(QWidget):
         self.title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(self.title_label)
         
+        # Cover art
+        self.art_label = QLabel()
+        self.art_label.setFixedSize(config.ALBUM_ART_SIZE, config.ALBUM_ART_SIZE)
+        self.art_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.art_label, alignment=Qt.AlignmentFlag.AlignHCenter)
+        self.set_art(None)
+        
         # Metadata fields
         self.metadata_layout = QVBoxLayout()
         
@@ -290,6 +373,16 @@ class MetadataDisplayWidget(QWidget):
             self.duration_label.setText("Duration: 0:00")
             self.file_info_label.setText("File: No file selected")
             self.quote_text.setText("")
+            self.set_art(None)
+    
+    def set_art(self, pixmap):
+        """Show a cover thumbnail, or a placeholder for None or a null pixmap"""
+        if pixmap is None or pixmap.isNull():
+            self.art_label.setPixmap(QPixmap())
+            self.art_label.setText("💿")
+            self.art_label.setFont(QFont("Arial", 48))
+        else:
+            self.art_label.setPixmap(pixmap)
     
     def clear_display(self):
         """Clear the metadata display"""
@@ -300,21 +393,64 @@ class PlaylistMetadataManager:
     
     def __init__(self):
         self.metadata_cache = {}  # Cache metadata to avoid repeated extraction
+        self.album_tracks = {}  # Album -> paths of the cached tracks on it
+        self.listeners = []  # Called with (file_path, metadata) whenever metadata is extracted
         
     def get_metadata(self, file_path):
         """Get metadata for a file, using cache if available"""
+        cached = self.metadata_cache.get(file_path)
+        if cached is not None and not cached.tags_only:
+            return cached
+        
+        metadata = MetadataHandler.extract_metadata(file_path)
+        self.cache(file_path, metadata)
+        self.notify(file_path, metadata)
+        return metadata
+    
+    def get_display_metadata(self, file_path):
+        """Get enough metadata to list a file, reading as little of it as possible"""
         if file_path in self.metadata_cache:
             return self.metadata_cache[file_path]
         
-        metadata = MetadataHandler.extract_metadata(file_path)
-        self.metadata_cache[file_path] = metadata
+        metadata = MetadataHandler.extract_display_metadata(file_path)
+        self.cache(file_path, metadata)
+        self.notify(file_path, metadata)
         return metadata
     
+    def cache(self, file_path, metadata):
+        """Cache a file's metadata and file it under its album"""
+        self.uncache(file_path)
+        self.metadata_cache[file_path] = metadata
+        if metadata.album:
+            self.album_tracks.setdefault(metadata.album, set()).add(file_path)
+    
+    def uncache(self, file_path):
+        """Drop a file's metadata and its album entry"""
+        metadata = self.metadata_cache.pop(file_path, None)
+        if metadata is not None and metadata.album:
+            tracks = self.album_tracks.get(metadata.album)
+            if tracks is not None:
+                tracks.discard(file_path)
+                if not tracks:
+                    del self.album_tracks[metadata.album]
+    
+    def tracks_on_album(self, album):
+        """Paths of the cached tracks on an album"""
+        return self.album_tracks.get(album, set())
+    
+    def notify(self, file_path, metadata):
+        """Pass freshly extracted metadata to every listener"""
+        for listener in self.listeners:
+            try:
+                listener(file_path, metadata)
+            except Exception as e:
+                print(f"Error handling metadata for {file_path}: {e}")
+    
     def clear_cache(self):
         """Clear the metadata cache"""
         self.metadata_cache.clear()
+        self.album_tracks.clear()
     
     def remove_from_cache(self, file_path):
         """Remove a file from the metadata cache"""
-        if file_path in self.metadata_cache:
-            del self.metadata_cache[file_path] 
\ No newline at end of file
+        self.uncache(file_path) 
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+MP3 Seek Index for ChakraBeats
+Frame-header scanning, Xing TOC parsing and cached seek tables for VBR MP3 files
+"""
+
+import os
+from itertools import islice
+import numpy as np
+
+import audio_formats
+import config
+from scheduler import ScheduledWorker, PRIORITY_PLAYING
+
+# Bytes read per refill while walking frame headers
+SCAN_CHUNK = 65536
+
+# Frames sampled to estimate the average frame size without an index or Xing header
+PROBE_FRAMES = 64
+
+# Bitrates in kbps by (MPEG-1, layer) and (MPEG-2/2.5, layer)
+BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+class FrameHeader:
+    """Decoded fields of a 4-byte MPEG audio frame header"""
+    
+    def __init__(self, version, layer, sample_rate, length, samples, channels):
+        self.version = version  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+        self.layer = layer
+        self.sample_rate = sample_rate
+        self.length = length  # Frame size in bytes including the header
+        self.samples = samples  # Samples per channel in the frame
+        self.channels = channels
+    
+    def matches(self, other):
+        """True if both frames can belong to the same stream"""
+        return (self.version == other.version and self.layer == other.layer and
+                self.sample_rate == other.sample_rate)
+
+# Parsed headers keyed by their last three bytes; real files use only a handful
+_header_cache = {}
+
+def parse_header(data, position):
+    """Parse the frame header at data[position], or return None if there is none"""
+    if data[position] != 0xFF:
+        return None
+    key = (data[position + 1], data[position + 2], data[position + 3] & 0xC0)
+    if key in _header_cache:
+        return _header_cache[key]
+    
+    b1, b2, b3 = key
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 3
+    header = None
+    if (b1 & 0xE0) == 0xE0 and version != 1 and layer != 4 and 0 < bitrate_index < 15 and rate_index != 3:
+        mpeg1 = version == 3
+        bitrate = BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+        sample_rate = SAMPLE_RATES[version][rate_index]
+        padding = (b2 >> 1) & 1
+        if layer == 1:
+            samples = 384
+            length = (12 * bitrate // sample_rate + padding) * 4
+        else:
+            samples = 1152 if mpeg1 or layer == 2 else 576
+            length = (samples // 8) * bitrate // sample_rate + padding
+        header = FrameHeader(version, layer, sample_rate, length, samples, 1 if b3 == 0xC0 else 2)
+    
+    _header_cache[key] = header
+    return header
+
+def skip_id3v2(file):
+    """Return the offset just past a leading ID3v2 tag (0 if there is none)"""
+    file.seek(0)
+    tag = file.read(10)
+    if len(tag) < 10 or tag[:3] != b"ID3":
+        return 0
+    size = (tag[6] << 21) | (tag[7] << 14) | (tag[8] << 7) | tag[9]
+    footer = 10 if tag[5] & 0x10 else 0
+    return 10 + size + footer
+
+def scan_frames(file, start, reference=None):
+    """Yield (offset, header) for consecutive frames from start, resyncing over junk"""
+    offset = start  # File offset of buffer[0]
+    buffer = b""
+    position = 0
+    synced = False
+    
+    while True:
+        if len(buffer) - position < 4:
+            offset += position
+            file.seek(offset)
+            buffer = file.read(SCAN_CHUNK)
+            position = 0
+            if len(buffer) < 4:
+                return
+        
+        header = parse_header(buffer, position)
+        if header is not None and reference is not None and not header.matches(reference):
+            header = None
+        
+        if header is not None and not synced:
+            # Only trust a new sync if the following frame lines up too
+            following = position + header.length
+            if following + 4 <= len(buffer):
+                next_header = parse_header(buffer, following)
+                if next_header is None or not next_header.matches(header):
+                    header = None
+        
+        if header is None:
+            synced = False
+            next_sync = buffer.find(b"\xff", position + 1)
+            position = next_sync if next_sync >= 0 else len(buffer)
+            continue
+        
+        synced = True
+        reference = reference or header
+        yield offset + position, header
+        position += header.length
+
+class XingHeader:
+    """Frame count, byte count and 100-point TOC from a Xing/Info header"""
+    
+    def __init__(self, frame_offset, frames, size, toc):
+        self.frame_offset = frame_offset  # Offset of the Xing frame itself
+        self.frames = frames
+        self.size = size
+        self.toc = toc
+    
+    @classmethod
+    def parse(cls, frame, frame_offset, header):
+        """Parse the Xing/Info tag inside the first frame, or return None"""
+        if header.layer != 3:
+            return None
+        if header.version == 3:
+            side_info = 17 if header.channels == 1 else 32
+        else:
+            side_info = 9 if header.channels == 1 else 17
+        tag = 4 + side_info
+        if frame[tag:tag + 4] not in (b"Xing", b"Info"):
+            return None
+        
+        flags = int.from_bytes(frame[tag + 4:tag + 8], "big")
+        position = tag + 8
+        frames = size = 0
+        toc = None
+        if flags & 1:
+            frames = int.from_bytes(frame[position:position + 4], "big")
+            position += 4
+        if flags & 2:
+            size = int.from_bytes(frame[position:position + 4], "big")
+            position += 4
+        if flags & 4 and len(frame) >= position + 100:
+            toc = np.frombuffer(frame[position:position + 100], dtype=np.uint8).astype(np.float64)
+        return cls(frame_offset, frames, size, toc)
+    
+    def offset_for(self, fraction):
+        """Approximate byte offset of a fraction of the track, or None without a TOC"""
+        if self.toc is None or self.size <= 0:
+            return None
+        percent = min(max(fraction * 100.0, 0.0), 99.999)
+        index = int(percent)
+        low = self.toc[index]
+        high = self.toc[index + 1] if index < 99 else 256.0
+        return self.frame_offset + int((low + (high - low) * (percent - index)) / 256.0 * self.size)
+
+class Mp3Info:
+    """Where the audio of an MP3 starts and what its first frame looks like"""
+    
+    def __init__(self, audio_start, header, xing, frame_size):
+        self.audio_start = audio_start  # Offset of the first audio frame
+        self.header = header
+        self.xing = xing
+        self.frame_size = frame_size  # Average bytes per frame near the start
+    
+    @classmethod
+    def probe(cls, file):
+        """Locate the first audio frame, skipping ID3v2 tags and the Xing frame"""
+        for offset, header in scan_frames(file, skip_id3v2(file)):
+            file.seek(offset)
+            xing = XingHeader.parse(file.read(header.length), offset, header)
+            audio_start = offset + header.length if xing else offset
+            break
+        else:
+            raise ValueError("No MPEG audio frames found")
+        
+        sizes = [frame.length for _, frame in islice(scan_frames(file, audio_start, header), PROBE_FRAMES)]
+        return cls(audio_start, header, xing, sum(sizes) / len(sizes) if sizes else header.length)
+    
+    def estimated_frames(self, file_size):
+        """Audio frame count from the Xing header, or from the average frame size"""
+        if self.xing and self.xing.frames:
+            return self.xing.frames
+        return int(max(0, file_size - self.audio_start) / self.frame_size)
+    
+    def stream_info(self, file_size):
+        """Duration in seconds and average bitrate in bits per second, without reading past the first frames"""
+        seconds = self.estimated_frames(file_size) * self.header.samples / self.header.sample_rate
+        audio_bytes = self.xing.size if self.xing and self.xing.size else max(0, file_size - self.audio_start)
+        return seconds, int(audio_bytes * 8 / seconds) if seconds > 0 else 0
+
+class Mp3SeekIndex:
+    """Byte offset of the first frame at every interval_ms, built by one header scan"""
+    
+    def __init__(self, offsets, sample_rate, samples_per_frame, frame_count, interval_ms):
+        self.offsets = offsets
+        self.sample_rate = sample_rate
+        self.samples_per_frame = samples_per_frame
+        self.frame_count = frame_count
+        self.interval_ms = interval_ms
+        self.entry_frames = self.frame_for_entry(np.arange(len(offsets), dtype=np.int64))
+    
+    def frame_for_entry(self, entry):
+        """Number of the first frame that starts at or after entry * interval_ms"""
+        return -(-entry * self.interval_ms * self.sample_rate // (1000 * self.samples_per_frame))
+    
+    def locate(self, frame):
+        """Return (frame number, byte offset) of the closest entry at or before frame"""
+        entry = max(0, int(np.searchsorted(self.entry_frames, frame, side='right')) - 1)
+        return int(self.entry_frames[entry]), int(self.offsets[entry])
+    
+    @classmethod
+    def build(cls, file_path, interval_ms=config.MP3_INDEX_INTERVAL_MS):
+        """Scan every frame header once; memory grows only with the table itself"""
+        with open(file_path, "rb") as file:
+            info = Mp3Info.probe(file)
+            header = info.header
+            offsets = []
+            entry = 0
+            next_entry_frame = 0
+            frame = 0
+            step = 1000 * header.samples
+            
+            for offset, _ in scan_frames(file, info.audio_start, header):
+                while frame >= next_entry_frame:
+                    offsets.append(offset)
+                    entry += 1
+                    next_entry_frame = -(-entry * interval_ms * header.sample_rate // step)
+                frame += 1
+        
+        return cls(np.array(offsets, dtype=np.uint64), header.sample_rate, header.samples, frame, interval_ms)
+    
+    def save(self, path):
+        """Write the table as a small .npz file"""
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, offsets=self.offsets,
+                 params=np.array([self.sample_rate, self.samples_per_frame, self.frame_count, self.interval_ms],
+                                 dtype=np.int64))
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        """Load a table written by save()"""
+        with np.load(path) as data:
+            sample_rate, samples_per_frame, frame_count, interval_ms = (int(v) for v in data["params"])
+            return cls(data["offsets"], sample_rate, samples_per_frame, frame_count, interval_ms)
+
+class SeekIndexCache:
+    """Per-file seek tables under the app data directory"""
+    
+    @staticmethod
+    def get(file_path):
+        """Return the stored table or None if it has not been built yet"""
+        try:
+            cache_path = config.get_track_cache_path("mp3index", file_path, ".npz")
+            if os.path.exists(cache_path):
+                return Mp3SeekIndex.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+    
+    @staticmethod
+    def store(file_path, index):
+        """Persist a table for a file"""
+        try:
+            index.save(config.get_track_cache_path("mp3index", file_path, ".npz"))
+        except OSError as e:
+            print(f"Error saving seek index for {file_path}: {e}")
+
+def build_seek_index(file_path):
+    """Worker: build and cache the seek table of an MP3 that has none (other formats are skipped)"""
+    audio_format = audio_formats.detect(file_path)
+    if audio_format and audio_format.decoder == "mp3" and SeekIndexCache.get(file_path) is None:
+        SeekIndexCache.store(file_path, Mp3SeekIndex.build(file_path))
+
+class SeekIndexThread(ScheduledWorker):
+    """Background worker that has the scheduler's processes build missing seek tables"""
+    
+    def request(self, file_path, priority=PRIORITY_PLAYING):
+        """Queue a file for indexing unless it is already queued"""
+        self.enqueue([file_path], priority)
+    
+    def start_job(self, file_path, priority):
+        return self.scheduler.submit(build_seek_index, file_path, priority=priority)
+    
+    def job_done(self, file_path, future, priority):
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Error building seek index for {file_path}: {e}")
\ No newline at end of file
@@ -0,0 +1,223 @@
+"""
+Play Statistics for ChakraBeats
+Favorites and listening history kept as an append-only event log with maintained aggregates
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from PyQt6.QtCore import QThread
+
+import config
+
+# Playlist views answered from the aggregates rather than by rules
+STATS_VIEWS = {
+    "stats:recent": "🕘 Recently Played",
+    "stats:top": "🏆 Top Played",
+}
+
+class PlayStats:
+    """Favorites, play counts and recent plays; every change is also an event for the log"""
+    
+    def __init__(self, snapshot_path=None, log_path=None):
+        self.snapshot_path = snapshot_path or config.get_favorites_path()
+        self.log_path = log_path or config.get_history_path()
+        self.lock = threading.Lock()
+        self.pending = []  # Events not yet in the log
+        self.logged = 0  # Events in the log since the last compaction
+        self.sequence = 0  # Number of the last event, so a replay skips what the snapshot holds
+        self.reset()
+        self.load()
+    
+    def reset(self):
+        self.favorites = set()
+        self.plays = {}  # Track path -> play count
+        self.recent = OrderedDict()  # Track path -> last play time, most recent last
+        self.buckets = {}  # Play count -> tracks with that count, in the order they reached it
+    
+    def is_favorite(self, file_path):
+        return file_path in self.favorites
+    
+    def play_count(self, file_path):
+        return self.plays.get(file_path, 0)
+    
+    def last_played(self, file_path):
+        return self.recent.get(file_path)
+    
+    def tracks(self):
+        """Every track with a play or a favorite"""
+        return self.favorites | self.plays.keys()
+    
+    def most_played(self, limit):
+        """Up to limit track paths, most played first"""
+        tracks = []
+        for count in sorted(self.buckets, reverse=True):
+            tracks.extend(self.buckets[count])
+            if len(tracks) >= limit:
+                break
+        return tracks[:limit]
+    
+    def recently_played(self, limit):
+        """Up to limit track paths, last played first"""
+        tracks = []
+        for file_path in reversed(self.recent):
+            if len(tracks) >= limit:
+                break
+            tracks.append(file_path)
+        return tracks
+    
+    def view(self, key, limit):
+        """Tracks of one of the STATS_VIEWS"""
+        return self.recently_played(limit) if key == "stats:recent" else self.most_played(limit)
+    
+    def record_play(self, file_path):
+        self.record({"type": "play", "path": file_path, "time": time.time()})
+    
+    def set_favorite(self, file_path, favorite):
+        if favorite != self.is_favorite(file_path):
+            self.record({"type": "favorite", "path": file_path, "value": favorite})
+    
+    def rename(self, old_path, new_path):
+        """Carry a renamed track's plays and favorite over to its new path"""
+        if old_path in self.favorites or old_path in self.plays:
+            self.record({"type": "rename", "path": old_path, "to": new_path})
+    
+    def record(self, event):
+        """Apply an event now and queue it for the next batched write"""
+        with self.lock:
+            self.sequence += 1
+            event["n"] = self.sequence
+            self.apply(event)
+            self.pending.append(event)
+    
+    def apply(self, event):
+        """Update the aggregates for one event"""
+        file_path = event["path"]
+        if event["type"] == "play":
+            count = self.take_plays(file_path) + 1
+            self.plays[file_path] = count
+            self.buckets.setdefault(count, {})[file_path] = None
+            self.recent[file_path] = event["time"]
+            self.recent.move_to_end(file_path)
+        elif event["type"] == "favorite":
+            if event["value"]:
+                self.favorites.add(file_path)
+            else:
+                self.favorites.discard(file_path)
+        elif event["type"] == "rename":
+            new_path = event["to"]
+            if file_path in self.favorites:
+                self.favorites.discard(file_path)
+                self.favorites.add(new_path)
+            # A track moved onto a path with a history of its own takes both
+            count = self.take_plays(file_path) + self.take_plays(new_path)
+            if count:
+                self.plays[new_path] = count
+                self.buckets.setdefault(count, {})[new_path] = None
+            if file_path in self.recent:
+                self.recent[new_path] = max(self.recent.pop(file_path), self.recent.get(new_path, 0))
+                # Renames are rare; rebuilding puts the track back in its place by play time
+                self.recent = OrderedDict(sorted(self.recent.items(), key=lambda item: item[1]))
+    
+    def take_plays(self, file_path):
+        """Remove a track's play count from the aggregates and return it"""
+        count = self.plays.pop(file_path, 0)
+        if count:
+            bucket = self.buckets[count]
+            del bucket[file_path]
+            if not bucket:
+                del self.buckets[count]
+        return count
+    
+    def snapshot(self):
+        return {
+            "sequence": self.sequence,
+            "favorites": sorted(self.favorites),
+            "plays": self.plays,
+            "recent": list(self.recent.items())
+        }
+    
+    def load(self):
+        """Load the last snapshot, then replay the events logged after it"""
+        try:
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, "r") as f:
+                    snapshot = json.load(f)
+                self.sequence = snapshot.get("sequence", 0)
+                self.favorites = set(snapshot.get("favorites", []))
+                for file_path, count in snapshot.get("plays", {}).items():
+                    self.plays[file_path] = count
+                    self.buckets.setdefault(count, {})[file_path] = None
+                self.recent = OrderedDict((file_path, played) for file_path, played in snapshot.get("recent", []))
+        except Exception as e:
+            print(f"Error loading play statistics: {e}")
+        
+        try:
+            if os.path.exists(self.log_path):
+                with open(self.log_path, "r") as f:
+                    for line in f:
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            continue  # A line cut short by a crash
+                        self.logged += 1
+                        if event.get("n", 0) > self.sequence:
+                            self.sequence = event["n"]
+                            self.apply(event)
+        except Exception as e:
+            print(f"Error loading listening history: {e}")
+    
+    def write_pending(self):
+        """Append queued events to the log, or fold everything into a new snapshot once the log is long"""
+        with self.lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+            compact = self.logged + len(batch) >= config.STATS_COMPACT_EVENTS
+            snapshot = json.dumps(self.snapshot()) if compact else None
+            self.logged = 0 if compact else self.logged + len(batch)
+        
+        try:
+            if compact:
+                # The snapshot already holds the batch; its sequence number makes the old log harmless
+                tmp_path = self.snapshot_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(snapshot)
+                os.replace(tmp_path, self.snapshot_path)
+                open(self.log_path, "w").close()
+            else:
+                with open(self.log_path, "a") as f:
+                    f.write("".join(json.dumps(event) + "\n" for event in batch))
+        except Exception as e:
+            print(f"Error saving play statistics: {e}")
+
+class StatsWriter(QThread):
+    """Writes queued play statistics events off the GUI thread"""
+    
+    def __init__(self, stats, parent=None):
+        super().__init__(parent)
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.active = False
+    
+    def flush(self):
+        """Write whatever is queued, in the background"""
+        with self.lock:
+            if self.active or not self.stats.pending:
+                return
+            self.active = True
+        
+        self.wait()
+        self.start(QThread.Priority.LowPriority)
+    
+    def stop(self):
+        """Finish writing, including events queued since the last flush"""
+        self.wait()
+        self.stats.write_pending()
+    
+    def run(self):
+        self.stats.write_pending()
+        with self.lock:
+            self.active = False
\ No newline at end of file
@@ -0,0 +1,377 @@
+"""
+Playback Engine for ChakraBeats
+Block-based PCM output on a pygame mixer channel with a monotonic playback clock
+"""
+
+import time
+from collections import deque
+import numpy as np
+import pygame
+
+import config
+from audio_decoder import ensure_mixer, restart_mixer, MIXER_BUFFER
+
+# Transitions observed this close to their predicted time are snapped to it
+CLOCK_SNAP_SECONDS = 0.05
+
+class PlaybackClock:
+    """Playback position derived from the frames the output device has played"""
+    
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.reset(0)
+    
+    def reset(self, frame):
+        """Restart the clock at a stream frame (after load or seek)"""
+        self.base_frame = frame
+        self.delivered = 0  # Frames of blocks the device has finished
+        self.current_block = 0  # Frames in the block the device is playing
+        self.block_start = None  # Monotonic time the current block started
+        self.paused_at = None
+        self.last_frame = frame
+    
+    def shift(self, frames):
+        """Re-express the position in another stream's frames (gapless or crossfade switch)"""
+        self.base_frame += frames
+        self.last_frame = max(0, self.last_frame + frames)
+    
+    def block_started(self, frames, now):
+        """A block became the one being played by the device"""
+        if self.block_start is not None and self.paused_at is None:
+            # Back-to-back blocks: the new one started when the old one ended
+            predicted = self.block_start + self.current_block / self.sample_rate
+            if abs(now - predicted) < CLOCK_SNAP_SECONDS:
+                now = predicted
+        self.current_block = frames
+        self.block_start = now
+    
+    def block_finished(self, frames):
+        """The device finished playing a block"""
+        self.delivered += frames
+    
+    def stopped(self):
+        """Nothing is playing any more (end of stream or underrun)"""
+        self.current_block = 0
+        self.block_start = None
+    
+    def pause(self, now):
+        self.paused_at = now
+    
+    def resume(self, now):
+        if self.paused_at is not None and self.block_start is not None:
+            self.block_start += now - self.paused_at
+        self.paused_at = None
+    
+    def position_frames(self, now=None):
+        """Current stream frame, interpolated within the playing block"""
+        frame = self.base_frame + self.delivered
+        if self.block_start is not None:
+            current = self.paused_at if self.paused_at is not None else (now or time.monotonic())
+            elapsed = (current - self.block_start) * self.sample_rate
+            frame += int(min(max(elapsed, 0), self.current_block))
+        
+        # Never run backwards between resets
+        frame = max(frame, self.last_frame)
+        self.last_frame = frame
+        return frame
+    
+    def position_ms(self, now=None):
+        """Current position in milliseconds"""
+        return int(self.position_frames(now) * 1000 / self.sample_rate)
+
+class PcmOutput:
+    """Feeds float PCM blocks to a reserved mixer channel through pooled Sounds"""
+    
+    POOL_SIZE = 3  # Playing, queued and one being filled
+    
+    def __init__(self, block_frames=config.OUTPUT_BLOCK_FRAMES):
+        ensure_mixer()
+        self.in_flight = deque()  # (slot, valid frames) in device order
+        self.underruns = 0
+        self.starved = False  # The device ran dry while playback was expected to continue
+        self.attach(block_frames)
+    
+    def attach(self, block_frames):
+        """Bind to the mixer's current device format"""
+        self.sample_rate, _, self.channels = pygame.mixer.get_init()
+        pygame.mixer.set_reserved(1)
+        self.channel = pygame.mixer.Channel(0)
+        self.clock = PlaybackClock(self.sample_rate)
+        self.allocate(block_frames)
+    
+    def reopen(self, sample_rate):
+        """Restart the device at another sample rate (drops anything queued)"""
+        self.flush()
+        self.free = None
+        restart_mixer(sample_rate)
+        self.attach(self.block_frames)
+    
+    def allocate(self, block_frames):
+        """(Re)allocate the Sound pool; blocks already queued play out at their old size"""
+        if getattr(self, "free", None) is not None and block_frames == self.block_frames:
+            return
+        self.block_frames = block_frames
+        self.free = [self.make_slot(block_frames) for _ in range(self.POOL_SIZE - len(self.in_flight))]
+        self.scratch = np.zeros((block_frames, self.channels), dtype=np.float32)
+    
+    def make_slot(self, block_frames):
+        """A Sound plus a writable view straight into its sample memory"""
+        sound = pygame.sndarray.make_sound(np.zeros((block_frames, self.channels), dtype=np.int16))
+        return sound, pygame.sndarray.samples(sound)
+    
+    def pump(self, now=None):
+        """Account for blocks the device has finished; returns True if one can be submitted"""
+        now = now or time.monotonic()
+        in_device = int(self.channel.get_busy()) + int(self.channel.get_queue() is not None)
+        
+        while len(self.in_flight) > in_device:
+            slot, frames = self.in_flight.popleft()
+            self.clock.block_finished(frames)
+            # Slots from before a resize are replaced as they come back
+            self.free.append(slot if len(slot[1]) == self.block_frames else self.make_slot(self.block_frames))
+            if self.in_flight:
+                self.clock.block_started(self.in_flight[0][1], now)
+            else:
+                self.clock.stopped()
+                self.starved = True
+        
+        return len(self.in_flight) < 2
+    
+    def submit(self, block, gain=1.0, now=None):
+        """Convert a float block into a free Sound and play or queue it"""
+        frames = len(block)
+        slot = self.free.pop()
+        if self.starved:
+            # Only a block following a dry device counts; end of stream is never followed
+            self.underruns += 1
+            self.starved = False
+        
+        scratch = self.scratch[:frames]
+        if block.shape[1] != self.channels:
+            block = np.repeat(block[:, :1], self.channels, axis=1)
+        np.multiply(block, gain * 32767.0, out=scratch)
+        np.clip(scratch, -32768.0, 32767.0, out=scratch)
+        
+        sound, buffer = slot
+        np.copyto(buffer[:frames], scratch, casting='unsafe')
+        buffer[frames:] = 0
+        
+        if self.in_flight:
+            self.channel.queue(sound)
+        else:
+            self.channel.play(sound)
+            self.clock.block_started(frames, now or time.monotonic())
+        self.in_flight.append((slot, frames))
+    
+    def queued_seconds(self, now=None):
+        """Audio still ahead of the device: the rest of the playing block plus queued ones"""
+        if not self.in_flight or self.clock.block_start is None:
+            return 0.0
+        played = ((now or time.monotonic()) - self.clock.block_start) * self.sample_rate
+        queued = sum(frames for _, frames in self.in_flight) - min(max(played, 0), self.in_flight[0][1])
+        return queued / self.sample_rate
+    
+    @property
+    def latency_ms(self):
+        """Worst-case output latency: two queued blocks plus the device buffer"""
+        return (2 * self.block_frames + MIXER_BUFFER) * 1000 / self.sample_rate
+    
+    @property
+    def idle(self):
+        """True once every submitted block has been played"""
+        return not self.in_flight
+    
+    def flush(self):
+        """Drop everything queued on the device"""
+        if hasattr(self, "channel"):
+            self.channel.stop()
+        if hasattr(self, "in_flight"):
+            while self.in_flight:
+                slot, _ = self.in_flight.popleft()
+                if self.free is not None:
+                    self.free.append(slot if len(slot[1]) == self.block_frames else self.make_slot(self.block_frames))
+            self.clock.stopped()
+        self.starved = False
+    
+    def pause(self):
+        self.channel.pause()
+        self.clock.pause(time.monotonic())
+    
+    def resume(self):
+        self.channel.unpause()
+        self.clock.resume(time.monotonic())
+
+class PcmHistory:
+    """The audio most recently handed to the output, kept for the visualizer"""
+    
+    def __init__(self, frames, channels):
+        self.data = np.zeros((frames, channels), dtype=np.float32)
+        self.written = 0  # Frames written since the last clear
+    
+    def write(self, block):
+        """Append a (frames, channels) block; mono is spread over the channels"""
+        capacity = len(self.data)
+        kept = block[-capacity:]
+        start = (self.written + len(block) - len(kept)) % capacity
+        first = min(len(kept), capacity - start)
+        self.data[start:start + first] = kept[:first]
+        self.data[:len(kept) - first] = kept[first:]
+        self.written += len(block)
+    
+    def read(self, end, frames):
+        """Copy of the frames before a write count, or None if they were never written or are overwritten"""
+        start = end - frames
+        if start < max(0, self.written - len(self.data)) or end > self.written:
+            return None
+        return self.data[np.arange(start, end) % len(self.data)]
+    
+    def clear(self):
+        self.written = 0
+
+class QueueDepthTuner:
+    """Sizes the blocks queued ahead of the fixed device buffer from wake-up jitter, queue slack and underruns"""
+    
+    def __init__(self, block_frames, sample_rate):
+        self.block_frames = block_frames
+        self.sample_rate = sample_rate
+        self.jitter = 0.0  # Worst wake-up lateness of the last finished window
+        self.last_underruns = 0
+        self.clean_windows = 0
+        self.shrink_windows = config.OUTPUT_SHRINK_WINDOWS  # Backs off each time a smaller size fails
+        self.start_window(None)
+    
+    def start_window(self, now):
+        self.window_start = now
+        self.max_lateness = 0.0
+        self.min_slack = float("inf")
+    
+    def observe_wakeup(self, lateness):
+        """Record how late the playback thread woke up"""
+        self.max_lateness = max(self.max_lateness, lateness)
+    
+    def observe_slack(self, slack):
+        """Record how much audio was left when the next block went in"""
+        self.min_slack = min(self.min_slack, slack)
+    
+    def update(self, underruns, now):
+        """Return a new block size when one is due, otherwise None"""
+        if self.window_start is None:
+            self.window_start = now
+        margin = config.OUTPUT_POLL_MS / 1000.0 + 2 * self.max_lateness
+        
+        if underruns > self.last_underruns or self.min_slack < margin:
+            # Dry or nearly dry: grow straight away
+            self.last_underruns = underruns
+            self.clean_windows = 0
+            self.shrink_windows = min(self.shrink_windows * 2, 16 * config.OUTPUT_SHRINK_WINDOWS)
+            self.jitter = max(self.jitter, self.max_lateness)
+            self.start_window(now)
+            return self.resize(self.block_frames * 2)
+        
+        if now - self.window_start < config.OUTPUT_TUNE_WINDOW_SECONDS:
+            return None
+        
+        # A clean window: shrink once halving the block would still leave a wide margin
+        self.clean_windows += 1
+        half_block = self.block_frames / 2 / self.sample_rate
+        shrink = (self.clean_windows >= self.shrink_windows and
+                  self.min_slack - half_block > 2 * margin)
+        self.jitter = self.max_lateness
+        self.start_window(now)
+        if shrink:
+            self.clean_windows = 0
+            return self.resize(self.block_frames // 2)
+        return None
+    
+    def resize(self, block_frames):
+        block_frames = max(config.OUTPUT_BLOCK_MIN_FRAMES, min(block_frames, config.OUTPUT_BLOCK_MAX_FRAMES))
+        if block_frames == self.block_frames:
+            return None
+        self.block_frames = block_frames
+        return block_frames
+
+class CrossfadeMixer:
+    """Blends the tail of one stream into the head of the next with equal-power curves"""
+    
+    def __init__(self, block_frames, channels, sample_rate):
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.fade_in = self.fade_out = np.zeros((0, 1), dtype=np.float32)
+        self.outgoing = None
+        self.allocate(block_frames)
+        
+        # Cost of the blending work, to keep an eye on the overlap's CPU share
+        self.mix_seconds = 0.0
+        self.mixed_frames = 0
+    
+    def allocate(self, block_frames):
+        """(Re)allocate the mix buffers for a block size"""
+        self.block_frames = block_frames
+        self.mix = np.zeros((block_frames, self.channels), dtype=np.float32)
+        self.scratch = np.zeros((block_frames, self.channels), dtype=np.float32)
+    
+    def set_length(self, frames):
+        """Precompute the gain curves; only done when the crossfade length changes"""
+        if frames == len(self.fade_in):
+            return
+        angle = (np.arange(frames, dtype=np.float32) + 0.5) * np.float32(np.pi / 2 / max(frames, 1))
+        self.fade_in = np.sin(angle).reshape(-1, 1)
+        self.fade_out = np.cos(angle).reshape(-1, 1)
+    
+    @property
+    def active(self):
+        return self.outgoing is not None
+    
+    @property
+    def load(self):
+        """Fraction of real time spent blending during overlaps"""
+        if self.mixed_frames == 0:
+            return 0.0
+        return self.mix_seconds / (self.mixed_frames / self.sample_rate)
+    
+    def start(self, outgoing, outgoing_gain, incoming, incoming_gain, frames):
+        """Begin a transition of up to the curve length from outgoing to incoming"""
+        self.outgoing = outgoing
+        self.incoming = incoming
+        self.outgoing_gain = outgoing_gain
+        self.incoming_gain = incoming_gain
+        self.offset = len(self.fade_in) - min(frames, len(self.fade_in))  # Short tails start part-way in
+    
+    def cancel(self):
+        """Drop the outgoing stream (seek or manual track change mid-transition)"""
+        if self.outgoing is not None:
+            self.outgoing.close()
+            self.outgoing = None
+    
+    def read(self, frame_count):
+        """Return the next mixed block; the transition ends when the curves run out"""
+        started = time.perf_counter()
+        count = min(frame_count, self.block_frames, len(self.fade_in) - self.offset)
+        head = self.fit(self.incoming.read(count))
+        tail = self.fit(self.outgoing.read(count))
+        fade_in = self.fade_in[self.offset:self.offset + count]
+        fade_out = self.fade_out[self.offset:self.offset + count]
+        
+        mix = self.mix[:count]
+        mix[len(head):] = 0.0
+        np.multiply(head, fade_in[:len(head)], out=mix[:len(head)])
+        mix *= self.incoming_gain
+        
+        scratch = self.scratch[:len(tail)]
+        np.multiply(tail, fade_out[:len(tail)], out=scratch)
+        scratch *= self.outgoing_gain
+        mix[:len(tail)] += scratch
+        
+        self.offset += count
+        if self.offset >= len(self.fade_in) or (len(head) == 0 and not self.incoming.waiting):
+            self.cancel()
+        
+        self.mix_seconds += time.perf_counter() - started
+        self.mixed_frames += count
+        return mix[:max(len(head), len(tail))]
+    
+    def fit(self, block):
+        """View a block with the mixer's channel layout (mono is spread without copying)"""
+        if block.shape[1] != self.channels:
+            block = np.broadcast_to(block[:, :1], (len(block), self.channels))
+        return block
\ No newline at end of file
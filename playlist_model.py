@@ -0,0 +1,352 @@
+"""
+Playlist Model for ChakraBeats
+List model behind the playlist view: precomputed sort keys, cached orderings, grouping and search filtering
+"""
+
+import os
+import re
+import json
+import unicodedata
+import numpy as np
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
+from PyQt6.QtGui import QFont
+
+# Sort column -> (label, keys from most to least significant); ties keep the order tracks were added in
+SORT_COLUMNS = {
+    "added": ("Added", []),
+    "title": ("Title", ["title", "artist"]),
+    "artist": ("Artist", ["artist", "album", "track", "title"]),
+    "album": ("Album", ["album", "track", "title"]),
+    "year": ("Year", ["year", "artist", "album", "track"]),
+    "track": ("Track #", ["track", "album", "title"]),
+    "duration": ("Duration", ["duration", "title"]),
+    "bitrate": ("Bitrate", ["bitrate", "title"]),
+}
+
+# Columns whose first key can head a group
+GROUP_COLUMNS = ("artist", "album", "year")
+
+TEXT_KEYS = ("title", "artist", "album")
+NUMBER_KEYS = ("year", "track", "duration", "bitrate")
+
+# Numeric key of an unknown value, so unknowns sort last
+UNKNOWN = np.iinfo(np.int64).max
+
+LEADING_NUMBER = re.compile(r"\s*(\d+)")
+
+def text_key(text):
+    """Sort key of a name: case-folded, without accents or a leading 'The'"""
+    decomposed = unicodedata.normalize("NFKD", (text or "").casefold())
+    key = "".join(char for char in decomposed if not unicodedata.combining(char)).strip()
+    return key[4:] if key.startswith("the ") else key
+
+def number_key(value):
+    """Sort key of a number stored as text or int: '3/12' -> 3, '2019-05-01' -> 2019, unknown -> UNKNOWN"""
+    if isinstance(value, (int, float)):
+        return int(value) if value > 0 else UNKNOWN
+    match = LEADING_NUMBER.match(value or "")
+    return int(match.group(1)) if match else UNKNOWN
+
+def display_text(file_path, metadata=None):
+    """Playlist line of a track"""
+    if metadata is not None and metadata.title and metadata.artist:
+        return f"🎵 {metadata.title} - {metadata.artist}"
+    return f"🎵 {os.path.basename(file_path)}"
+
+class PlaylistModel(QAbstractListModel):
+    """Tracks in playlist order, shown sorted, grouped and filtered through a row permutation"""
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.header_font = QFont()
+        self.header_font.setBold(True)
+        self.decoration = None  # Callable(file_path) -> QIcon for the row's icon
+        
+        self.column = "added"
+        self.descending = False
+        self.grouped = False
+        self.reset_tracks()
+    
+    def reset_tracks(self):
+        self.paths = []
+        self.labels = []
+        self.index_of = {}  # File path -> track index
+        self.present = np.zeros(0, dtype=bool)  # False for tracks whose file was missing
+        self.fields = {name: [] for name in TEXT_KEYS}  # Names as written, for group headers
+        self.keys = {name: [] for name in TEXT_KEYS + NUMBER_KEYS}
+        self.ranks = {}  # Key name -> int64 rank per track, built on demand
+        self.orders = {}  # (sort column, descending) -> permutation, built on demand
+        self.matches = None  # Search mask over tracks, None when not filtering
+        self.scope = None  # Smart playlist mask over tracks, None for the whole library
+        self.order = np.zeros(0, dtype=np.int64)  # Tracks in the order last shown, filter aside
+        self.sequence = None  # Tracks next/previous walk: the shown ones, or all of them when none are
+        self.positions = None  # Track -> position in self.sequence
+        self.rows = np.zeros(0, dtype=np.int64)  # View row -> track, or -1 - header number
+        self.row_lookup = None  # Track -> view row, or -1
+        self.headers = []
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+        track = int(self.rows[index.row()])
+        if track < 0:
+            if role == Qt.ItemDataRole.DisplayRole:
+                return self.headers[-1 - track]
+            if role == Qt.ItemDataRole.FontRole:
+                return self.header_font
+            return None
+        
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.labels[track]
+        if role == Qt.ItemDataRole.UserRole:
+            return self.paths[track]
+        if role == Qt.ItemDataRole.DecorationRole and self.decoration is not None:
+            return self.decoration(self.paths[track])
+        return None
+    
+    def flags(self, index):
+        if index.isValid() and index.row() < len(self.rows) and self.rows[index.row()] < 0:
+            return Qt.ItemFlag.ItemIsEnabled  # Group headers cannot be selected
+        return super().flags(index)
+    
+    def add_tracks(self, file_paths, present=None):
+        """Append tracks, listed by file name until their metadata arrives"""
+        for file_path in file_paths:
+            self.index_of[file_path] = len(self.paths)
+            self.paths.append(file_path)
+            self.labels.append(display_text(file_path))
+            for name in TEXT_KEYS:
+                self.fields[name].append("")
+                self.keys[name].append("")
+            for name in NUMBER_KEYS:
+                self.keys[name].append(UNKNOWN)
+        added = np.ones(len(file_paths), dtype=bool) if present is None else np.array(present, dtype=bool)
+        self.present = np.concatenate((self.present, added))
+        if self.matches is not None:
+            self.matches = np.concatenate((self.matches, np.ones(len(file_paths), dtype=bool)))
+        if self.scope is not None:
+            self.scope = np.concatenate((self.scope, np.zeros(len(file_paths), dtype=bool)))
+        self.invalidate()
+        self.relayout()
+    
+    def set_present(self, file_paths, present):
+        """Show or hide tracks whose files appeared or disappeared"""
+        tracks = [self.index_of[file_path] for file_path in file_paths if file_path in self.index_of]
+        if tracks:
+            self.present[tracks] = present
+            self.relayout()
+    
+    def rename_track(self, old_path, new_path):
+        """Give a track a new path, keeping its place and sort keys"""
+        if new_path in self.index_of:
+            # Moved over a listed track: that row stays and this one goes, as if its file was deleted
+            self.set_present([old_path], False)
+            return
+        track = self.index_of.pop(old_path, None)
+        if track is None:
+            return
+        self.index_of[new_path] = track
+        self.paths[track] = new_path
+        self.track_changed(new_path)
+    
+    def update_metadata(self, file_path, metadata):
+        """Take a track's display text and sort keys from fresh metadata; the order follows on the next relayout"""
+        track = self.index_of.get(file_path)
+        if track is None:
+            return
+        self.labels[track] = display_text(file_path, metadata)
+        keys = {
+            "title": text_key(metadata.title or os.path.splitext(os.path.basename(file_path))[0]),
+            "artist": text_key(metadata.artist),
+            "album": text_key(metadata.album),
+            "year": number_key(metadata.year),
+            "track": number_key(metadata.track_number),
+            "duration": number_key(metadata.duration),
+            "bitrate": number_key(metadata.bitrate),
+        }
+        for name in TEXT_KEYS:
+            self.fields[name][track] = getattr(metadata, name) or ""
+        if any(self.keys[name][track] != key for name, key in keys.items()):
+            for name, key in keys.items():
+                self.keys[name][track] = key
+            self.invalidate()
+        self.track_changed(file_path)
+    
+    def track_changed(self, file_path):
+        """Repaint a track's row (its text or icon changed)"""
+        row = self.row_of(self.index_of.get(file_path, -1))
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+    
+    def save_keys(self, path):
+        """Write display text and sort keys so a restart can sort without reading any tags"""
+        state = {"paths": self.paths, "labels": self.labels, "fields": self.fields, "keys": self.keys}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    
+    def load_keys(self, path):
+        """Restore what save_keys() wrote for the tracks already in the model"""
+        with open(path, "r") as f:
+            state = json.load(f)
+        for saved, file_path in enumerate(state["paths"]):
+            track = self.index_of.get(file_path)
+            if track is None:
+                continue
+            self.labels[track] = state["labels"][saved]
+            for name in TEXT_KEYS:
+                self.fields[name][track] = state["fields"][name][saved]
+            for name in TEXT_KEYS + NUMBER_KEYS:
+                self.keys[name][track] = state["keys"][name][saved]
+        self.invalidate()
+        self.relayout()
+    
+    def clear(self):
+        """Remove every track"""
+        self.beginResetModel()
+        self.reset_tracks()
+        self.endResetModel()
+    
+    def invalidate(self):
+        """Drop the cached ranks and orderings after tracks or keys changed"""
+        self.ranks.clear()
+        self.orders.clear()
+    
+    def rank(self, name):
+        """Per-track integer ranks of one key; equal keys share a rank and unknowns rank last"""
+        ranks = self.ranks.get(name)
+        if ranks is None:
+            if name in TEXT_KEYS:
+                values = np.array(self.keys[name] or [""], dtype=str)
+                unique, ranks = np.unique(values, return_inverse=True)
+                ranks = ranks.astype(np.int64)
+                if len(unique) and unique[0] == "":
+                    ranks = np.where(ranks == 0, UNKNOWN, ranks)
+                ranks = ranks[:len(self.paths)]
+            else:
+                ranks = np.array(self.keys[name], dtype=np.int64)
+            self.ranks[name] = ranks
+        return ranks
+    
+    def ordering(self, column, descending=False):
+        """Permutation of the tracks for a sort column, computed once until keys change; unknowns stay last"""
+        order = self.orders.get((column, descending))
+        if order is None:
+            keys = SORT_COLUMNS[column][1]
+            added = np.arange(len(self.paths), dtype=np.int64)
+            if not keys:
+                order = added[::-1] if descending else added
+            else:
+                ranks = [self.rank(name) for name in keys]
+                if descending:
+                    # Negated ranks and add order reverse the sort, except that unknowns still rank last
+                    ranks = [np.where(rank == UNKNOWN, UNKNOWN, -rank) for rank in ranks]
+                    added = -added
+                # lexsort takes its most significant key last
+                order = np.lexsort([added] + ranks[::-1])
+            self.orders[(column, descending)] = order
+        return order
+    
+    def set_order(self, column, descending=False):
+        """Show the tracks sorted by a column"""
+        self.column = column if column in SORT_COLUMNS else "added"
+        self.descending = descending
+        self.relayout()
+    
+    def set_grouped(self, grouped):
+        """Insert a header row where the first sort key changes (artist, album and year only)"""
+        self.grouped = grouped
+        self.relayout()
+    
+    def mask_of(self, file_paths):
+        """Track mask of a collection of paths, or None for None"""
+        if file_paths is None:
+            return None
+        mask = np.zeros(len(self.paths), dtype=bool)
+        mask[[self.index_of[path] for path in file_paths if path in self.index_of]] = True
+        return mask
+    
+    def set_matches(self, file_paths):
+        """Show only these search results, or every track for None"""
+        self.matches = self.mask_of(file_paths)
+        self.relayout()
+    
+    def set_scope(self, file_paths):
+        """Show only the tracks of a smart playlist, or the whole library for None"""
+        self.scope = self.mask_of(file_paths)
+        self.relayout()
+    
+    def group_label(self, track):
+        """Header text of the group a track starts"""
+        name = SORT_COLUMNS[self.column][1][0]
+        if name == "year":
+            year = self.keys["year"][track]
+            return f"📅 {year}" if year != UNKNOWN else "📅 Unknown year"
+        value = self.fields[name][track]
+        return f"{'👤' if name == 'artist' else '💿'} {value or 'Unknown ' + name}"
+    
+    def relayout(self):
+        """Rebuild the view rows from the cached ordering, the search mask and grouping"""
+        # A layout change rather than a reset keeps the view's selection and scroll position on the same tracks
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        tracks = [self.track_at(index.row()) for index in persistent]
+        
+        order = self.ordering(self.column, self.descending)
+        self.order = order
+        self.sequence = None
+        self.positions = None
+        
+        shown = self.present
+        for mask in (self.matches, self.scope):
+            if mask is not None:
+                shown = shown & mask
+        rows = order if shown.all() else order[shown[order]]
+        
+        self.headers = []
+        if self.grouped and self.column in GROUP_COLUMNS and len(rows):
+            key = self.rank(SORT_COLUMNS[self.column][1][0])[rows]
+            starts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+            self.headers = [self.group_label(int(rows[start])) for start in starts]
+            rows = np.insert(rows, starts, -1 - np.arange(len(starts)))
+        
+        self.rows = np.ascontiguousarray(rows, dtype=np.int64)
+        self.row_lookup = None
+        moved = [QModelIndex() if track is None or self.row_of(track) < 0 else self.index(self.row_of(track))
+                 for track in tracks]
+        self.changePersistentIndexList(persistent, moved)
+        self.layoutChanged.emit()
+    
+    def row_of(self, track):
+        """View row showing a track, or -1 if it is hidden or unknown"""
+        if track is None or track < 0 or track >= len(self.paths):
+            return -1
+        if self.row_lookup is None or len(self.row_lookup) != len(self.paths):
+            self.row_lookup = np.full(len(self.paths), -1, dtype=np.int64)
+            is_track = self.rows >= 0
+            self.row_lookup[self.rows[is_track]] = np.flatnonzero(is_track)
+        return int(self.row_lookup[track])
+    
+    def track_at(self, row):
+        """Track index shown in a view row, or None for a header"""
+        track = int(self.rows[row]) if 0 <= row < len(self.rows) else -1
+        return track if track >= 0 else None
+    
+    def step(self, track, steps):
+        """Track steps away from another among the shown tracks, wrapping around"""
+        if self.sequence is None:
+            shown = self.rows[self.rows >= 0]
+            self.sequence = shown if len(shown) else self.order
+            self.positions = np.full(len(self.paths), -1, dtype=np.int64)
+            self.positions[self.sequence] = np.arange(len(self.sequence))
+        if len(self.sequence) == 0:
+            return track
+        position = int(self.positions[track]) if 0 <= track < len(self.positions) else -1
+        if position < 0:
+            return int(self.sequence[0 if steps > 0 else -1])
+        return int(self.sequence[(position + steps) % len(self.sequence)])
\ No newline at end of file
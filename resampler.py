@@ -0,0 +1,80 @@
+"""
+Resampler for ChakraBeats
+Streaming polyphase sample-rate conversion with cached filter banks per rate pair
+"""
+
+from functools import lru_cache
+from math import gcd
+import numpy as np
+
+# Windowed-sinc design: taps per phase when not decimating, Kaiser beta, cutoff vs Nyquist
+BASE_TAPS = 96
+KAISER_BETA = 8.0
+ROLLOFF = 0.95
+
+@lru_cache(maxsize=16)
+def filter_bank(in_rate, out_rate):
+    """Return (up, down, bank) where bank[phase] holds the taps for that output phase"""
+    divisor = gcd(in_rate, out_rate)
+    up, down = out_rate // divisor, in_rate // divisor
+    
+    # Lower the cutoff below the output Nyquist when decimating, and widen the filter to match
+    scale = min(1.0, up / down)
+    taps = int(np.ceil(BASE_TAPS / scale / 2)) * 2
+    cutoff = ROLLOFF * scale
+    
+    # Tap k of phase p sits at (p / up + taps / 2 - 1 - k) input samples from the output time
+    t = np.arange(up)[:, None] / up + taps / 2 - 1 - np.arange(taps)[None, :]
+    window = np.i0(KAISER_BETA * np.sqrt(np.clip(1 - (2 * t / taps) ** 2, 0, None))) / np.i0(KAISER_BETA)
+    bank = cutoff * np.sinc(cutoff * t) * window
+    bank /= bank.sum(axis=1, keepdims=True)  # Unity gain at DC for every phase
+    return up, down, bank.astype(np.float32)
+
+class Resampler:
+    """Converts consecutive (frames, channels) blocks from one rate to another"""
+    
+    def __init__(self, in_rate, out_rate, channels):
+        self.up, self.down, self.bank = filter_bank(in_rate, out_rate)
+        self.taps = self.bank.shape[1]
+        self.history_frames = self.taps // 2 - 1  # Input needed before a seek target
+        self.channels = channels
+        self.reset()
+    
+    def reset(self, phase=0, history=None):
+        """Start a new stream whose first output lies phase/up input samples in"""
+        half = self.taps // 2
+        # Past input the first outputs overlap: silence, or real audio after a seek
+        self.buffer = np.zeros((half - 1, self.channels), dtype=np.float32)
+        if history is not None and len(history):
+            self.buffer[-len(history):] = history[-(half - 1):]
+        self.base = -(half - 1)  # Input index of buffer[0]
+        self.time = phase  # Next output time in input samples * up
+    
+    def process(self, block, final=False):
+        """Resample a block; pass final=True with the last block to flush the filter tail"""
+        if final:
+            padding = np.zeros((self.taps // 2, self.channels), dtype=np.float32)
+            block = np.concatenate((block, padding)) if len(block) else padding
+        buffer = np.concatenate((self.buffer, block.astype(np.float32, copy=False)))
+        half = self.taps // 2
+        
+        # Every output whose last tap is already in the buffer
+        last_index = self.base + len(buffer) - 1
+        count = max(0, -(-((last_index - half + 1) * self.up - self.time) // self.down))
+        if count == 0:
+            # Too little input for a single output yet (a short tail); keep it for the next call
+            self.buffer = buffer
+            return np.zeros((0, self.channels), dtype=np.float32)
+        times = self.time + np.arange(count, dtype=np.int64) * self.down
+        starts = times // self.up - half + 1 - self.base
+        phases = times % self.up
+        
+        # Gather each output's input window and apply its phase's taps as one batched matmul
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps, axis=0)
+        output = np.matmul(windows[starts], self.bank[phases][:, :, None])[:, :, 0]
+        
+        self.time += count * self.down
+        keep = self.time // self.up - half + 1 - self.base
+        self.buffer = buffer[keep:]
+        self.base += keep
+        return output
\ No newline at end of file
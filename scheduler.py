@@ -0,0 +1,281 @@
+"""
+Job Scheduler for ChakraBeats
+Shared I/O and CPU pools running background work by priority: the playing track, then visible rows, then the library
+"""
+
+import os
+import time
+import threading
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor, wait, FIRST_COMPLETED
+from PyQt6.QtCore import QThread
+
+import config
+
+# Priority classes, most urgent first
+PRIORITY_PLAYING = 0  # The current and the next track
+PRIORITY_VISIBLE = 1  # Playlist rows on screen
+PRIORITY_LIBRARY = 2  # Whole-library scans
+PRIORITIES = (PRIORITY_PLAYING, PRIORITY_VISIBLE, PRIORITY_LIBRARY)
+
+# How often a worker looks for new requests while its jobs run
+POLL_SECONDS = 0.05
+
+def init_cpu_worker():
+    """Process pool initialiser: decoding support, at a lower priority than playback"""
+    # Imported here because the decoder imports the seek index module, a scheduler client
+    from audio_decoder import init_worker_process
+    init_worker_process()
+    if hasattr(os, "nice"):
+        try:
+            os.nice(config.SCHEDULER_CPU_NICE)
+        except OSError:
+            pass
+
+class Job:
+    """A call waiting for a pool slot; its future is the one handed to the submitter"""
+    
+    def __init__(self, kind, function, args, priority):
+        self.kind = kind
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.future = Future()
+
+class JobScheduler:
+    """Runs calls on an I/O thread pool or a CPU process pool, most urgent class first"""
+    
+    def __init__(self):
+        self.sizes = {"io": config.SCHEDULER_IO_WORKERS, "cpu": config.SCHEDULER_CPU_WORKERS}
+        self.pools = {}  # Started on first use
+        self.queues = {kind: {priority: deque() for priority in PRIORITIES} for kind in self.sizes}
+        self.running = {kind: [0] * len(PRIORITIES) for kind in self.sizes}
+        self.queued = {}  # Future -> its job while it waits, so it can be promoted
+        self.condition = threading.Condition()
+        self.backoff_until = 0.0
+        self.stopping = False
+        self.dispatcher = threading.Thread(target=self.dispatch_loop, daemon=True)
+        self.dispatcher.start()
+    
+    def submit(self, function, *args, priority=PRIORITY_LIBRARY, kind="cpu"):
+        """Queue function(*args) on the "io" or "cpu" pool; cancelling the future drops it if it has not started"""
+        job = Job(kind, function, args, priority)
+        with self.condition:
+            if self.stopping:
+                raise RuntimeError("The job scheduler has shut down")
+            self.queues[kind][priority].append(job)
+            self.queued[job.future] = job
+            self.condition.notify()
+        return job.future
+    
+    def promote(self, future, priority):
+        """Move a waiting job up to a more urgent class; jobs already running are left alone"""
+        with self.condition:
+            job = self.queued.get(future)
+            if job is None or priority >= job.priority:
+                return
+            self.queues[job.kind][job.priority].remove(job)
+            job.priority = priority
+            self.queues[job.kind][priority].append(job)
+            self.condition.notify()
+    
+    def back_off(self):
+        """Hold library jobs back for a while, e.g. after a playback underrun"""
+        with self.condition:
+            self.backoff_until = time.monotonic() + config.SCHEDULER_BACKOFF_MS / 1000.0
+            self.condition.notify()
+    
+    def shutdown(self):
+        """Cancel waiting jobs and wait for running ones"""
+        with self.condition:
+            self.stopping = True
+            waiting = list(self.queued)
+            self.queued.clear()
+            for queues in self.queues.values():
+                for queue in queues.values():
+                    queue.clear()
+            self.condition.notify()
+        for future in waiting:
+            future.cancel()
+        self.dispatcher.join()
+        for pool in self.pools.values():
+            pool.shutdown(wait=True, cancel_futures=True)
+    
+    def dispatch_loop(self):
+        with self.condition:
+            while not self.stopping:
+                self.condition.wait(self.dispatch())
+    
+    def dispatch(self):
+        """Start every waiting job a slot allows; returns the seconds until back-off ends if library jobs wait"""
+        now = time.monotonic()
+        for kind, queues in self.queues.items():
+            for priority in PRIORITIES:
+                queue = queues[priority]
+                while queue and self.has_slot(kind, priority, now):
+                    job = queue.popleft()
+                    del self.queued[job.future]
+                    if job.future.set_running_or_notify_cancel():
+                        self.start(job)
+        
+        held = self.backoff_until - now
+        if held > 0 and any(queues[PRIORITY_LIBRARY] for queues in self.queues.values()):
+            return held
+        return None
+    
+    def has_slot(self, kind, priority, now):
+        """A class may start a job while it and the less urgent classes leave its reserved slots free"""
+        if priority == PRIORITY_LIBRARY and now < self.backoff_until:
+            return False
+        size = self.sizes[kind]
+        running = self.running[kind]
+        return (sum(running) < size and
+                sum(running[priority:]) < max(1, size - config.SCHEDULER_RESERVED_SLOTS[priority]))
+    
+    def pool(self, kind):
+        pool = self.pools.get(kind)
+        if pool is None:
+            if kind == "io":
+                pool = ThreadPoolExecutor(max_workers=self.sizes[kind], thread_name_prefix="chakrabeats-io")
+            else:
+                # Spawned, not forked: a fork would inherit Qt, SDL and the initialised mixer
+                pool = ProcessPoolExecutor(max_workers=self.sizes[kind], initializer=init_cpu_worker,
+                                           mp_context=multiprocessing.get_context("spawn"))
+            self.pools[kind] = pool
+        return pool
+    
+    def start(self, job):
+        """Hand a job to its pool (called with the condition held)"""
+        try:
+            inner = self.pool(job.kind).submit(job.function, *job.args)
+        except BrokenExecutor as e:
+            # A worker process died; the next job gets a fresh pool
+            self.pools.pop(job.kind, None)
+            job.future.set_exception(e)
+            return
+        except Exception as e:
+            job.future.set_exception(e)
+            return
+        self.running[job.kind][job.priority] += 1
+        inner.add_done_callback(lambda inner, job=job: self.finish(job, inner))
+    
+    def finish(self, job, inner):
+        with self.condition:
+            self.running[job.kind][job.priority] -= 1
+            self.condition.notify()
+        try:
+            job.future.set_result(inner.result())
+        except BaseException as e:
+            job.future.set_exception(e)
+
+class ScheduledWorker(QThread):
+    """Feeds a worker's tracks to the scheduler, most urgent first, and handles the results as they finish"""
+    
+    kind = "cpu"
+    newest_first = False  # Take the latest request of a class first, e.g. rows just scrolled into view
+    
+    def __init__(self, scheduler, parent=None):
+        super().__init__(parent)
+        self.scheduler = scheduler
+        self.pending = {priority: OrderedDict() for priority in PRIORITIES}  # Track path -> None, per class
+        self.submitted = {}  # Track path -> future of its queued or running job
+        self.lock = threading.Lock()
+        self.active = False
+        self.stopping = False
+    
+    def enqueue(self, file_paths, priority=PRIORITY_LIBRARY):
+        """Queue tracks, moving up those already waiting at a less urgent priority"""
+        with self.lock:
+            for file_path in file_paths:
+                future = self.submitted.get(file_path)
+                if future is not None:
+                    self.scheduler.promote(future, priority)
+                    continue
+                current = next((queued for queued in PRIORITIES if file_path in self.pending[queued]), None)
+                if current is None or current > priority:
+                    if current is not None:
+                        del self.pending[current][file_path]
+                    self.pending[priority][file_path] = None
+                elif current == priority:
+                    self.pending[priority].move_to_end(file_path)
+            if self.active or self.stopping:
+                return
+            self.active = True
+        
+        # The previous run may still be returning after it drained the queue and went idle
+        self.wait()
+        self.start(QThread.Priority.LowPriority)
+    
+    def stop(self):
+        """Stop handing out jobs and drop those that have not started; finished results are kept"""
+        self.stopping = True
+        self.wait()
+    
+    def next_request(self, library_room):
+        """Pop the most urgent request, or a library one only while library_room is set"""
+        with self.lock:
+            for priority in PRIORITIES:
+                if priority == PRIORITY_LIBRARY and not library_room:
+                    break
+                if self.pending[priority]:
+                    file_path, _ = self.pending[priority].popitem(last=self.newest_first)
+                    return file_path, priority
+        return None, None
+    
+    def run(self):
+        running = {}  # Future -> (track path, priority)
+        while not self.stopping:
+            # Urgent requests go out at once; library ones only keep the pool busy, so the queue stays short
+            while True:
+                file_path, priority = self.next_request(len(running) < self.scheduler.sizes[self.kind])
+                if file_path is None:
+                    break
+                future = self.start_job(file_path, priority)
+                if future is not None:
+                    running[future] = (file_path, priority)
+                    with self.lock:
+                        self.submitted[file_path] = future
+            
+            if not running:
+                with self.lock:
+                    drained = not any(self.pending.values())
+                if drained:
+                    self.idle()
+                    # Cleared only after idle(), so a new request never waits on it; one that came in meanwhile is run
+                    with self.lock:
+                        if not any(self.pending.values()):
+                            self.active = False
+                            return
+                continue
+            
+            done, _ = wait(running, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, priority = running.pop(future)
+                follow_up = self.job_done(file_path, future, priority)
+                with self.lock:
+                    if follow_up is not None:
+                        running[follow_up] = (file_path, priority)
+                        self.submitted[file_path] = follow_up
+                    elif self.submitted.get(file_path) is future:
+                        del self.submitted[file_path]
+        
+        for future in running:
+            future.cancel()
+        with self.lock:
+            self.submitted.clear()
+        self.idle()
+        with self.lock:
+            self.active = False
+    
+    def start_job(self, file_path, priority):
+        """Submit the job for a track and return its future, or None if there is nothing to do"""
+        raise NotImplementedError
+    
+    def job_done(self, file_path, future, priority):
+        """Handle a finished job; may return the future of a follow-up job for the same track"""
+        raise NotImplementedError
+    
+    def idle(self):
+        """Called when the queue has drained or the worker stopped"""
+        pass
\ No newline at end of file
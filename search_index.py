@@ -0,0 +1,188 @@
+"""
+Search Index for ChakraBeats
+Trigram and word-prefix inverted index over track titles, artists, albums and file names
+"""
+
+import os
+import re
+import json
+import unicodedata
+from array import array
+import numpy as np
+
+# Compact once this share of document ids belong to replaced or removed tracks
+COMPACT_FRACTION = 0.25
+COMPACT_MINIMUM = 1000
+
+WORD = re.compile(r"\w+")
+
+def normalize(text):
+    """Case-folded text without accents, so 'Shingeki' finds 'SHINGEKI' and 'Pokémon' finds 'pokemon'"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+def words(text):
+    """Normalised words of a text"""
+    return WORD.findall(normalize(text))
+
+def word_keys(word):
+    """Index keys of one word: its 1- and 2-letter prefixes and every trigram"""
+    keys = ["^" + word[:1]]
+    if len(word) >= 2:
+        keys.append("^" + word[:2])
+    keys.extend(word[i:i + 3] for i in range(len(word) - 2))
+    return keys
+
+def query_keys(word):
+    """Keys a document must have to contain a query word"""
+    if len(word) <= 2:
+        return ["^" + word]  # Short fragments match the start of a word
+    return [word[i:i + 3] for i in range(len(word) - 2)]
+
+def document_text(file_path, metadata=None):
+    """Searchable text of a track: its tags when known, and always its file name"""
+    fields = [os.path.splitext(os.path.basename(file_path))[0]]
+    if metadata is not None:
+        fields = [metadata.title, metadata.artist, metadata.album] + fields
+    return " ".join(words(" ".join(field for field in fields if field)))
+
+def contains(sorted_ids, ids):
+    """Mask of the ids present in a sorted id array"""
+    if len(sorted_ids) == 0:
+        return np.zeros(len(ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return sorted_ids[positions] == ids
+
+class SearchIndex:
+    """Inverted index with append-only posting lists; a changed track gets a fresh document id"""
+    
+    def __init__(self):
+        self.clear()
+    
+    def clear(self):
+        """Forget every track"""
+        self.paths = []  # Document id -> file path, None once replaced
+        self.texts = []  # Document id -> normalised text, None once replaced
+        self.ids = {}  # File path -> current document id
+        self.postings = {}  # Key -> ascending document ids
+        self.dead = 0
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __contains__(self, file_path):
+        return file_path in self.ids
+    
+    def add(self, file_path, metadata=None):
+        """Index a track, or re-index it if its text changed"""
+        text = document_text(file_path, metadata)
+        doc = self.ids.get(file_path)
+        if doc is not None:
+            if self.texts[doc] == text:
+                return
+            self._retire(doc)
+        self._append(file_path, text)
+        self._maybe_compact()
+    
+    def remove(self, file_path):
+        """Drop a track from the index"""
+        doc = self.ids.pop(file_path, None)
+        if doc is not None:
+            self._retire(doc)
+            self._maybe_compact()
+    
+    def retain(self, file_paths):
+        """Drop every track not in file_paths"""
+        keep = set(file_paths)
+        for file_path in [path for path in self.ids if path not in keep]:
+            self.remove(file_path)
+    
+    def _append(self, file_path, text):
+        doc = len(self.paths)
+        self.paths.append(file_path)
+        self.texts.append(text)
+        self.ids[file_path] = doc
+        keys = set()
+        for word in text.split():
+            keys.update(word_keys(word))
+        for key in keys:
+            posting = self.postings.get(key)
+            if posting is None:
+                posting = self.postings[key] = array("I")
+            posting.append(doc)
+    
+    def _retire(self, doc):
+        self.paths[doc] = None
+        self.texts[doc] = None
+        self.dead += 1
+    
+    def _maybe_compact(self):
+        if self.dead >= COMPACT_MINIMUM and self.dead > COMPACT_FRACTION * len(self.paths):
+            self.compact()
+    
+    def compact(self):
+        """Renumber the live tracks so posting lists stop carrying replaced ids"""
+        live = [(path, text) for path, text in zip(self.paths, self.texts) if path is not None]
+        self.clear()
+        for file_path, text in live:
+            self._append(file_path, text)
+    
+    def search(self, query):
+        """File paths of tracks containing every word of the query, or None for an empty query"""
+        query_words = sorted(set(words(query)), key=len, reverse=True)
+        if not query_words:
+            return None
+        
+        # Intersect posting lists shortest first, so the candidate set shrinks fastest
+        keys = {key for word in query_words for key in query_keys(word)}
+        if any(key not in self.postings for key in keys):
+            return []
+        lists = sorted((np.frombuffer(self.postings[key], dtype=np.uint32) for key in keys), key=len)
+        candidates = lists[0]
+        for ids in lists[1:]:
+            candidates = candidates[contains(ids, candidates)]
+            if len(candidates) == 0:
+                return []
+        
+        # Trigrams only prove a word of 3 letters; longer ones must appear as a whole
+        long_words = [word for word in query_words if len(word) > 3]
+        paths, texts = self.paths, self.texts
+        if not long_words:
+            return [paths[doc] for doc in candidates.tolist() if paths[doc] is not None]
+        return [paths[doc] for doc in candidates.tolist()
+                if texts[doc] is not None and all(word in texts[doc] for word in long_words)]
+    
+    def save(self, path):
+        """Write the index: documents as JSON, posting lists as one packed id array"""
+        if self.dead:
+            self.compact()
+        keys = list(self.postings)
+        lengths = np.array([len(self.postings[key]) for key in keys], dtype=np.int64)
+        ids = np.frombuffer(b"".join(self.postings[key].tobytes() for key in keys), dtype=np.uint32)
+        header = json.dumps({"paths": self.paths, "texts": self.texts, "keys": keys})
+        
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, header=np.frombuffer(header.encode("utf-8"), dtype=np.uint8), lengths=lengths, ids=ids)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()"""
+        index = cls()
+        with np.load(path) as data:
+            header = json.loads(data["header"].tobytes().decode("utf-8"))
+            lengths = data["lengths"]
+            ids = data["ids"].astype(np.uint32, copy=False).tobytes()
+        
+        index.paths = header["paths"]
+        index.texts = header["texts"]
+        index.ids = {file_path: doc for doc, file_path in enumerate(index.paths)}
+        ends = np.cumsum(lengths) * 4
+        start = 0
+        for key, end in zip(header["keys"], ends.tolist()):
+            posting = array("I")
+            posting.frombytes(ids[start:end])
+            index.postings[key] = posting
+            start = end
+        return index
\ No newline at end of file
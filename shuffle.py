@@ -0,0 +1,197 @@
+"""
+Shuffle for ChakraBeats
+Lazily drawn shuffle order with history, so every track plays once per cycle and previous goes back
+"""
+
+import random
+from collections import deque, Counter
+
+import config
+
+SHUFFLE_MODES = {
+    "random": "🎲 Random",
+    "spread": "👥 Artist Spread",
+    "weighted": "⭐ Favorites First",
+}
+
+class ShuffleEngine:
+    """Shuffle order over track indices with O(1) picks, inserts and removals"""
+    
+    def __init__(self, artist_of=None, weight_of=None, rng=None):
+        self.artist_of = artist_of  # Callable(track) -> artist key, "" when unknown
+        self.weight_of = weight_of  # Callable(track) -> pick weight in (0, 1]
+        self.rng = rng or random.Random()
+        self.mode = "random"
+        self.clear()
+    
+    def clear(self):
+        """Forget every track and the history"""
+        self.members = set()
+        # Tracks not yet played this cycle; picks and removals swap with the last entry and pop
+        self.pool = []
+        self.pool_index = {}  # Track -> position in self.pool
+        # Played tracks; entries after the cursor were drawn ahead, removed tracks are skipped lazily
+        self.history = []
+        self.cursor = -1
+        self.recent_artists = deque()
+        self.artist_counts = Counter()
+    
+    def __len__(self):
+        return len(self.members)
+    
+    @property
+    def current(self):
+        return self.history[self.cursor] if 0 <= self.cursor < len(self.history) else None
+    
+    def set_mode(self, mode):
+        self.mode = mode if mode in SHUFFLE_MODES else "random"
+    
+    def add(self, track):
+        """Add a track; it joins the current cycle"""
+        if track in self.members:
+            return
+        self.members.add(track)
+        self._pool_add(track)
+    
+    def remove(self, track):
+        """Remove a track; history entries for it are skipped from now on"""
+        if track not in self.members:
+            return
+        self.members.discard(track)
+        self._pool_remove(track)
+    
+    def reset(self, tracks):
+        """Shuffle a new set of tracks from scratch"""
+        self.clear()
+        for track in tracks:
+            self.add(track)
+    
+    def play(self, track):
+        """Record a track the user picked; upcoming picks already drawn go back into the pool"""
+        if track == self.current or track not in self.members:
+            return
+        for upcoming in self.history[self.cursor + 1:]:
+            if upcoming in self.members:
+                self._pool_add(upcoming)
+        del self.history[self.cursor + 1:]
+        self._pool_remove(track)
+        self._record(track)
+    
+    def peek(self):
+        """The track next() will return, drawing it now if needed, or None when empty"""
+        position = self._forward(self.cursor)
+        if position is None:
+            track = self._draw()
+            if track is None:
+                return None
+            self.history.append(track)
+            position = len(self.history) - 1
+        return self.history[position]
+    
+    def next(self):
+        """Move to the next track of the shuffle order"""
+        track = self.peek()
+        if track is not None:
+            self.cursor = self._forward(self.cursor)
+            self._note_artist(track)
+            self._trim_history()
+        return track
+    
+    def previous(self):
+        """Move back to the previously played track, or None at the start of the history"""
+        position = self.cursor - 1
+        while position >= 0 and self.history[position] not in self.members:
+            position -= 1
+        if position < 0:
+            return None
+        self.cursor = position
+        return self.history[position]
+    
+    def _forward(self, position):
+        """Index of the next history entry still in the playlist, or None"""
+        position += 1
+        while position < len(self.history):
+            if self.history[position] in self.members:
+                return position
+            position += 1
+        return None
+    
+    def _record(self, track):
+        self.history.append(track)
+        self.cursor = len(self.history) - 1
+        self._note_artist(track)
+        self._trim_history()
+    
+    def _trim_history(self):
+        # Trimming in blocks keeps the bounded history O(1) amortised
+        if len(self.history) > 2 * config.SHUFFLE_HISTORY:
+            drop = len(self.history) - config.SHUFFLE_HISTORY
+            del self.history[:drop]
+            self.cursor -= drop
+    
+    def _note_artist(self, track):
+        if self.artist_of is None:
+            return
+        self.recent_artists.append(self.artist_of(track))
+        self.artist_counts[self.recent_artists[-1]] += 1
+        if len(self.recent_artists) > config.SHUFFLE_SPREAD_WINDOW:
+            self.artist_counts[self.recent_artists.popleft()] -= 1
+    
+    def _pool_add(self, track):
+        if track not in self.pool_index:
+            self.pool_index[track] = len(self.pool)
+            self.pool.append(track)
+    
+    def _pool_remove(self, track):
+        position = self.pool_index.pop(track, None)
+        if position is None:
+            return
+        last = self.pool.pop()
+        if position < len(self.pool):
+            self.pool[position] = last
+            self.pool_index[last] = position
+    
+    def _draw(self):
+        """Take a track out of the pool, starting a new cycle once everything has played"""
+        if not self.pool:
+            if not self.members:
+                return None
+            self.pool = list(self.members)
+            self.pool_index = {track: position for position, track in enumerate(self.pool)}
+        
+        # Never repeat the track just drawn, e.g. when a new cycle opens
+        last = self.history[-1] if self.history else None
+        track = last
+        while track == last:
+            if self.mode == "spread" and self.artist_of is not None:
+                track = self._pick_spread()
+            elif self.mode == "weighted" and self.weight_of is not None:
+                track = self._pick_weighted()
+            else:
+                track = self.pool[self.rng.randrange(len(self.pool))]
+            if len(self.pool) == 1:
+                break
+        self._pool_remove(track)
+        return track
+    
+    def _pick_spread(self):
+        """Sample a few pool tracks and prefer one whose artist has not played recently"""
+        best, best_count = None, None
+        for _ in range(config.SHUFFLE_CANDIDATES):
+            track = self.pool[self.rng.randrange(len(self.pool))]
+            artist = self.artist_of(track)
+            count = self.artist_counts[artist] if artist else 0
+            if count == 0:
+                return track
+            if best is None or count < best_count:
+                best, best_count = track, count
+        return best
+    
+    def _pick_weighted(self):
+        """Rejection sampling: accept a random pool track with probability equal to its weight"""
+        track = None
+        for _ in range(config.SHUFFLE_CANDIDATES):
+            track = self.pool[self.rng.randrange(len(self.pool))]
+            if self.rng.random() < self.weight_of(track):
+                return track
+        return track
\ No newline at end of file
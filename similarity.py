@@ -0,0 +1,309 @@
+"""
+Track Similarity for ChakraBeats
+Per-track audio descriptors kept in one float32 matrix, searched for the nearest neighbours of a track
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+from PyQt6.QtCore import pyqtSignal
+
+import config
+from audio_decoder import open_pcm_stream
+from beat_detector import BeatCache, BeatDetector
+from scheduler import ScheduledWorker, PRIORITY_LIBRARY
+
+# Analysis frames of about 50 ms (a power of two in samples), half overlapping
+FRAME_SECONDS = 0.05
+ROLLOFF = 0.85
+MEL_BANDS = 26
+MEL_MAX_HZ = 8000.0
+CEPSTRA = 13
+CHROMA_MIN_HZ = 55.0
+CHROMA_MAX_HZ = 5000.0
+
+# Descriptor layout: group name, size and weight in the distance
+FEATURE_GROUPS = [
+    ("spectrum", 8, 1.0),  # Centroid and rolloff (mean, spread), flatness, level (mean, spread), zero crossings
+    ("tempo", 1, 0.5),
+    ("timbre", 2 * CEPSTRA, 1.0),  # Cepstral means and spreads
+    ("harmony", 12, 0.5),  # Chroma profile
+]
+FEATURE_SIZE = sum(size for _, size, _ in FEATURE_GROUPS)
+
+# Results are checkpointed to disk this often while scanning
+CHECKPOINT_TRACKS = 25
+CHECKPOINT_SECONDS = 5.0
+
+def mel_filterbank(frame, sample_rate):
+    """Triangular mel filters as a (frequency bins, MEL_BANDS) matrix"""
+    def to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+    
+    top = min(MEL_MAX_HZ, sample_rate / 2)
+    centres = 700.0 * (10 ** (np.linspace(0.0, to_mel(top), MEL_BANDS + 2) / 2595.0) - 1.0)
+    freqs = np.fft.rfftfreq(frame, 1.0 / sample_rate)[:, None]
+    lower, centre, upper = centres[:-2], centres[1:-1], centres[2:]
+    rising = (freqs - lower) / (centre - lower)
+    falling = (upper - freqs) / (upper - centre)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+def dct_matrix(size, count):
+    """DCT-II basis turning log band energies into count cepstral coefficients"""
+    n = np.arange(size)
+    return np.cos(np.pi / size * (n[:, None] + 0.5) * np.arange(count)[None, :]).astype(np.float32)
+
+def chroma_matrix(frame, sample_rate):
+    """Frequency bins folded onto the 12 pitch classes, as a (frequency bins, 12) matrix"""
+    freqs = np.fft.rfftfreq(frame, 1.0 / sample_rate)
+    used = (freqs >= CHROMA_MIN_HZ) & (freqs <= CHROMA_MAX_HZ)
+    pitch_class = np.round(12 * np.log2(np.where(used, freqs, 440.0) / 440.0) + 69).astype(np.int64) % 12
+    matrix = np.zeros((len(freqs), 12), dtype=np.float32)
+    matrix[np.flatnonzero(used), pitch_class[used]] = 1.0
+    return matrix
+
+def describe(samples, sample_rate, bpm=0.0):
+    """Descriptor vector of mono samples; every frame is analysed at once"""
+    frame = 1 << int(np.ceil(np.log2(FRAME_SECONDS * sample_rate)))
+    hop = frame // 2
+    if len(samples) < 8 * frame:
+        return None
+    
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame)[::hop]
+    power = np.abs(np.fft.rfft(frames * np.hanning(frame).astype(np.float32), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(frame, 1.0 / sample_rate)
+    total = power.sum(axis=1) + 1e-12
+    
+    centroid = np.log2(1.0 + power @ freqs / total)
+    cumulative = np.cumsum(power, axis=1)
+    rolloff = np.log2(1.0 + freqs[np.argmax(cumulative >= ROLLOFF * cumulative[:, -1:], axis=1)])
+    log_power = np.log(power + 1e-12)
+    flatness = np.exp(log_power.mean(axis=1)) / (power.mean(axis=1) + 1e-12)
+    level = 10 * np.log10(np.square(frames).mean(axis=1) + 1e-10)
+    crossings = np.diff(np.signbit(frames), axis=1).mean(axis=1)
+    
+    cepstra = np.log(power @ mel_filterbank(frame, sample_rate) + 1e-10) @ dct_matrix(MEL_BANDS, CEPSTRA)
+    chroma = power @ chroma_matrix(frame, sample_rate)
+    chroma /= chroma.sum(axis=1, keepdims=True) + 1e-12
+    
+    if bpm <= 0:
+        # Spectral flux envelope of the window, as the beat detector does for whole tracks
+        envelope = np.maximum(np.diff(log_power, axis=0), 0.0).sum(axis=1)
+        period = BeatDetector.estimate_period(envelope, sample_rate / hop)
+        bpm = 60.0 * sample_rate / hop / period if period > 0 else 120.0
+    
+    return np.concatenate((
+        [centroid.mean(), centroid.std(), rolloff.mean(), rolloff.std(),
+         flatness.mean(), level.mean(), level.std(), crossings.mean()],
+        [np.log2(bpm)],
+        cepstra.mean(axis=0), cepstra.std(axis=0),
+        chroma.mean(axis=0),
+    )).astype(np.float32)
+
+def extract_features(file_path):
+    """Worker: descriptor of the middle of a track, or None if it is too short to describe"""
+    with open_pcm_stream(file_path) as stream:
+        sample_rate = stream.sample_rate
+        wanted = int(config.SIMILARITY_SECONDS * sample_rate)
+        # The middle of a track is more typical of it than an intro or outro
+        stream.seek(max(0, (stream.frames - wanted) // 2))
+        blocks = []
+        collected = 0
+        for block in stream.blocks():
+            blocks.append(block.mean(axis=1))
+            collected += len(block)
+            if collected >= wanted:
+                break
+    if not blocks:
+        return None
+    
+    # The beat analysis of the whole track gives a steadier tempo when it exists
+    analysis = BeatCache.get(file_path)
+    bpm = analysis.bpm if analysis is not None else 0.0
+    return describe(np.concatenate(blocks)[:wanted].astype(np.float32, copy=False), sample_rate, bpm)
+
+class SimilarityStore:
+    """Descriptors of every analysed track as rows of one float32 matrix, saved next to a row list"""
+    
+    def __init__(self, matrix_path=None, rows_path=None):
+        self.matrix_path = matrix_path or config.get_feature_matrix_path()
+        self.rows_path = rows_path or config.get_feature_rows_path()
+        self.lock = threading.Lock()
+        self.paths = []  # Track path of each row
+        self.stats = []  # [size, mtime_ns] of each row's file when it was analysed
+        self.row_of = {}
+        self.matrix = np.zeros((0, FEATURE_SIZE), dtype=np.float32)  # Grown by doubling; rows past len(paths) are spare
+        self.version = 0  # Bumped on every change so the index knows to rebuild
+        self.load()
+    
+    def __len__(self):
+        return len(self.paths)
+    
+    def load(self):
+        try:
+            if os.path.exists(self.rows_path) and os.path.exists(self.matrix_path):
+                with open(self.rows_path, "r") as f:
+                    rows = json.load(f)
+                matrix = np.load(self.matrix_path)
+                if matrix.shape == (len(rows["paths"]), FEATURE_SIZE):
+                    self.paths = rows["paths"]
+                    self.stats = rows["stats"]
+                    self.row_of = {file_path: row for row, file_path in enumerate(self.paths) if file_path is not None}
+                    self.matrix = matrix.astype(np.float32, copy=False)
+        except Exception as e:
+            print(f"Error loading track descriptors: {e}")
+    
+    def save(self):
+        """Write the matrix and its rows atomically so an interrupted scan resumes"""
+        with self.lock:
+            matrix = self.matrix[:len(self.paths)].copy()
+            rows = {"paths": list(self.paths), "stats": list(self.stats)}
+        try:
+            tmp_path = self.matrix_path + ".tmp.npy"
+            np.save(tmp_path, matrix)
+            os.replace(tmp_path, self.matrix_path)
+            tmp_path = self.rows_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(rows, f)
+            os.replace(tmp_path, self.rows_path)
+        except Exception as e:
+            print(f"Error saving track descriptors: {e}")
+    
+    def is_current(self, file_path):
+        """True if the stored descriptor still matches the file on disk"""
+        row = self.row_of.get(file_path)
+        if row is None:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        return self.stats[row] == [stat.st_size, stat.st_mtime_ns]
+    
+    def put(self, file_path, vector):
+        """Record a track's descriptor, reusing its row when it had one"""
+        stat = os.stat(file_path)
+        with self.lock:
+            row = self.row_of.get(file_path)
+            if row is None:
+                row = len(self.paths)
+                if row == len(self.matrix):
+                    grown = np.zeros((max(64, 2 * row), FEATURE_SIZE), dtype=np.float32)
+                    grown[:row] = self.matrix[:row]
+                    self.matrix = grown
+                self.paths.append(file_path)
+                self.stats.append(None)
+                self.row_of[file_path] = row
+            self.matrix[row] = vector
+            self.stats[row] = [stat.st_size, stat.st_mtime_ns]
+            self.version += 1
+    
+    def rename(self, old_path, new_path):
+        """Keep a renamed track's descriptor under its new path"""
+        with self.lock:
+            row = self.row_of.pop(old_path, None)
+            if row is None:
+                return
+            stale = self.row_of.pop(new_path, None)
+            if stale is not None:
+                self.paths[stale] = None  # Overwritten by the rename; the row stays unused
+            self.paths[row] = new_path
+            self.row_of[new_path] = row
+            self.version += 1
+
+class SimilarityIndex:
+    """Exact nearest neighbours over the standardised descriptor matrix, rebuilt when the store changes"""
+    
+    def __init__(self, store):
+        self.store = store
+        self.version = None
+        self.points = np.zeros((0, FEATURE_SIZE), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.paths = []
+    
+    def rebuild(self):
+        """Standardise every feature over the library and weight each group by its share"""
+        with self.store.lock:
+            count = len(self.store.paths)
+            matrix = self.store.matrix[:count].copy()
+            self.paths = list(self.store.paths)
+            self.version = self.store.version
+        
+        scale = np.concatenate([np.full(size, weight / np.sqrt(size), dtype=np.float32)
+                                for _, size, weight in FEATURE_GROUPS])
+        mean = matrix.mean(axis=0) if count else 0.0
+        spread = matrix.std(axis=0) + 1e-6 if count else 1.0
+        self.points = np.ascontiguousarray((matrix - mean) / spread * scale, dtype=np.float32)
+        self.norms = np.einsum("ij,ij->i", self.points, self.points)
+    
+    def nearest(self, file_path, count, allowed=None):
+        """Up to count track paths closest to a track, nearest first; allowed limits the answers to a set"""
+        if self.version != self.store.version:
+            self.rebuild()
+        row = self.store.row_of.get(file_path)
+        if row is None or row >= len(self.points):
+            return []
+        
+        # Squared distances without the query's own norm, which ranks nothing: |p|^2 - 2 p.q
+        distances = self.norms - 2.0 * (self.points @ self.points[row])
+        distances[row] = np.inf
+        wanted = min(len(distances), 4 * count if allowed is not None else count + 1)
+        nearest = np.argpartition(distances, wanted - 1)[:wanted] if wanted < len(distances) else np.arange(len(distances))
+        nearest = nearest[np.argsort(distances[nearest])]
+        
+        tracks = []
+        for candidate in nearest:
+            candidate_path = self.paths[candidate]
+            if candidate == row or candidate_path is None or (allowed is not None and candidate_path not in allowed):
+                continue
+            tracks.append(candidate_path)
+            if len(tracks) == count:
+                return tracks
+        if allowed is not None and wanted < len(distances):
+            # Too many neighbours fell outside the allowed set: rank them all
+            order = np.argsort(distances)
+            tracks = [self.paths[candidate] for candidate in order
+                      if candidate != row and self.paths[candidate] is not None and self.paths[candidate] in allowed]
+            return tracks[:count]
+        return tracks
+
+class SimilarityScanner(ScheduledWorker):
+    """Resumable background descriptor extraction on the scheduler's processes"""
+    
+    track_described = pyqtSignal(str)
+    
+    def __init__(self, store, scheduler, parent=None):
+        super().__init__(scheduler, parent)
+        self.store = store
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+    
+    def scan(self, file_paths, priority=PRIORITY_LIBRARY):
+        """Queue tracks whose descriptor is missing or stale"""
+        self.enqueue(file_paths, priority)
+    
+    def start_job(self, file_path, priority):
+        if self.store.is_current(file_path):
+            return None
+        return self.scheduler.submit(extract_features, file_path, priority=priority)
+    
+    def job_done(self, file_path, future, priority):
+        try:
+            vector = future.result()
+            if vector is not None:
+                self.store.put(file_path, vector)
+                self.unsaved += 1
+                self.track_described.emit(file_path)
+        except Exception as e:
+            print(f"Error describing {file_path}: {e}")
+        
+        if self.unsaved >= CHECKPOINT_TRACKS or time.monotonic() - self.last_save > CHECKPOINT_SECONDS:
+            self.idle()
+    
+    def idle(self):
+        if self.unsaved:
+            self.store.save()
+        self.unsaved = 0
+        self.last_save = time.monotonic()
\ No newline at end of file
@@ -0,0 +1,319 @@
+"""
+Smart Playlists for ChakraBeats
+Rule-based playlists compiled to predicates and kept up to date one track at a time
+"""
+
+import os
+import re
+import json
+
+from search_index import normalize
+
+# Rule fields and their kinds; plays and favorite come from outside the tags
+FIELDS = {
+    "title": "text",
+    "artist": "text",
+    "album": "text",
+    "genre": "text",
+    "year": "number",
+    "track": "number",
+    "duration": "number",  # Seconds
+    "bitrate": "number",  # kbps
+    "plays": "number",
+    "favorite": "flag",
+}
+
+TEXT_OPS = ("is", "is not", "contains", "starts with")
+NUMBER_OPS = ("=", "!=", "<", "<=", ">", ">=", "in")
+
+# Playlists created on first start
+DEFAULT_PLAYLISTS = [
+    {"name": "⭐ Favorites", "match": "all", "rules": [{"field": "favorite", "op": "is", "value": True}]},
+    {"name": "🔥 Most Played", "match": "all", "rules": [{"field": "plays", "op": ">=", "value": 5}]},
+    {"name": "⚡ Quick Hits", "match": "all", "rules": [{"field": "duration", "op": "<", "value": 210}]},
+    {"name": "🕰️ 2000s", "match": "all", "rules": [{"field": "year", "op": "in", "value": [2000, 2009]}]},
+]
+
+# Clause separators outside double quotes
+SEPARATOR = re.compile(r'\s+(and|or)\s+(?=(?:[^"]*"[^"]*")*[^"]*$)', re.IGNORECASE)
+# Word operators must end at a word boundary ('artist isaac' is not 'artist is aac'); a bare value means contains
+CLAUSE = re.compile(r"^(\w+)\b(?:\s*(>=|<=|!=|=|<|>|(?:contains|starts with|is not|is|in)\b)?\s*(.*))?$",
+                    re.IGNORECASE)
+LEADING_NUMBER = re.compile(r"\s*(\d+)")
+
+def blank_facts():
+    """Facts of a track nothing is known about yet"""
+    facts = {field: "" if kind == "text" else None for field, kind in FIELDS.items()}
+    facts["plays"] = 0
+    facts["favorite"] = False
+    return facts
+
+def leading_number(value):
+    """'3/12' -> 3, '2019-05-01' -> 2019, 0 or missing -> None"""
+    if isinstance(value, (int, float)):
+        return value if value > 0 else None
+    match = LEADING_NUMBER.match(value or "")
+    return int(match.group(1)) if match else None
+
+def facts_from_metadata(metadata):
+    """Rule facts taken from a SongMetadata"""
+    return {
+        "title": normalize(metadata.title or ""),
+        "artist": normalize(metadata.artist or ""),
+        "album": normalize(metadata.album or ""),
+        "genre": normalize(metadata.genre or ""),
+        "year": leading_number(metadata.year),
+        "track": leading_number(metadata.track_number),
+        "duration": leading_number(metadata.duration),
+        "bitrate": leading_number(metadata.bitrate),
+    }
+
+def parse_number(text):
+    """A plain number or a m:ss duration"""
+    text = str(text).strip()
+    if ":" in text:
+        minutes, seconds = text.split(":", 1)
+        return int(minutes) * 60 + float(seconds)
+    return float(text)
+
+def compile_rule(rule):
+    """Predicate over a track's facts for one {field, op, value} rule"""
+    field, op, value = rule["field"], rule.get("op", "is"), rule.get("value")
+    kind = FIELDS.get(field)
+    if kind is None:
+        raise ValueError(f"Unknown field: {field}")
+    
+    if kind == "flag":
+        wanted = bool(value) if op == "is" else not bool(value)
+        return lambda facts: facts[field] == wanted
+    
+    if kind == "text":
+        needle = normalize(str(value or ""))
+        tests = {
+            "is": lambda text: text == needle,
+            "is not": lambda text: text != needle,
+            "contains": lambda text: needle in text,
+            "starts with": lambda text: text.startswith(needle),
+        }
+        if op not in tests:
+            raise ValueError(f"'{op}' does not apply to {field}")
+        test = tests[op]
+        return lambda facts: test(facts[field])
+    
+    if op == "in":
+        low, high = sorted(float(bound) for bound in value)
+        return lambda facts: facts[field] is not None and low <= facts[field] <= high
+    number = float(value)
+    tests = {
+        "=": lambda x: x == number,
+        "!=": lambda x: x != number,
+        "<": lambda x: x < number,
+        "<=": lambda x: x <= number,
+        ">": lambda x: x > number,
+        ">=": lambda x: x >= number,
+    }
+    if op not in tests:
+        raise ValueError(f"'{op}' does not apply to {field}")
+    test = tests[op]
+    # Unknown numbers match nothing
+    return lambda facts: facts[field] is not None and test(facts[field])
+
+def compile_rules(rules, match="all"):
+    """One predicate for a list of rules joined by all (and) or any (or)"""
+    predicates = [compile_rule(rule) for rule in rules]
+    if match == "any":
+        return lambda facts: any(predicate(facts) for predicate in predicates)
+    return lambda facts: all(predicate(facts) for predicate in predicates)
+
+def parse_rules(text):
+    """Parse 'genre contains anime and year in 1990..1999 and duration < 4:00' into (match, rules)"""
+    parts = SEPARATOR.split(text.strip())
+    clauses, joins = parts[::2], {join.lower() for join in parts[1::2]}
+    if len(joins) > 1:
+        raise ValueError("Join rules with either 'and' or 'or', not both")
+    
+    rules = []
+    for clause in clauses:
+        found = CLAUSE.match(clause.strip())
+        if found is None:
+            raise ValueError(f"Cannot read rule: {clause}")
+        field, op, value = found.group(1).lower(), (found.group(2) or "").lower(), (found.group(3) or "").strip()
+        kind = FIELDS.get(field)
+        if kind is None:
+            raise ValueError(f"Unknown field: {field} (choose from {', '.join(FIELDS)})")
+        
+        if kind == "flag":
+            if op and op not in ("is", "is not"):
+                raise ValueError(f"'{op}' does not apply to {field}")
+            flag = value.lower() not in ("no", "false", "0") if op or value else True
+            rules.append({"field": field, "op": "is", "value": flag if op != "is not" else not flag})
+        elif kind == "text":
+            op = op or "contains"
+            if op not in TEXT_OPS:
+                raise ValueError(f"'{op}' does not apply to {field}")
+            rules.append({"field": field, "op": op, "value": value.strip('"')})
+        else:
+            if op not in NUMBER_OPS:
+                raise ValueError(f"'{op or 'nothing'}' does not apply to {field}")
+            if op == "in":
+                low, _, high = value.partition("..")
+                number = [parse_number(low), parse_number(high)]
+            else:
+                number = parse_number(value)
+            rules.append({"field": field, "op": op, "value": number})
+    
+    match = "any" if joins == {"or"} else "all"
+    compile_rules(rules, match)  # Reject anything the compiler would
+    return match, rules
+
+def describe_rules(rules, match="all"):
+    """Rules written back in the syntax parse_rules() reads"""
+    clauses = []
+    for rule in rules:
+        value = rule.get("value")
+        if FIELDS.get(rule["field"]) == "flag":
+            clauses.append(rule["field"] if value else f"{rule['field']} is no")
+        elif rule["op"] == "in":
+            clauses.append(f"{rule['field']} in {value[0]:g}..{value[1]:g}")
+        elif isinstance(value, (int, float)):
+            clauses.append(f"{rule['field']} {rule['op']} {value:g}")
+        else:
+            clauses.append(f'{rule["field"]} {rule["op"]} "{value}"')
+    return f" {'or' if match == 'any' else 'and'} ".join(clauses)
+
+class SmartPlaylist:
+    """A named rule set, its compiled predicate and its current members"""
+    
+    def __init__(self, name, rules, match="all"):
+        self.name = name
+        self.rules = rules
+        self.match = match
+        self.predicate = compile_rules(rules, match)
+        self.fields = {rule["field"] for rule in rules}
+        self.members = set()
+    
+    def to_dict(self):
+        return {"name": self.name, "match": self.match, "rules": self.rules}
+
+class SmartPlaylists:
+    """Smart playlists over the library; each track change re-checks only the playlists whose fields it touched"""
+    
+    def __init__(self):
+        self.playlists = {}  # Name -> SmartPlaylist, in definition order
+        self.facts = {}  # File path -> {field: value}
+    
+    def define(self, name, rules, match="all"):
+        """Add or replace a playlist; this is the only time the whole library is scanned"""
+        playlist = SmartPlaylist(name, rules, match)
+        playlist.members = {path for path, facts in self.facts.items() if playlist.predicate(facts)}
+        self.playlists[name] = playlist
+        return playlist
+    
+    def delete(self, name):
+        self.playlists.pop(name, None)
+    
+    def members(self, name):
+        playlist = self.playlists.get(name)
+        return playlist.members if playlist is not None else set()
+    
+    def update(self, file_path, **changes):
+        """Record new facts for a track; returns the names of playlists it joined or left"""
+        facts = self.facts.get(file_path)
+        if facts is None:
+            facts = self.facts[file_path] = blank_facts()
+            changed = set(FIELDS)
+        else:
+            changed = {field for field, value in changes.items() if facts.get(field) != value}
+        facts.update(changes)
+        
+        moved = []
+        for playlist in self.playlists.values():
+            if not playlist.fields & changed:
+                continue
+            member = file_path in playlist.members
+            if playlist.predicate(facts) != member:
+                if member:
+                    playlist.members.discard(file_path)
+                else:
+                    playlist.members.add(file_path)
+                moved.append(playlist.name)
+        return moved
+    
+    def update_metadata(self, file_path, metadata):
+        return self.update(file_path, **facts_from_metadata(metadata))
+    
+    def remove_track(self, file_path):
+        """Forget a track; returns the names of playlists it left"""
+        if self.facts.pop(file_path, None) is None:
+            return []
+        moved = []
+        for playlist in self.playlists.values():
+            if file_path in playlist.members:
+                playlist.members.discard(file_path)
+                moved.append(playlist.name)
+        return moved
+    
+    def rename_track(self, old_path, new_path):
+        """Move a track's facts and memberships to a new path"""
+        facts = self.facts.pop(old_path, None)
+        if facts is None:
+            return
+        self.facts[new_path] = facts
+        for playlist in self.playlists.values():
+            if old_path in playlist.members:
+                playlist.members.discard(old_path)
+                playlist.members.add(new_path)
+    
+    def retain(self, file_paths):
+        """Forget every track not in file_paths"""
+        keep = set(file_paths)
+        for file_path in [path for path in self.facts if path not in keep]:
+            self.remove_track(file_path)
+    
+    def clear_tracks(self):
+        self.facts.clear()
+        for playlist in self.playlists.values():
+            playlist.members.clear()
+    
+    def save_definitions(self, path):
+        """Write the playlist rules"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"smart": [playlist.to_dict() for playlist in self.playlists.values()]}, f, indent=2)
+        os.replace(tmp_path, path)
+    
+    def load_definitions(self, path):
+        """Read playlist rules, or install the defaults when there are none yet"""
+        definitions = DEFAULT_PLAYLISTS
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                definitions = json.load(f).get("smart", [])
+        for definition in definitions:
+            try:
+                self.define(definition["name"], definition["rules"], definition.get("match", "all"))
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Error loading smart playlist {definition.get('name')}: {e}")
+    
+    def save_facts(self, path):
+        """Write the tag facts of every track so a restart can evaluate rules without reading tags"""
+        tag_fields = [field for field in FIELDS if field not in ("plays", "favorite")]
+        rows = {file_path: [facts[field] for field in tag_fields] for file_path, facts in self.facts.items()}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fields": tag_fields, "tracks": rows}, f)
+        os.replace(tmp_path, path)
+    
+    def load_facts(self, path, file_paths):
+        """Restore saved facts for the given tracks, then evaluate every playlist once"""
+        with open(path, "r") as f:
+            saved = json.load(f)
+        fields = saved["fields"]
+        rows = saved["tracks"]
+        for file_path in file_paths:
+            row = rows.get(file_path)
+            if row is not None:
+                facts = blank_facts()
+                facts.update(zip(fields, row))
+                self.facts[file_path] = facts
+        for playlist in self.playlists.values():
+            playlist.members = {path for path, facts in self.facts.items() if playlist.predicate(facts)}
\ No newline at end of file
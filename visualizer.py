@@ -6,8 +6,8 @@ Multiple anime-themed visualization modes with chakra effects
 import numpy as np
 import random
 from PyQt6.QtWidgets import QWidget
-from PyQt6.QtCore import QTimer, Qt
-from PyQt6.QtGui import QPainter, QBrush, QColor, QLinearGradient, QPen, QFont
+from PyQt6.QtCore import QTimer, Qt, QRectF
+from PyQt6.QtGui import QPainter, QBrush, QColor, QLinearGradient, QPen, QFont, QImage
 
 class ChakraVisualizer(QWidget):
     """Advanced anime-themed music visualizer with multiple modes"""
@@ -35,6 +35,26 @@ class ChakraVisualizer(QWidget):
         self.circle_radius = 50
         self.wave_points = 100
         
+        # Beat-driven motion (decays between beats)
+        self.beat_pulse = 0.0
+        self.tomoe_angle = 0.0
+        self.tomoe_spin = 0.0
+        
+        # Spectrogram ring buffer (allocated lazily, reallocated only on resize)
+        self.spectrogram_rows = 128
+        self.spectrogram_ring = None
+        self.spectrogram_image = None
+        self.spectrogram_head = 0
+        self.spectrogram_lut = self.build_spectrogram_lut()
+        self.spectrogram_bin_index = None
+        self.spectrogram_levels = np.empty(self.spectrogram_rows, dtype=np.float32)
+        self.spectrogram_column = np.empty(self.spectrogram_rows, dtype=np.uint8)
+        
+        # Live spectrum analysis (window and band edges cached per block length)
+        self.spectrum_window = None
+        self.spectrum_edges = None
+        self.spectrum = None  # Band levels of the audio playing, None while nothing plays
+        
     def init_chakra_particles(self):
         """Initialize chakra particle system"""
         self.chakra_particles = []
@@ -59,6 +79,44 @@ class ChakraVisualizer(QWidget):
         if data is not None:
             self.audio_data = data
     
+    def update_spectrum(self, samples):
+        """Replace the simulated levels with the spectrum of a block of played audio"""
+        frames = len(samples)
+        if self.spectrum_window is None or len(self.spectrum_window) != frames:
+            self.spectrum_window = np.hanning(frames).astype(np.float32)
+            # Log-spaced bands, at least one FFT bin wide each
+            edges = []
+            for edge in np.geomspace(1, frames // 2, len(self.audio_data) + 1).astype(int):
+                edges.append(max(edge, edges[-1] + 1) if edges else edge)
+            self.spectrum_edges = np.array(edges)
+        
+        magnitude = np.abs(np.fft.rfft(samples.mean(axis=1) * self.spectrum_window))
+        bands = np.maximum.reduceat(magnitude[:self.spectrum_edges[-1]], self.spectrum_edges[:-1])
+        
+        # A full-scale sine peaks near frames / 4; show the 60 dB below that
+        levels = 1.0 + np.log10(bands / (frames / 4) + 1e-6) / 3.0
+        self.spectrum = np.clip(levels, 0.0, 1.0)
+        self.update_audio_data(self.spectrum)
+    
+    def clear_spectrum(self):
+        """Playback stopped: the spectrogram scrolls on in silence"""
+        self.spectrum = None
+    
+    def on_beat(self, strength=1.0):
+        """React to a detected beat: pulse bars, spin tomoe, burst particles"""
+        strength = float(strength)
+        self.beat_pulse = max(self.beat_pulse, strength)
+        self.tomoe_spin += 0.4 * strength
+        
+        # Push every particle outwards from the centre and refresh it
+        for particle in self.chakra_particles:
+            dx = particle['x'] - 0.5
+            dy = particle['y'] - 0.5
+            distance = max(np.hypot(dx, dy), 0.01)
+            particle['vx'] = dx / distance * 0.03 * strength
+            particle['vy'] = dy / distance * 0.03 * strength
+            particle['life'] = 1.0
+    
     def paintEvent(self, event):
         """Main painting method"""
         painter = QPainter(self)
@@ -70,6 +128,11 @@ class ChakraVisualizer(QWidget):
         # Update time
         self.time += 0.05
         
+        # Let the beat energy fade between beats
+        self.beat_pulse *= 0.85
+        self.tomoe_spin *= 0.9
+        self.tomoe_angle += 0.05 + self.tomoe_spin
+        
         # Choose visualization method based on mode
         if self.mode == "chakra_bars":
             self.draw_chakra_bars(painter, width, height)
@@ -81,6 +144,8 @@ class ChakraVisualizer(QWidget):
             self.draw_dragon_flames(painter, width, height)
         elif self.mode == "particle_system":
             self.draw_particle_system(painter, width, height)
+        elif self.mode == "chakra_spectrogram":
+            self.draw_chakra_spectrogram(painter, width, height)
         else:
             self.draw_chakra_bars(painter, width, height)  # Default fallback
     
@@ -104,7 +169,7 @@ class ChakraVisualizer(QWidget):
             base_height = self.audio_data[data_index] if data_index < len(self.audio_data) else 0.3
             
             # Animate bar height
-            animated_height = base_height + 0.2 * np.sin(self.time + i * 0.3)
+            animated_height = base_height + 0.2 * np.sin(self.time + i * 0.3) + 0.3 * self.beat_pulse
             animated_height = max(0.1, min(1.0, animated_height))
             
             x = i * bar_width
@@ -137,7 +202,7 @@ class ChakraVisualizer(QWidget):
         # Draw multiple concentric circles
         for i in range(5):
             radius = max_radius * (i + 1) / 5
-            animated_radius = radius + 10 * np.sin(self.time + i)
+            animated_radius = radius + 10 * np.sin(self.time + i) + 15 * self.beat_pulse
             
             # Circle gradient
             gradient = QLinearGradient(
@@ -159,7 +224,7 @@ class ChakraVisualizer(QWidget):
         
         # Draw tomoe (curved shapes)
         for i in range(3):
-            angle = self.time + i * 2 * np.pi / 3
+            angle = self.tomoe_angle + i * 2 * np.pi / 3
             tomoe_x = center_x + int(max_radius * 0.7 * np.cos(angle))
             tomoe_y = center_y + int(max_radius * 0.7 * np.sin(angle))
             
@@ -248,6 +313,69 @@ class ChakraVisualizer(QWidget):
             painter.setBrush(QBrush(color))
             painter.drawEllipse(x - size/2, y - size/2, size, size)
     
+    def build_spectrogram_lut(self):
+        """Build a 256-entry chakra colour map as packed 0xAARRGGBB values"""
+        # Black -> purple -> orange red -> gold -> white, like the chakra bars
+        stops = np.array([0.0, 0.35, 0.65, 0.9, 1.0])
+        reds = np.array([0, 128, 255, 255, 255])
+        greens = np.array([0, 0, 69, 215, 255])
+        blues = np.array([0, 128, 0, 0, 255])
+        
+        levels = np.linspace(0.0, 1.0, 256)
+        r = np.interp(levels, stops, reds).astype(np.uint32)
+        g = np.interp(levels, stops, greens).astype(np.uint32)
+        b = np.interp(levels, stops, blues).astype(np.uint32)
+        return (0xFF000000 | (r << 16) | (g << 8) | b).astype(np.uint32)
+    
+    def ensure_spectrogram_buffer(self, width):
+        """Allocate the ring buffer and its QImage view for the given width"""
+        width = max(1, width)
+        if self.spectrogram_ring is not None and self.spectrogram_ring.shape[1] == width:
+            return
+        
+        # One column per pixel of history; the QImage wraps the array memory directly
+        self.spectrogram_ring = np.empty((self.spectrogram_rows, width), dtype=np.uint32)
+        self.spectrogram_ring.fill(self.spectrogram_lut[0])
+        self.spectrogram_image = QImage(self.spectrogram_ring.data, width, self.spectrogram_rows,
+                                        width * 4, QImage.Format.Format_RGB32)
+        self.spectrogram_head = 0
+    
+    def push_spectrogram_column(self):
+        """Colour-map the live spectrum into the column at the ring head (silence when nothing plays)"""
+        levels = self.spectrogram_levels
+        if self.spectrum is None:
+            levels.fill(0.0)
+        else:
+            data_len = len(self.spectrum)
+            if self.spectrogram_bin_index is None or self.spectrogram_bin_index[-1] >= data_len:
+                rows = np.arange(self.spectrogram_rows)
+                self.spectrogram_bin_index = rows * data_len // self.spectrogram_rows
+            np.take(self.spectrum, self.spectrogram_bin_index, out=levels)
+        levels *= 255.0
+        np.copyto(self.spectrogram_column, levels, casting='unsafe')
+        
+        # Row 0 is the top of the image, so low frequencies are written bottom-up
+        column = self.spectrogram_ring[::-1, self.spectrogram_head]
+        np.take(self.spectrogram_lut, self.spectrogram_column, out=column, mode='clip')
+        self.spectrogram_head = (self.spectrogram_head + 1) % self.spectrogram_ring.shape[1]
+    
+    def draw_chakra_spectrogram(self, painter, width, height):
+        """Draw a scrolling chakra spectrogram backed by a ring buffer"""
+        self.ensure_spectrogram_buffer(width)
+        self.push_spectrogram_column()
+        
+        # The oldest column sits at the head; draw [head:] then [:head]
+        columns = self.spectrogram_ring.shape[1]
+        head = self.spectrogram_head
+        rows = self.spectrogram_rows
+        older = columns - head
+        
+        painter.drawImage(QRectF(0, 0, older, height), self.spectrogram_image,
+                          QRectF(head, 0, older, rows))
+        if head:
+            painter.drawImage(QRectF(older, 0, head, height), self.spectrogram_image,
+                              QRectF(0, 0, head, rows))
+    
     def update_particles(self, width, height):
         """Update particle positions and properties"""
         for particle in self.chakra_particles:
@@ -295,7 +423,8 @@ class VisualizerModeSelector(QWidget):
             ("👁️ Sharingan Circle", "sharingan_circle"),
             ("🌊 Chakra Waves", "chakra_waves"),
             ("🐉 Dragon Flames", "dragon_flames"),
-            ("✨ Particle System", "particle_system")
+            ("✨ Particle System", "particle_system"),
+            ("📜 Chakra Spectrogram", "chakra_spectrogram")
         ]
         
         for mode_name, mode_id in modes:
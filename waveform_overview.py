@@ -0,0 +1,227 @@
+"""
+Waveform Overview for ChakraBeats
+Computes, caches and draws per-track min/max/RMS peak overviews for the seek bar
+"""
+
+import os
+from collections import OrderedDict
+import numpy as np
+from PyQt6.QtWidgets import QSlider, QStyle, QStyleOptionSlider
+from PyQt6.QtCore import Qt, QLineF, pyqtSignal
+from PyQt6.QtGui import QPainter, QPen, QColor, QRegion
+
+import config
+from audio_decoder import open_pcm_stream
+from scheduler import ScheduledWorker, PRIORITY_PLAYING
+
+# Overviews kept in memory for instant repeat plays
+MEMORY_CACHE_SIZE = 256
+
+class WaveformOverview:
+    """Quantised min/max/RMS envelope of a track at a fixed number of bins"""
+    
+    def __init__(self, minimum, maximum, rms):
+        # int8 peaks scaled by 127, uint8 RMS scaled by 255
+        self.minimum = minimum
+        self.maximum = maximum
+        self.rms = rms
+    
+    def __len__(self):
+        return len(self.minimum)
+    
+    @classmethod
+    def compute(cls, file_path, bins=config.WAVEFORM_BINS):
+        """Compute an overview in a single streaming decode pass"""
+        with open_pcm_stream(file_path) as stream:
+            total = stream.frames
+            bins = max(1, min(bins, total))
+            edges = np.arange(bins + 1, dtype=np.int64) * total // bins
+            
+            lows = np.ones(bins, dtype=np.float32)
+            highs = -np.ones(bins, dtype=np.float32)
+            power = np.zeros(bins, dtype=np.float64)
+            
+            start = 0
+            for block in stream.blocks():
+                block = block[:total - start]
+                if len(block) == 0:
+                    break
+                end = start + len(block)
+                
+                # Bins touched by this block and where each one starts inside it
+                first = np.searchsorted(edges, start, side='right') - 1
+                last = np.searchsorted(edges, end - 1, side='right') - 1
+                offsets = np.concatenate(([0], edges[first + 1:last + 1] - start))
+                
+                touched = slice(first, last + 1)
+                np.minimum(lows[touched], np.minimum.reduceat(block.min(axis=1), offsets), out=lows[touched])
+                np.maximum(highs[touched], np.maximum.reduceat(block.max(axis=1), offsets), out=highs[touched])
+                power[touched] += np.add.reduceat(np.square(block).mean(axis=1), offsets)
+                start = end
+        
+        # Bins never reached (short decode) stay silent
+        unreached = lows > highs
+        lows[unreached] = 0.0
+        highs[unreached] = 0.0
+        rms = np.sqrt(power / np.maximum(np.diff(edges), 1))
+        
+        return cls(np.round(np.clip(lows, -1.0, 1.0) * 127).astype(np.int8),
+                   np.round(np.clip(highs, -1.0, 1.0) * 127).astype(np.int8),
+                   np.round(np.clip(rms, 0.0, 1.0) * 255).astype(np.uint8))
+    
+    def save(self, path):
+        """Write the overview as three packed byte planes"""
+        tmp_path = path + ".tmp"
+        np.concatenate((self.minimum, self.maximum, self.rms.view(np.int8))).tofile(tmp_path)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path):
+        """Load an overview written by save()"""
+        planes = np.fromfile(path, dtype=np.int8).reshape(3, -1)
+        return cls(planes[0], planes[1], planes[2].view(np.uint8))
+    
+    def columns(self, count):
+        """Reduce the overview to count columns of (min, max, rms) floats"""
+        count = max(1, min(count, len(self)))
+        starts = np.arange(count, dtype=np.int64) * len(self) // count
+        lows = np.minimum.reduceat(self.minimum, starts) / 127.0
+        highs = np.maximum.reduceat(self.maximum, starts) / 127.0
+        rms = np.maximum.reduceat(self.rms, starts) / 255.0
+        return lows, highs, rms
+
+class WaveformCache:
+    """Two-level overview cache: an in-memory LRU in front of files on disk"""
+    
+    def __init__(self):
+        self.overviews = OrderedDict()
+    
+    def get(self, file_path):
+        """Return a cached overview or None if it still has to be computed"""
+        overview = self.overviews.get(file_path)
+        if overview is not None:
+            self.overviews.move_to_end(file_path)
+            return overview
+        
+        try:
+            cache_path = config.get_track_cache_path("waveforms", file_path, ".wfm")
+            if not os.path.exists(cache_path):
+                return None
+            overview = WaveformOverview.load(cache_path)
+        except (OSError, ValueError):
+            return None
+        
+        self._remember(file_path, overview)
+        return overview
+    
+    def store(self, file_path, overview):
+        """Keep an overview in memory and persist it to disk"""
+        self._remember(file_path, overview)
+        try:
+            overview.save(config.get_track_cache_path("waveforms", file_path, ".wfm"))
+        except OSError as e:
+            print(f"Error saving waveform overview for {file_path}: {e}")
+    
+    def _remember(self, file_path, overview):
+        self.overviews[file_path] = overview
+        self.overviews.move_to_end(file_path)
+        while len(self.overviews) > MEMORY_CACHE_SIZE:
+            self.overviews.popitem(last=False)
+
+class WaveformAnalysisThread(ScheduledWorker):
+    """Background worker that has the scheduler compute missing overviews"""
+    
+    overview_ready = pyqtSignal(str)
+    
+    def __init__(self, cache, scheduler, parent=None):
+        super().__init__(scheduler, parent)
+        self.cache = cache
+    
+    def request(self, file_path, priority=PRIORITY_PLAYING):
+        """Queue a track for analysis unless it is already queued"""
+        self.enqueue([file_path], priority)
+    
+    def start_job(self, file_path, priority):
+        if self.cache.get(file_path) is not None:
+            self.overview_ready.emit(file_path)
+            return None
+        return self.scheduler.submit(WaveformOverview.compute, file_path, priority=priority)
+    
+    def job_done(self, file_path, future, priority):
+        try:
+            self.cache.store(file_path, future.result())
+            self.overview_ready.emit(file_path)
+        except Exception as e:
+            print(f"Error computing waveform for {file_path}: {e}")
+
+class WaveformSeekBar(QSlider):
+    """Seek bar that draws the track's waveform overview behind the handle"""
+    
+    def __init__(self, parent=None):
+        super().__init__(Qt.Orientation.Horizontal, parent)
+        self.setMinimumHeight(40)
+        self.overview = None
+        self.peak_lines = None
+        self.rms_lines = None
+        self.played_color = QColor("#FFD700")
+        self.remaining_color = QColor("#FFA500")
+    
+    def set_overview(self, overview):
+        """Show a new overview (or None to clear the waveform)"""
+        self.overview = overview
+        self.peak_lines = None
+        self.update()
+    
+    def set_colors(self, played, remaining):
+        """Set the colours for the played and remaining parts of the track"""
+        self.played_color = QColor(played)
+        self.remaining_color = QColor(remaining)
+        self.update()
+    
+    def resizeEvent(self, event):
+        self.peak_lines = None
+        super().resizeEvent(event)
+    
+    def build_lines(self):
+        """Precompute one vertical line per pixel column for the current size"""
+        width = self.width()
+        middle = self.height() / 2
+        scale = middle - 2
+        lows, highs, rms = self.overview.columns(width)
+        step = width / len(lows)
+        
+        self.peak_lines = [QLineF(i * step, middle - highs[i] * scale, i * step, middle - lows[i] * scale)
+                           for i in range(len(lows))]
+        self.rms_lines = [QLineF(i * step, middle - rms[i] * scale, i * step, middle + rms[i] * scale)
+                          for i in range(len(lows))]
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.overview is None or len(self.overview) == 0:
+            return
+        
+        if self.peak_lines is None:
+            self.build_lines()
+        
+        # Split the columns at the playback position
+        span = self.maximum() - self.minimum()
+        fraction = (self.value() - self.minimum()) / span if span > 0 else 0.0
+        split = int(fraction * len(self.peak_lines))
+        
+        # Over the groove but around the handle, which stays on top
+        option = QStyleOptionSlider()
+        self.initStyleOption(option)
+        handle = self.style().subControlRect(QStyle.ComplexControl.CC_Slider, option,
+                                             QStyle.SubControl.SC_SliderHandle, self)
+        painter = QPainter(self)
+        painter.setClipRegion(QRegion(self.rect()).subtracted(QRegion(handle)))
+        for lines, alpha in ((self.peak_lines, 110), (self.rms_lines, 200)):
+            played = QColor(self.played_color)
+            played.setAlpha(alpha)
+            remaining = QColor(self.remaining_color)
+            remaining.setAlpha(alpha // 2)
+            
+            painter.setPen(QPen(played, 1))
+            painter.drawLines(lines[:split])
+            painter.setPen(QPen(remaining, 1))
+            painter.drawLines(lines[split:])
\ No newline at end of file